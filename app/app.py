@@ -1,38 +1,198 @@
+import time
+_run_started = time.perf_counter()
+
 import os
+import sys
 import numpy as np
-import joblib
 import streamlit as st
 import streamlit.components.v1 as components
 from dotenv import load_dotenv
 from asteroid_profiles import get_asteroid_data
+from content import ABOUT_HTML, FOOTER_HTML, INTRO_HTML, RISK_CONCLUSIONS, RISK_PHYSICS_INTERPRETATION
+
+# The inference pipeline lives in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from instrumentation import REGISTRY
+
 
 load_dotenv()
 DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+# "surface" answers the Live Risk Prediction tab from the precomputed risk surface
+RISK_INFERENCE_MODE = os.getenv("RISK_INFERENCE_MODE", "model")
+# Same defaults as src/pipeline.py and src/risk_surface.py, read here so those
+# modules (and sklearn/scipy behind them) are only imported when the model loads
+PIPELINE_PATH = os.getenv("PIPELINE_PATH", "models/risk_pipeline.pkl")
+COMPILED_PIPELINE_PATH = os.getenv("COMPILED_PIPELINE_PATH", "models/risk_pipeline_compiled")
+RISK_SURFACE_PATH = os.getenv("RISK_SURFACE_PATH", "models/risk_surface.npz")
+# Catalog panels read the snapshot published by `python src/refresher.py --loop`; opt in to
+# refreshing it from the app process instead, and separately to fetching NeoWs from there
+APP_BACKGROUND_REFRESH = os.getenv("APP_BACKGROUND_REFRESH", "0") == "1"
+APP_REFRESH_FETCH = os.getenv("APP_REFRESH_FETCH", "0") == "1"
+CATALOG_TABLE_COLUMNS = {
+    "name": "Name",
+    "approach_date": "Close approach",
+    "miss_distance_km": "Miss distance (km)",
+    "velocity_km_s": "Velocity (km/s)",
+    "avg_diameter_km": "Avg diameter (km)",
+    "risk_category": "Predicted risk",
+}
+# Monte Carlo samples behind the optional uncertainty view of the Live Risk Prediction tab
+APP_UNCERTAINTY_SAMPLES = int(os.getenv("APP_UNCERTAINTY_SAMPLES", "1000"))
+# Diagnostics panel: always on with APP_DIAGNOSTICS=1, otherwise opened with ?diagnostics=1
+APP_DIAGNOSTICS = os.getenv("APP_DIAGNOSTICS", "0") == "1"
+
+def artifact_signature(path: str):
+    """
+    (mtime, size) of a model artifact; a compiled export is tracked by its metadata file.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "pipeline.json")
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_resource(max_entries=1, show_spinner="Loading risk model...")
+def load_inference(pipeline_path: str, surface_path: str, signature):
+    """
+    Load the pipeline (and risk surface) once per process.
+
+    `signature` is part of the cache key, so replacing an artifact on disk
+    loads the new one on the next rerun and evicts the old one.
+    """
+    started = time.perf_counter()
+    REGISTRY.increment("app_cache_misses", cache="inference")
+    from pipeline import load_pipeline
+    from risk_surface import RiskSurface
+
+    # Load inference pipeline (fitted scaler + model)
+    pipeline = load_pipeline(pipeline_path)
+
+    # Load risk surface, only if it was built from this exact pipeline
+    risk_surface = None
+    if surface_path and os.path.exists(surface_path):
+        risk_surface = RiskSurface.load(surface_path)
+        if risk_surface.metadata.get("schema_hash") != pipeline.schema_hash:
+            risk_surface = None
+    print(f"⏱️ Risk model loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return pipeline, risk_surface
+
+@st.cache_resource
+def load_asteroid_profiles() -> list:
+    REGISTRY.increment("app_cache_misses", cache="profiles")
+    return get_asteroid_data()
+
+@st.cache_resource(show_spinner=False)
+def get_refresher():
+    """
+    One background refresher per server process, shared by every session.
+    """
+    from refresher import Refresher
+    return Refresher(fetch=APP_REFRESH_FETCH).start()
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_published_snapshot(snapshot_path: str, signature):
+    """
+    The snapshot on disk; `signature` reloads it once the refresher publishes a new one.
+    """
+    REGISTRY.increment("app_cache_misses", cache="snapshot")
+    from refresher import load_snapshot
+    return load_snapshot(snapshot_path)
+
+def get_snapshot():
+    """
+    Latest dashboard snapshot; never waits on a refresh (None until the first one exists).
+    """
+    if APP_BACKGROUND_REFRESH:
+        return get_refresher().snapshot(block=False)
+    from refresher import SNAPSHOT_PATH
+    REGISTRY.increment("app_cache_lookups", cache="snapshot")
+    signature = artifact_signature(SNAPSHOT_PATH)
+    return load_published_snapshot(SNAPSHOT_PATH, signature) if signature is not None else None
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_explainer(model_hash: str, _pipeline):
+    """
+    Tree-path explainer for the loaded model version (its answers are memoized too).
+    """
+    REGISTRY.increment("app_cache_misses", cache="explainer")
+    from explain import Explainer
+    return Explainer(_pipeline)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def risk_uncertainty(model_hash: str, velocity_km_s: float, absolute_magnitude_h: float,
+                     avg_diameter_km: float, _pipeline) -> dict:
+    """
+    Monte Carlo risk spread for one input, memoized per model version and input
+    (the sampling is seeded, so a rerun would give the same answer).
+    """
+    REGISTRY.increment("app_cache_misses", cache="uncertainty")
+    import pandas as pd
+    from uncertainty import score_uncertainty
+    started = time.perf_counter()
+    spread = score_uncertainty(
+        pd.DataFrame({"velocity_km_s": [velocity_km_s], "absolute_magnitude_h": [absolute_magnitude_h],
+                      "avg_diameter_km": [avg_diameter_km]}),
+        _pipeline, n_samples=APP_UNCERTAINTY_SAMPLES,
+    ).iloc[0]
+    REGISTRY.observe("app_uncertainty_ms", (time.perf_counter() - started) * 1000)
+    return spread.to_dict()
+
+@st.cache_data(max_entries=1, ttl=600, show_spinner=False)
+def load_permutation_importance(model_hash: str):
+    """
+    Newest cached permutation importance for the model version. Re-read every
+    few minutes, so importance computed after the app started still shows up.
+    """
+    REGISTRY.increment("app_cache_misses", cache="importance")
+    from explain import load_importance
+    return load_importance(model_hash)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_object_history(history_path: str, signature):
+    """
+    Memory-mapped object history; `signature` reloads it after an ingest rewrites it.
+    """
+    REGISTRY.increment("app_cache_misses", cache="history")
+    from object_history import ObjectHistory
+    return ObjectHistory.load(history_path)
+
+def get_object_history():
+    from object_history import OBJECT_HISTORY_PATH
+    signature = artifact_signature(os.path.join(OBJECT_HISTORY_PATH, "history.json"))
+    if signature is None:
+        return None
+    REGISTRY.increment("app_cache_lookups", cache="history")
+    return load_object_history(OBJECT_HISTORY_PATH, signature)
+
+def catalog_table(df):
+    return df[list(CATALOG_TABLE_COLUMNS)].rename(columns=CATALOG_TABLE_COLUMNS)
 
-# Load model
-model = joblib.load("models/rf_risk_model.pkl")
+def get_inference():
+    # Prefer the compiled export when it exists
+    pipeline_path = COMPILED_PIPELINE_PATH if os.path.isdir(COMPILED_PIPELINE_PATH) else PIPELINE_PATH
+    surface_path = RISK_SURFACE_PATH if RISK_INFERENCE_MODE == "surface" else None
+    signature = (artifact_signature(pipeline_path), surface_path and artifact_signature(surface_path))
+    REGISTRY.increment("app_cache_lookups", cache="inference")
+    return load_inference(pipeline_path, surface_path, signature)
+
+def cache_hit_rate(cache: str):
+    if cache == "snapshot" and APP_BACKGROUND_REFRESH:
+        # Stale snapshots are served immediately too, so they count as hits
+        counts = {dict(labels)["result"]: n for labels, n in REGISTRY.counters_by_label("cache_requests").items()
+                  if dict(labels)["cache"] == cache}
+        total = sum(counts.values())
+        return (counts.get("hit", 0) + counts.get("stale", 0)) / total if total else None
+    lookups = REGISTRY.counter("app_cache_lookups", cache=cache)
+    if not lookups:
+        return None
+    return 1 - REGISTRY.counter("app_cache_misses", cache=cache) / lookups
 
 # Page settings
 st.set_page_config(page_title="Deep Impact: Asteroid Risk Predictor", layout="wide", page_icon="☄️")
 st.title("🌎 Deep Impact: Asteroid Risk Intelligence Dashboard")
-st.markdown(
-    """
-    <div style='
-        background-color: #161b22;
-        padding: 20px;
-        border-radius: 10px;
-        border-left: 5px solid #4FC3F7;
-        font-size: 16px;
-        line-height: 1.6;
-        color: #dddddd;
-    '>  
-    <strong>Welcome to Deep Impact</strong> — a machine learning powered dashboard for analyzing the potential threat posed by asteroids.
-    This tool estimates a kinetic-energy–based risk score using user-provided inputs such as velocity, absolute magnitude, and diameter — simulating the projected impact effects of an asteroid assuming a direct Earth-bound trajectory. The model leverages real-world asteroid data, applies physics-based impact estimations, and uses a trained Random Forest regressor to classify the object into intuitive threat levels ranging from negligible to highly hazardous.
-    Use the form below to experiment with hypothetical asteroid scenarios and explore how their impact profiles compare to those of real NEOs monitored by NASA. ☄️🛰️
-
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(INTRO_HTML, unsafe_allow_html=True)
 
 st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
 
@@ -56,56 +216,26 @@ with tab1:
     velocity_kms = velocity_mps / 1000
     diameter_km = diameter_m / 1000
 
-    # Calculate kinetic energy (proportional proxy)
-    kinetic_energy = (diameter_km ** 3) * (velocity_kms ** 2)
-
-    # Manual scaling
-    def scale(val, min_val, max_val):
-        return (val - min_val) / (max_val - min_val)
-
-    features_scaled = np.array([
-        scale(velocity_kms, 0, 40),
-        scale(magnitude, 10, 35),
-        scale(diameter_km, 0.01, 1.0),
-        scale(kinetic_energy, 0, 100)
-    ]).reshape(1, -1)
+    # Inputs are on screen before the (first-run) model load
+    pipeline, risk_surface = get_inference()
+    from pipeline import interpret_risk
 
-    # Predict risk
-    log_risk_score = model.predict(features_scaled)[0]
+    # Predict risk (kinetic energy and scaling are derived inside the pipeline)
+    predict_started = time.perf_counter()
+    surface_spread = None
+    if risk_surface is not None and risk_surface.contains(velocity_kms, magnitude, diameter_km):
+        log_risk_score, surface_spread = risk_surface.query(velocity_kms, magnitude, diameter_km)
+    else:
+        log_risk_score = pipeline.predict_one(velocity_kms, magnitude, diameter_km)
+    REGISTRY.observe("app_predict_ms", (time.perf_counter() - predict_started) * 1000,
+                     path="model" if surface_spread is None else "surface")
     predicted_risk = np.expm1(log_risk_score)
 
-    # Interpret risk
-    def interpret_risk(score):
-        if score < 1e-5:
-            return "🟢 Very Low"
-        elif score < 1e-3:
-            return "🟡 Low"
-        elif score < 1e-2:
-            return "🟠 Elevated"
-        else:
-            return "🔴 High"
-
     risk_category = interpret_risk(predicted_risk)
 
-    # Risk-specific closing line
-    risk_conclusions = {
-        "🟢 Very Low": "This means the object lacks sufficient mass and velocity to pose any credible danger, even in the event of an Earth-crossing orbit.",
-        "🟡 Low": "This means the object is relatively harmless under most scenarios, but should still be observed in case of future orbital shifts or Earth resonance.",
-        "🟠 Elevated": "This means the object could become hazardous under the right conditions — such as a shallow atmospheric entry angle or a trajectory leading toward densely populated areas.",
-        "🔴 High": "This means that if the object were on a collision course with Earth, it would likely retain enough energy to cause widespread devastation upon impact, especially in vulnerable regions."
-    }
-
-    # Custom risk-specific interpretation line
-    risk_physics_interpretation = {
-        "🟢 Very Low": "Given its relatively low velocity and small diameter, this asteroid would likely be unable to penetrate the Earth's atmosphere. It would lose most of its energy to atmospheric drag and disintegrate at high altitudes, posing minimal risk to ground-level infrastructure or life.",
-        "🟡 Low": "With modest size and velocity, this asteroid may partially survive atmospheric entry, but would likely fragment at high altitudes due to thermal stress and pressure differences. While it could produce a small airburst or sonic boom, the likelihood of ground impact or substantial damage remains very low.",
-        "🟠 Elevated": "Due to its larger size and kinetic energy, this asteroid could survive atmospheric entry, especially if composed of dense materials like metal or rock. Upon entry, it might decelerate but remain intact enough to reach the ground, causing localized impact effects such as shockwaves, crater formation, or structural damage in populated zones. Its threat potential increases significantly if its entry angle is shallow or its trajectory intersects urban regions.",
-        "🔴 High": "This asteroid possesses substantial mass and velocity, making it capable of withstanding intense aerodynamic heating during atmospheric entry. Its kinetic energy would be largely retained upon descent, allowing it to impact the Earth's surface with catastrophic force. Depending on the location and composition, it could lead to regional-scale destruction, including shockwaves, thermal radiation, fires, and long-lasting environmental effects."
-    }
-
     # Combine everything into the final interpretation
-    risk_summary_line = risk_conclusions[risk_category]
-    risk_interpretation = risk_physics_interpretation[risk_category]
+    risk_summary_line = RISK_CONCLUSIONS[risk_category]
+    risk_interpretation = RISK_PHYSICS_INTERPRETATION[risk_category]
 
     # Physics-based explanation
     interpretation = f"""
@@ -122,6 +252,40 @@ with tab1:
     with right:
         st.subheader("🔭 Risk Assessment")
         st.markdown(interpretation)
+        if surface_spread is not None:
+            st.caption(f"Interpolated from the precomputed risk surface (corner-spread estimate of the log risk "
+                       f"error {surface_spread:.2e}; largest error measured at build time "
+                       f"{risk_surface.metadata.get('max_abs_error', float('nan')):.2e}).")
+
+        if st.checkbox("Show uncertainty", help="Sample the diameter across the range NeoWs gives for "
+                                                "this size (albedo 0.05–0.25) and score every sample."):
+            from uncertainty import EXCEEDANCE_COLUMNS, diameter_range_from_average
+            REGISTRY.increment("app_cache_lookups", cache="uncertainty")
+            spread = risk_uncertainty(pipeline.schema_hash, velocity_kms, magnitude, diameter_km, pipeline)
+            st.markdown(f"**90% interval:** {spread['risk_p5']:.8f} – {spread['risk_p95']:.8f} "
+                        f"(median {spread['risk_p50']:.8f})")
+            prob_cols = st.columns(len(EXCEEDANCE_COLUMNS))
+            for col, (threshold, column) in zip(prob_cols, EXCEEDANCE_COLUMNS.items()):
+                label = column.removeprefix("prob_").replace("_", " ").capitalize()
+                col.metric(label, f"{spread[column]:.0%}", help=f"Probability that the risk score is at least {threshold:g}")
+            diameter_min, diameter_max = diameter_range_from_average(diameter_m)
+            st.caption(f"{APP_UNCERTAINTY_SAMPLES:,} samples, diameter log-uniform between "
+                       f"{diameter_min:,.0f} and {diameter_max:,.0f} m.")
+
+        with st.expander("🧭 Why this score?"):
+            import pandas as pd
+            REGISTRY.increment("app_cache_lookups", cache="explainer")
+            explanation = load_explainer(pipeline.schema_hash, pipeline).explain_one(velocity_kms, magnitude, diameter_km)
+            contributions = pd.Series(explanation["contributions"], name="Contribution to log risk")
+            st.bar_chart(contributions, horizontal=True)
+            st.caption(f"How much the splits on each feature moved this prediction from the forest's base "
+                       f"value {explanation['bias']:.3e}; together they add up to the predicted log risk "
+                       f"{explanation['log_risk']:.3e}.")
+            importance = load_permutation_importance(pipeline.schema_hash)
+            if importance is not None:
+                st.markdown("**Across the catalog** (increase in error when each feature is shuffled):")
+                st.bar_chart(pd.Series({f: v["mean"] for f, v in importance["features"].items()},
+                                       name="Permutation importance"), horizontal=True)
 
     st.markdown("---")
     
@@ -131,7 +295,56 @@ with tab1:
 
 
 with tab2:
-    asteroid_data = get_asteroid_data()
+    # Catalog tables come from the precomputed snapshot, so rendering does no data work
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        st.markdown("### 📋 From the Approach Catalog")
+        summary = snapshot.summary
+        cols = st.columns(3)
+        cols[0].metric("Approaches in catalog", f"{summary['approaches']:,}")
+        cols[1].metric(f"Objects in the last {summary['recent_days']} days", f"{summary['recent_objects']:,}")
+        cols[2].metric("Closest recent pass (km)",
+                       f"{summary['closest_recent_km']:,.0f}" if summary["closest_recent_km"] is not None else "–")
+        days = st.select_slider("Look-ahead window (days)", options=list(snapshot.closest), value=30)
+        left, right = st.columns(2)
+        with left:
+            st.markdown(f"**Closest approaches in the next {days} days**")
+            upcoming = snapshot.closest[days]
+            if len(upcoming):
+                st.dataframe(catalog_table(upcoming.head(5)), hide_index=True)
+            else:
+                st.caption(f"No approaches in the catalog for the next {days} days "
+                           f"(latest: {snapshot.high_water}).")
+        with right:
+            st.markdown("**Highest predicted risk in the catalog**")
+            st.dataframe(catalog_table(snapshot.top_risk.head(5)), hide_index=True)
+        st.caption(f"Snapshot built {snapshot.created_at} (data through {snapshot.high_water}).")
+        st.markdown("---")
+
+    history = get_object_history()
+    if history is not None:
+        st.markdown("### 🔎 Object History")
+        object_id = st.text_input("NeoWs object id", placeholder="e.g. 3542519")
+        if object_id.strip():
+            summary = history.summary(int(object_id)) if object_id.strip().isdigit() else None
+            if summary is None:
+                st.caption(f"No recorded approaches for object {object_id.strip()}.")
+            else:
+                cols = st.columns(4)
+                cols[0].metric("Recorded approaches", f"{summary['approaches']:,}")
+                cols[1].metric("Closest miss (km)", f"{summary['min_miss_distance_km']:,.0f}",
+                               help=f"On {summary['min_miss_date']}")
+                cols[2].metric("Velocity trend (km/s per year)", f"{summary['velocity_trend_km_s_per_year']:+.3f}")
+                cols[3].metric("Days since last approach", f"{summary['days_since_last_approach']:,}")
+                st.caption(f"First approach {summary['first_approach']}, last {summary['last_approach']}.")
+                approaches = history.approaches_of(summary["id"])
+                if len(approaches) > 1:
+                    st.line_chart(approaches.set_index("approach_date")["miss_distance_km"], y_label="Miss distance (km)")
+                st.dataframe(approaches, hide_index=True)
+        st.markdown("---")
+
+    REGISTRY.increment("app_cache_lookups", cache="profiles")
+    asteroid_data = load_asteroid_profiles()
     for i, asteroid in enumerate(asteroid_data):
         col1, col2 = st.columns(2)
 
@@ -154,31 +367,33 @@ with tab2:
 
 with tab3:
     st.markdown("### 🌌 About the Project")
-    st.markdown(
-        """
-        <div style='
-            text-align: justify;
-            padding-right: 30px;
-            font-size: 16px;
-            line-height: 1.7;
-            color: #dddddd;
-        '>
-        <strong>Deep Impact</strong> is an interactive machine learning dashboard that models, simulates, and classifies the potential threat posed by Near-Earth Objects (NEOs), including asteroids whose orbits bring them into close proximity with Earth. The project integrates astrophysical modeling, data science techniques, and supervised machine learning methods to create a scientifically grounded, interpretable risk estimation platform. It uses real-world observational data sourced from NASA’s Near-Earth Object database, focusing on key features such as encounter velocity, estimated diameter from optical reflectivity measurements, and absolute magnitude as an indicator of intrinsic brightness. These parameters are selected for their direct physical relevance to impact outcomes, where kinetic energy serves as a critical determinant of destructive potential. Feature engineering refines the raw measurements by averaging minimum and maximum diameter estimates, standardizing all inputs to promote stable model learning, and emphasizing velocity given its quadratic influence on energy release. Deep Impact applies a Random Forest Regressor to predict a kinetic energy–based risk score for each simulated object, translating continuous outputs into discrete hazard levels calibrated against historical asteroid impact events including the Tunguska (1908) and Chelyabinsk (2013) incidents. The platform bridges physics-based reasoning with machine learning predictions to offer accessible yet rigorous risk assessments.
-        <br><br>
-        Model development emphasizes scientific accuracy, physical interpretability, and predictive robustness. The Random Forest model is selected for its ensemble-based approach, which captures complex, non-linear relationships between asteroid characteristics while resisting overfitting through variance reduction across decision trees. A logarithmic transformation of kinetic energy is employed as the target variable to accommodate the broad dynamic range of impact energies, from minor airbursts to globally significant collisions. Hyperparameter tuning is conducted via grid search and k-fold cross-validation, optimizing model parameters such as maximum tree depth, minimum samples per split, and the number of estimators to achieve a balance between model complexity and generalization ability. Evaluation using metrics such as the coefficient of determination (R²), mean absolute error (MAE), and root mean squared error (RMSE) confirms the model’s high predictive accuracy and stable behavior across validation sets. Feature importance analysis aligns with theoretical kinetic energy relationships, highlighting velocity as the dominant predictor, followed by diameter, both of which critically affect mass and energy calculations. Absolute magnitude provides secondary predictive value by constraining uncertainty in size estimation, especially for objects with incomplete observational profiles.
-        <br><br>
-        The dashboard, developed using the Streamlit framework, enables users to explore a wide range of hypothetical asteroid impact scenarios by adjusting physical input parameters and observing real-time updates to predicted kinetic energy outputs and hazard classifications. Through dynamic user interaction, the system illustrates fundamental astrophysical principles such as the sensitivity of impact severity to small changes in velocity and mass, reinforcing concepts like the quadratic velocity dependence of kinetic energy. Deep Impact demonstrates how machine learning models, when informed by domain-specific physics, can serve as effective, scalable tools for preliminary planetary defense analyses. The platform provides an accessible interface that bridges detailed scientific modeling with public understanding, offering users insight into the mechanisms driving asteroid impact threats. Future extensions of the project aim to incorporate additional orbital parameters such as eccentricity and inclination, material composition proxies, and probabilistic uncertainty modeling to refine risk predictions further and contribute to the ongoing development of space hazard assessment technologies. 🚀🌍
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(ABOUT_HTML, unsafe_allow_html=True)
 
 # Footer
-st.markdown(
-    """
-    <hr style="border: 1px solid #3E4145; margin-top: 50px; margin-bottom: 10px;">
-    <div style='text-align: center; font-size: 15px; color: #888888;'>
-        Made with ❤️ by <strong>Arbina Gotame</strong> | Deep Impact
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
+
+# Hidden diagnostics panel (live numbers for this server process)
+if APP_DIAGNOSTICS or st.query_params.get("diagnostics") == "1":
+    with st.expander("🩺 Diagnostics", expanded=True):
+        cols = st.columns(4)
+        for col, path in zip(cols[:2], ["model", "surface"]):
+            stats = REGISTRY.percentiles("app_predict_ms", path=path)
+            col.metric(f"Predict latency ({path}), p50", f"{stats['p50']:.2f} ms" if stats else "–",
+                       help=f"p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms over "
+                            f"{stats['count']} requests" if stats else None)
+        for col, cache in zip(cols[2:], ["inference", "snapshot"]):
+            rate = cache_hit_rate(cache)
+            col.metric(f"{cache.title()} cache hit rate", f"{rate:.1%}" if rate is not None else "–")
+        if risk_surface is not None:
+            memo = risk_surface.query.cache_info()
+            st.caption(f"Risk surface memo: {memo.hits} hits / {memo.misses} misses ({memo.currsize} entries)")
+        runs = REGISTRY.percentiles("app_run_ms")
+        if runs:
+            st.caption(f"Script runs: p50 {runs['p50']:.1f} ms, p95 {runs['p95']:.1f} ms over {runs['count']} runs")
+        st.code(REGISTRY.prometheus_text(), language="text")
+
+# Script run timing (first run includes model load; later runs are widget reruns)
+run_ms = (time.perf_counter() - _run_started) * 1000
+st.session_state.setdefault("run_timings_ms", []).append(run_ms)
+REGISTRY.observe("app_run_ms", run_ms)
+print(f"⏱️ App run {len(st.session_state['run_timings_ms'])}: {run_ms:.1f} ms")
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+
+BENCHMARK_DIR = os.getenv("BENCHMARK_DIR", "reports/benchmarks")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+# Stages that hold a whole dataset in memory, or are slow per row, run on at most this many rows
+IN_MEMORY_MAX_ROWS = 1_000_000
+INGEST_MAX_ROWS = 200_000
+TRAIN_MAX_ROWS = 200_000
+TRAIN_PARAMS = {"n_estimators": 50, "max_depth": 20, "min_samples_leaf": 2, "random_state": 0}
+LATENCY_CALLS = 300
+SYNTHETIC_CHUNK_ROWS = 500_000
+
+# Metric name suffix → whether a larger value is better
+HIGHER_IS_BETTER = {"rows_per_s": True, "seconds": False, "ms": False}
+
+def synthetic_frames(n_rows: int, chunk_rows: int = SYNTHETIC_CHUNK_ROWS, seed: int = 0):
+    """
+    Yield flattened NeoWs-shaped DataFrames (the columns flatten_neo_data returns)
+    totalling `n_rows` rows, with ~2000 approaches per day going back from today.
+    """
+    rng = np.random.default_rng(seed)
+    first_day = np.datetime64(date.today() - timedelta(days=n_rows // 2000 + 1))
+    for offset in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - offset)
+        ids = rng.integers(2_000_000, 2_060_000, n)
+        magnitude = rng.uniform(14.0, 30.0, n).astype(np.float32)
+        diameter_min = (1329.0 / np.sqrt(0.25) * 10 ** (-magnitude / 5)).astype(np.float32)
+        miss_distance = (rng.uniform(0.001, 0.5, n) * 149_597_870.7).astype(np.float32)
+        yield pd.DataFrame({
+            "name": pd.array(ids.astype(str), dtype="string"),
+            "id": ids,
+            "absolute_magnitude_h": magnitude,
+            "is_hazardous": pd.Categorical(
+                (magnitude <= 22) & (miss_distance <= 7_479_893.5), categories=[False, True]),
+            "diameter_min_km": diameter_min,
+            "diameter_max_km": diameter_min * np.float32(np.sqrt(5)),
+            "velocity_km_s": rng.lognormal(np.log(12.0), 0.5, n).astype(np.float32),
+            "miss_distance_km": miss_distance,
+            "approach_date": first_day + (np.arange(offset, offset + n) // 2000).astype("timedelta64[D]"),
+        })
+
+def timed(fn, repeat: int = 1):
+    """
+    Best wall time of `repeat` calls to fn(), and the last result.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def throughput(results: dict, stage: str, rows: int, seconds: float):
+    results[f"{stage}/seconds"] = seconds
+    results[f"{stage}/rows_per_s"] = rows / max(seconds, 1e-9)
+    print(f"⏱️ {stage:<24} {rows:>12,} rows {seconds:>9.3f}s {rows / max(seconds, 1e-9):>14,.0f} rows/s")
+
+def latency(results: dict, stage: str, fn, calls: int = LATENCY_CALLS):
+    fn()  # warm-up (lazy loads, caches)
+    samples = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        samples[i] = (time.perf_counter() - start) * 1000
+    for q in (50, 95, 99):
+        results[f"{stage}/p{q}_ms"] = float(np.percentile(samples, q))
+    print(f"⏱️ {stage:<24} p50 {results[f'{stage}/p50_ms']:.3f} ms, "
+          f"p95 {results[f'{stage}/p95_ms']:.3f} ms, p99 {results[f'{stage}/p99_ms']:.3f} ms")
+
+def bench_ingest(results: dict, n_rows: int, workdir: str):
+    import data_utils
+    from feed_server import SyntheticFeed, serve
+
+    days = max(1, n_rows // 2000)
+    server = serve(SyntheticFeed(objects_per_day=min(n_rows, 2000)), background=True, quota=10**9)
+    data_utils.API_URL = server.url  # fetch_neo_data reads the feed URL from this module global
+    start = date.today() - timedelta(days=days - 1)
+    windows = [(start + timedelta(days=d), min(start + timedelta(days=d + 6), date.today()))
+               for d in range(0, days, 7)]
+    try:
+        seconds, stats = timed(lambda: data_utils.stream_to_dataset(
+            (raw for _, _, raw, _ in data_utils.fetch_windows(windows)),
+            os.path.join(workdir, f"ingest_{time.monotonic_ns()}")))
+    finally:
+        server.shutdown()
+        server.server_close()
+    throughput(results, "ingest", stats["rows"], seconds)
+
+def bench_flatten(results: dict, n_rows: int, repeat: int):
+    from data_utils import FLATTEN_BATCH_ROWS, NeoColumnBuffer
+    from feed_server import SyntheticFeed
+
+    # One synthetic week, flattened repeatedly, so payload memory stays bounded at any scale
+    feed = SyntheticFeed(objects_per_day=2000)
+    week = {"near_earth_objects": {str(d): feed.day(d) for d in
+                                   (date(2024, 1, 1) + timedelta(days=i) for i in range(7))}}
+    week_rows = 7 * 2000
+
+    def flatten():
+        buffer = NeoColumnBuffer()
+        for _ in range(max(1, n_rows // week_rows)):
+            buffer.extend(week)
+            if len(buffer) >= FLATTEN_BATCH_ROWS:
+                buffer.to_table()
+                buffer.clear()
+        buffer.to_table()
+        return buffer.stats["rows"]
+
+    seconds, rows = timed(flatten, repeat)
+    throughput(results, "flatten", rows, seconds)
+
+def bench_storage(results: dict, n_rows: int, raw_path: str, repeat: int):
+    from storage import iter_batches, read_dataset, write_dataset_batches
+
+    generation = 0.0
+
+    def frames():
+        nonlocal generation
+        chunks = synthetic_frames(n_rows)
+        while True:
+            start = time.perf_counter()
+            frame = next(chunks, None)
+            generation += time.perf_counter() - start
+            if frame is None:
+                return
+            yield frame
+
+    start = time.perf_counter()
+    write_dataset_batches(frames(), raw_path)
+    throughput(results, "storage_write", n_rows, time.perf_counter() - start - generation)
+
+    columns = ["diameter_min_km", "diameter_max_km", "velocity_km_s", "absolute_magnitude_h", "miss_distance_km"]
+    seconds, rows = timed(lambda: sum(len(c) for c in iter_batches(raw_path, columns=columns)), repeat)
+    throughput(results, "storage_read_projected", rows, seconds)
+    if n_rows <= IN_MEMORY_MAX_ROWS:
+        seconds, df = timed(lambda: read_dataset(raw_path), repeat)
+        throughput(results, "storage_read_full", len(df), seconds)
+        return df
+    return None
+
+def bench_features(results: dict, df, n_rows: int, raw_path: str, processed_path: str, repeat: int):
+    from feature_engineering import generate_risk_features, generate_risk_features_out_of_core
+
+    if df is not None:
+        seconds, _ = timed(lambda: generate_risk_features(df), repeat)
+        throughput(results, "features_in_memory", len(df), seconds)
+    seconds, scaler = timed(lambda: generate_risk_features_out_of_core(raw_path, processed_path))
+    throughput(results, "features_out_of_core", n_rows, seconds)
+    return scaler
+
+def bench_training(results: dict, scaler, processed_path: str, workdir: str, n_jobs: int):
+    from sklearn.ensemble import RandomForestRegressor
+    from model import feature_cols
+    from pipeline import RiskPipeline, export_compiled, load_compiled, save_pipeline
+    from storage import iter_batches
+
+    parts, rows = [], 0
+    for chunk in iter_batches(processed_path, columns=feature_cols + ["log_risk_score"]):
+        parts.append(chunk.iloc[:TRAIN_MAX_ROWS - rows])
+        rows += len(parts[-1])
+        if rows >= TRAIN_MAX_ROWS:
+            break
+    train = pd.concat(parts, ignore_index=True)
+    X, y = train[feature_cols].to_numpy(), train["log_risk_score"].to_numpy()
+
+    model = RandomForestRegressor(n_jobs=n_jobs, **TRAIN_PARAMS)
+    seconds, _ = timed(lambda: model.fit(X, y))
+    throughput(results, "train_forest", len(X), seconds)
+
+    pipeline = RiskPipeline(scaler=scaler, model=model)
+    pipeline_path = os.path.join(workdir, "risk_pipeline.pkl")
+    compiled_path = os.path.join(workdir, "risk_pipeline_compiled")
+    save_pipeline(pipeline, pipeline_path)
+    export_compiled(pipeline, compiled_path)
+    return pipeline, load_compiled(compiled_path), pipeline_path
+
+def bench_predict(results: dict, pipeline, compiled):
+    from risk_surface import build_risk_surface
+
+    rng = np.random.default_rng(0)
+    inputs = np.column_stack([rng.uniform(0, 50, LATENCY_CALLS), rng.uniform(10, 35, LATENCY_CALLS),
+                              10 ** rng.uniform(-2, np.log10(2), LATENCY_CALLS)])
+    latency(results, "predict_one_sklearn", lambda i=0: pipeline.predict_one(*inputs[i]))
+    latency(results, "predict_one_compiled", lambda i=0: compiled.predict_one(*inputs[i]))
+    surface = build_risk_surface(pipeline)
+    # _query bypasses the memo, so every call pays for the interpolation
+    latency(results, "risk_surface_query", lambda i=0: surface._query(*inputs[i]))
+
+def bench_scoring(results: dict, n_rows: int, raw_path: str, workdir: str, pipeline_path: str, workers: int):
+    from score import score_catalog
+
+    seconds, rows = timed(lambda: score_catalog(raw_path, os.path.join(workdir, "scores"),
+                                                pipeline_path, workers=workers))
+    throughput(results, "batch_score", rows, seconds)
+
+def run_scale(scale: str, workdir: str, stages: list, workers: int, n_jobs: int) -> dict:
+    n_rows = SCALES[scale]
+    repeat = 3 if n_rows <= 100_000 else 1
+    raw_path = os.path.join(workdir, "neo_data")
+    processed_path = os.path.join(workdir, "neo_features")
+    results = {}
+    print(f"📏 Scale {scale} ({n_rows:,} approaches)")
+
+    if "ingest" in stages:
+        bench_ingest(results, min(n_rows, INGEST_MAX_ROWS), workdir)
+    if "flatten" in stages:
+        bench_flatten(results, n_rows, repeat)
+    # Storage, features and training build the datasets and model the later stages use
+    if {"storage", "features", "train", "predict", "score"} & set(stages):
+        df = bench_storage(results, n_rows, raw_path, repeat)
+        scaler = bench_features(results, df, n_rows, raw_path, processed_path, repeat)
+        del df
+        if {"train", "predict", "score"} & set(stages):
+            pipeline, compiled, pipeline_path = bench_training(results, scaler, processed_path, workdir, n_jobs)
+            if "predict" in stages:
+                bench_predict(results, pipeline, compiled)
+            if "score" in stages:
+                bench_scoring(results, n_rows, raw_path, workdir, pipeline_path, workers)
+    return {f"{scale}/{name}": value for name, value in results.items()}
+
+def environment() -> dict:
+    import sklearn
+    import pyarrow
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "pyarrow": pyarrow.__version__,
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare metrics with a baseline run. Returns the metrics that regressed by
+    more than `tolerance` (relative), in the direction that is worse for each metric.
+    """
+    regressions = []
+    print(f"{'metric':<44} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, value in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        higher_is_better = next(v for suffix, v in HIGHER_IS_BETTER.items() if name.endswith(suffix))
+        change = (value - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "❌" if worse > tolerance else "✅"
+        print(f"{name:<44} {before:>14,.3f} {value:>14,.3f} {change:>+7.1%} {flag}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, features, training and inference.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["10k", "1m"])
+    parser.add_argument("--stages", nargs="+", default=["ingest", "flatten", "storage", "features", "train",
+                                                        "predict", "score"],
+                        choices=["ingest", "flatten", "storage", "features", "train", "predict", "score"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Batch scoring processes")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Forest training jobs")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a temporary one)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        workdir = tempfile.mkdtemp(prefix=f"neo_bench_{scale}_", dir=args.workdir)
+        try:
+            results.update(run_scale(scale, workdir, args.stages, args.workers, args.n_jobs))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    run = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "results": results,
+    }
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    run_path = os.path.join(BENCHMARK_DIR, f"run_{run['created_at'].replace(':', '')}.json")
+    with open(run_path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"✅ Results saved to {run_path}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("cpu_count") != run["environment"]["cpu_count"]:
+            print("⚠️ Baseline was recorded on a machine with a different CPU count")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
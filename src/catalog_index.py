@@ -0,0 +1,316 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from pipeline import PIPELINE_PATH, interpret_risk_array, load_pipeline
+from storage import dataset_exists, iter_batches, read_dataset, replacing
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+CATALOG_INDEX_PATH = os.getenv("CATALOG_INDEX_PATH", f"{DATA_PATH_PROCESSED}/catalog_index")
+
+COLUMNS = ["id", "name", "approach_date", "miss_distance_km", "predicted_log_risk_score",
+           "velocity_km_s", "avg_diameter_km"]
+OPTIONAL_COLUMNS = ["velocity_km_s", "avg_diameter_km"]
+# Indexed field → column it is sorted by ("risk" is sorted descending)
+INDEXED = {"approach_date": "approach_date", "miss_distance_km": "miss_distance_km",
+           "risk": "predicted_log_risk_score"}
+# Compact once this fraction of stored rows has been replaced by upserts
+COMPACT_DEAD_FRACTION = 0.25
+
+def _day(value) -> np.int64:
+    return np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64)
+
+def _row_keys(ids: np.ndarray, days: np.ndarray) -> np.ndarray:
+    # (id, approach_date) packed into one sortable int64; days are offset to stay positive
+    return ids.astype(np.int64) * 2 ** 17 + (days.astype(np.int64) + 2 ** 16)
+
+class CatalogIndex:
+    """
+    Scored approach catalog with sorted indexes on approach_date, miss_distance_km
+    and predicted risk.
+
+    Each index is a sorted copy of its key plus the row numbers in that order,
+    so a range on an indexed field is two binary searches and a slice. Queries
+    over several fields start from the narrowest slice and filter the rest, and
+    top-K/closest-N partition only the rows in range. `add` upserts new rows by
+    (id, approach_date) and merges them into the sorted arrays without
+    re-sorting; replaced rows drop out of the indexes and are reclaimed by
+    `compact`. Arrays are saved as .npy files and can be memory-mapped.
+    `model_hash` is the schema hash of the pipeline that scored every row, or
+    None when that is not known (an index built from a scored dataset).
+    """
+    def __init__(self, columns: dict, alive: np.ndarray, keys: np.ndarray, key_rows: np.ndarray,
+                 indexes: dict, model_hash: str = None):
+        self.columns = columns
+        self.alive = alive
+        self.keys = keys
+        self.key_rows = key_rows
+        self.indexes = indexes
+        self.model_hash = model_hash
+
+    @staticmethod
+    def _frame_columns(df: pd.DataFrame) -> dict:
+        missing = [c for c in COLUMNS if c not in df.columns and c not in OPTIONAL_COLUMNS]
+        if missing:
+            raise ValueError(f"Missing columns for catalog index: {missing}")
+        n = len(df)
+        return {
+            "id": df["id"].to_numpy(np.int64),
+            "name": df["name"].astype(str).to_numpy(str),
+            "approach_date": pd.to_datetime(df["approach_date"]).to_numpy("datetime64[D]").astype(np.int64),
+            "miss_distance_km": df["miss_distance_km"].to_numpy(np.float64),
+            "predicted_log_risk_score": df["predicted_log_risk_score"].to_numpy(np.float64),
+            **{c: df[c].to_numpy(np.float64) if c in df.columns else np.full(n, np.nan)
+               for c in OPTIONAL_COLUMNS},
+        }
+
+    @staticmethod
+    def _sort_key(field: str, columns: dict) -> np.ndarray:
+        values = columns[INDEXED[field]]
+        return -values if field == "risk" else values
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "CatalogIndex":
+        df = df.drop_duplicates(subset=["id", "approach_date"], keep="last")
+        columns = cls._frame_columns(df)
+        keys = _row_keys(columns["id"], columns["approach_date"])
+        key_order = np.argsort(keys, kind="stable")
+        indexes = {}
+        for field in INDEXED:
+            sort_key = cls._sort_key(field, columns)
+            order = np.argsort(sort_key, kind="stable")
+            indexes[field] = (sort_key[order], order.astype(np.int64))
+        return cls(columns, np.ones(len(df), dtype=bool), keys[key_order], key_order.astype(np.int64), indexes)
+
+    def __len__(self) -> int:
+        return len(self.key_rows)
+
+    @property
+    def n_dead(self) -> int:
+        return len(self.alive) - len(self)
+
+    def high_water(self):
+        """
+        Latest approach date in the index, or None if it is empty.
+        """
+        dates = self.indexes["approach_date"][0]
+        return pd.Timestamp(np.datetime64(int(dates[-1]), "D")).date() if len(dates) else None
+
+    def add(self, df: pd.DataFrame) -> dict:
+        """
+        Upsert scored rows by (id, approach_date).
+
+        New rows are sorted on their own and merged into every index, which costs
+        one pass over the index arrays instead of a full re-sort. That pass is
+        O(index size) whatever the batch size, so add rows in few large batches.
+        """
+        df = df.drop_duplicates(subset=["id", "approach_date"], keep="last")
+        new = self._frame_columns(df)
+        new_keys = _row_keys(new["id"], new["approach_date"])
+
+        # Existing rows with the same key are replaced
+        pos = np.searchsorted(self.keys, new_keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == new_keys[found]
+        replaced = self.key_rows[pos[found]]
+        if len(replaced):
+            self.alive = self.alive.copy()
+            self.alive[replaced] = False
+            keep = np.ones(len(self.keys), dtype=bool)
+            keep[pos[found]] = False
+            self.keys, self.key_rows = self.keys[keep], self.key_rows[keep]
+            for field, (sorted_key, rows) in self.indexes.items():
+                keep = self.alive[rows]
+                self.indexes[field] = (sorted_key[keep], rows[keep])
+
+        first_row = len(self.alive)
+        new_rows = np.arange(first_row, first_row + len(df), dtype=np.int64)
+        self.columns = {c: np.concatenate([self.columns[c], new[c]]) for c in self.columns}
+        self.alive = np.concatenate([self.alive, np.ones(len(df), dtype=bool)])
+
+        order = np.argsort(new_keys, kind="stable")
+        at = np.searchsorted(self.keys, new_keys[order])
+        self.keys = np.insert(self.keys, at, new_keys[order])
+        self.key_rows = np.insert(self.key_rows, at, new_rows[order])
+        for field, (sorted_key, rows) in self.indexes.items():
+            sort_key = self._sort_key(field, new)
+            order = np.argsort(sort_key, kind="stable")
+            at = np.searchsorted(sorted_key, sort_key[order], side="right")
+            self.indexes[field] = (np.insert(sorted_key, at, sort_key[order]), np.insert(rows, at, new_rows[order]))
+
+        if self.n_dead > COMPACT_DEAD_FRACTION * len(self.alive):
+            self.compact()
+        return {"inserted": len(df) - len(replaced), "replaced": len(replaced)}
+
+    def compact(self):
+        """
+        Drop replaced rows from the column arrays and renumber the indexes.
+        """
+        renumber = np.cumsum(self.alive) - 1
+        self.columns = {c: values[self.alive] for c, values in self.columns.items()}
+        self.key_rows = renumber[self.key_rows]
+        self.indexes = {field: (sorted_key, renumber[rows]) for field, (sorted_key, rows) in self.indexes.items()}
+        self.alive = np.ones(len(self.key_rows), dtype=bool)
+
+    def _range_rows(self, field: str, low=None, high=None) -> np.ndarray:
+        sorted_key, rows = self.indexes[field]
+        if field == "risk":
+            # Stored negated (descending risk), so the bounds swap
+            low, high = (None if high is None else -high), (None if low is None else -low)
+        start = 0 if low is None else np.searchsorted(sorted_key, low, side="left")
+        stop = len(sorted_key) if high is None else np.searchsorted(sorted_key, high, side="right")
+        return rows[start:stop]
+
+    def _bounds(self, field: str, bounds):
+        low, high = bounds
+        if field == "approach_date":
+            low = None if low is None else _day(low)
+            high = None if high is None else _day(high)
+        return low, high
+
+    def query_rows(self, **ranges) -> np.ndarray:
+        """
+        Row numbers matching every inclusive (low, high) range, e.g.
+        query_rows(approach_date=("2024-01-01", "2024-01-31"), miss_distance_km=(None, 1e6)).
+        Rows come back in the order of the narrowest index used.
+        """
+        ranges = {field: self._bounds(field, bounds) for field, bounds in ranges.items() if bounds is not None}
+        if not ranges:
+            return self.indexes["approach_date"][1]
+        # The slice sizes are known from the binary searches alone, so start from the narrowest
+        candidates = {field: self._range_rows(field, *bounds) for field, bounds in ranges.items()}
+        field = min(candidates, key=lambda f: len(candidates[f]))
+        rows = candidates.pop(field)
+        for other, (low, high) in ranges.items():
+            if other == field:
+                continue
+            values = self.columns[INDEXED[other]][rows]
+            mask = np.ones(len(rows), dtype=bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            rows = rows[mask]
+        return rows
+
+    def frame(self, rows: np.ndarray) -> pd.DataFrame:
+        df = pd.DataFrame({c: np.asarray(values[rows]) for c, values in self.columns.items()})
+        df["approach_date"] = df["approach_date"].astype("datetime64[D]").astype("datetime64[s]")
+        df["predicted_risk_score"] = np.expm1(df["predicted_log_risk_score"])
+        df["risk_category"] = interpret_risk_array(df["predicted_risk_score"])
+        return df
+
+    def query(self, approach_date=None, miss_distance_km=None, risk=None, limit: int = None) -> pd.DataFrame:
+        rows = self.query_rows(approach_date=approach_date, miss_distance_km=miss_distance_km, risk=risk)
+        return self.frame(rows[:limit] if limit else rows)
+
+    @staticmethod
+    def _smallest(rows: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+        # values are aligned with rows; partition first so only n values get sorted
+        if len(rows) > n:
+            keep = np.argpartition(values, n - 1)[:n]
+            rows, values = rows[keep], values[keep]
+        return rows[np.argsort(values, kind="stable")]
+
+    def closest(self, n: int = 5, days: int = 30, start=None) -> pd.DataFrame:
+        """
+        The `n` closest approaches in the `days` days from `start` (default: today).
+        """
+        start = pd.Timestamp(start or date.today()).date()
+        rows = self.query_rows(approach_date=(start, start + timedelta(days=days)))
+        return self.frame(self._smallest(rows, self.columns["miss_distance_km"][rows], n))
+
+    def top_risk(self, k: int = 5, approach_date=None, miss_distance_km=None) -> pd.DataFrame:
+        """
+        The `k` approaches with the highest predicted risk, optionally within ranges.
+        """
+        if approach_date is None and miss_distance_km is None:
+            return self.frame(self.indexes["risk"][1][:k])
+        rows = self.query_rows(approach_date=approach_date, miss_distance_km=miss_distance_km)
+        return self.frame(self._smallest(rows, -self.columns["predicted_log_risk_score"][rows], k))
+
+    def save(self, path: str = CATALOG_INDEX_PATH):
+        if self.n_dead:
+            self.compact()
+        os.makedirs(path, exist_ok=True)
+        arrays = {f"column_{c}": values for c, values in self.columns.items()}
+        arrays.update(keys=self.keys, key_rows=self.key_rows)
+        for field, (sorted_key, rows) in self.indexes.items():
+            arrays[f"index_{field}_key"], arrays[f"index_{field}_rows"] = sorted_key, rows
+        # Renamed into place, so processes that memory-mapped the old files keep reading them
+        for name, values in arrays.items():
+            with replacing(os.path.join(path, f"{name}.npy")) as tmp_path:
+                np.save(tmp_path, values)
+        # Written last, so index.json only ever describes complete arrays
+        with replacing(os.path.join(path, "index.json")) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"rows": len(self), "high_water": str(self.high_water()), "model_hash": self.model_hash,
+                       "columns": list(self.columns), "indexes": list(self.indexes)}, f, indent=2)
+        print(f"✅ Catalog index ({len(self):,} approaches) saved to {path}")
+
+    @classmethod
+    def load(cls, path: str = CATALOG_INDEX_PATH, mmap: bool = True) -> "CatalogIndex":
+        with open(os.path.join(path, "index.json")) as f:
+            meta = json.load(f)
+
+        def array(name):
+            return np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None))
+
+        columns = {c: array(f"column_{c}") for c in meta["columns"]}
+        indexes = {field: (array(f"index_{field}_key"), array(f"index_{field}_rows")) for field in meta["indexes"]}
+        return cls(columns, np.ones(meta["rows"], dtype=bool), array("keys"), array("key_rows"), indexes,
+                   meta.get("model_hash"))
+
+def build_catalog_index(scores_path: str) -> CatalogIndex:
+    """
+    Build the index from a scored dataset written by score.py.
+    """
+    return CatalogIndex.from_frame(read_dataset(scores_path))
+
+def update_catalog_index(index: CatalogIndex, raw_path: str, pipeline, since) -> dict:
+    """
+    Score raw approaches on or after `since` with the pipeline and upsert them into the index.
+
+    An index scored by another model version (or an unknown one) is rescored in
+    full, whatever `since` is. Chunks are scored one at a time but merged into
+    the index in a single add.
+    """
+    rescore_all = index.model_hash != pipeline.schema_hash
+    filters = None if rescore_all else [("approach_date", ">=", pd.Timestamp(since).date())]
+    scored = [pipeline.score(chunk).filter(items=COLUMNS) for chunk in iter_batches(raw_path, filters=filters)]
+    index.model_hash = pipeline.schema_hash
+    if not scored:
+        return {"inserted": 0, "replaced": 0, "rescored_all": rescore_all}
+    return {**index.add(pd.concat(scored, ignore_index=True)), "rescored_all": rescore_all}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the indexed approach catalog.")
+    parser.add_argument("command", choices=["build", "update"])
+    parser.add_argument("--scores", default=f"{DATA_PATH_PROCESSED}/neo_scores",
+                        help="Scored dataset to build from (output of score.py)")
+    parser.add_argument("--raw", default=f"{DATA_PATH_RAW}/neo_data", help="Raw dataset to update from")
+    parser.add_argument("--pipeline", default=PIPELINE_PATH)
+    parser.add_argument("--since", help="Rescore approaches from this date (default: a week before the index high-water mark)")
+    parser.add_argument("--index", default=CATALOG_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = None
+    if args.command == "update" and os.path.isdir(args.index):
+        index = CatalogIndex.load(args.index, mmap=False)
+        if not len(index) and not args.since:
+            # No high-water mark to update from
+            index = None
+    if index is None:
+        if not dataset_exists(args.scores):
+            raise SystemExit(f"No scored dataset at {args.scores}; run src/score.py first")
+        index = build_catalog_index(args.scores)
+    else:
+        since = args.since or (index.high_water() - timedelta(days=7))
+        stats = update_catalog_index(index, args.raw, load_pipeline(args.pipeline), since)
+        since = "the start (new model version)" if stats["rescored_all"] else since
+        print(f"✅ {stats['inserted']:,} approaches added, {stats['replaced']:,} rescored since {since}")
+    index.save(args.index)
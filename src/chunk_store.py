@@ -0,0 +1,111 @@
+import os
+import json
+import gzip
+from datetime import date, datetime, timedelta
+
+# Fixed anchor so window boundaries are the same on every run (1900-01-01 is a Monday)
+WINDOW_ANCHOR = date(1900, 1, 1)
+
+def _to_date(value) -> date:
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+class ChunkStore:
+    """
+    On-disk store of fetched NeoWs windows.
+
+    Each successfully fetched window is kept as a gzipped JSON payload, and
+    `manifest.json` records which date ranges are covered and which failed.
+    A rerun only needs to fetch the dates that are not covered yet.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {"windows": {}, "failed": {}, "high_water": None}
+
+    def _write_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _chunk_path(self, start, end) -> str:
+        return os.path.join(self.root, f"neo_{start}_{end}.json.gz")
+
+    def chunks(self) -> list:
+        """
+        Completed (start, end) windows in date order. Both ends are inclusive.
+        """
+        return sorted((_to_date(s), _to_date(e)) for s, e in self.manifest["windows"].items())
+
+    def failed(self) -> dict:
+        return dict(self.manifest["failed"])
+
+    def high_water(self):
+        """
+        Newest date covered by the store, or None if nothing has been fetched yet.
+        """
+        hw = self.manifest.get("high_water")
+        return _to_date(hw) if hw else None
+
+    def missing_windows(self, start, end, days: int = 7, refresh_from=None) -> list:
+        """
+        Windows of at most `days` days covering every date in [start, end] not stored yet.
+
+        Windows are aligned to WINDOW_ANCHOR, so a daily rerun only produces the
+        newest partial window plus any windows that previously failed. Stored
+        windows reaching `refresh_from` or later count as missing, for dates
+        whose data may still change.
+        """
+        start, end = _to_date(start), _to_date(end)
+        chunks = self.chunks()
+        if refresh_from is not None:
+            chunks = [(s, e) for s, e in chunks if e < _to_date(refresh_from)]
+        windows = []
+        day = start
+        for chunk_start, chunk_end in chunks + [(end + timedelta(days=1), end + timedelta(days=1))]:
+            gap_end = min(chunk_start - timedelta(days=1), end)
+            while day <= gap_end:
+                offset = (day - WINDOW_ANCHOR).days % days
+                window_end = min(day + timedelta(days=days - 1 - offset), gap_end)
+                windows.append((day, window_end))
+                day = window_end + timedelta(days=1)
+            day = max(day, chunk_end + timedelta(days=1))
+            if day > end:
+                break
+        return windows
+
+    def save(self, start, end, raw: dict):
+        os.makedirs(self.root, exist_ok=True)
+        start, end = _to_date(start), _to_date(end)
+        # Stored windows this one replaces (a refetch covers whole earlier partial windows)
+        for chunk_start, chunk_end in self.chunks():
+            if start <= chunk_start and chunk_end <= end and (chunk_start, chunk_end) != (start, end):
+                del self.manifest["windows"][str(chunk_start)]
+                if os.path.exists(self._chunk_path(chunk_start, chunk_end)):
+                    os.remove(self._chunk_path(chunk_start, chunk_end))
+        with gzip.open(self._chunk_path(start, end), "wt", encoding="utf-8") as f:
+            json.dump(raw, f)
+        self.manifest["windows"][str(start)] = str(end)
+        self.manifest["failed"].pop(str(start), None)
+        self._update_high_water()
+        self._write_manifest()
+
+    def mark_failed(self, start, end, error):
+        self.manifest["failed"][str(start)] = {"end": str(end), "error": str(error)}
+        self._write_manifest()
+
+    def load(self, start, end) -> dict:
+        with gzip.open(self._chunk_path(start, end), "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _update_high_water(self):
+        self.manifest["high_water"] = str(self.chunks()[-1][1])
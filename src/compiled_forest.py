@@ -0,0 +1,159 @@
+import os
+import json
+import numpy as np
+from storage import replacing
+
+ARRAYS = ["feature", "threshold", "left", "right", "value", "roots"]
+
+class CompiledForest:
+    """
+    A trained tree ensemble flattened into contiguous NumPy node arrays.
+
+    All trees share one set of arrays (feature, threshold, left/right child,
+    leaf value) with `roots` holding each tree's first node. Leaves point to
+    themselves, which is how traversal detects them. Prediction is at most
+    `max_depth` rounds of vectorized indexing over the (row, tree) pairs still
+    inside the trees, with no per-tree Python dispatch and no sklearn input
+    validation. Arrays can be memory-mapped.
+
+    This is aimed at single rows and small batches (the dashboard). For bulk
+    scoring, sklearn's compiled per-row traversal is faster on deep forests.
+    """
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def predict(self, X) -> np.ndarray:
+        # sklearn compares float32 inputs against float64 thresholds; do the same
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+
+        # One traversal per (row, tree) pair, row-major; pairs that reach a leaf drop out
+        leaves = np.tile(self.roots, n_rows)
+        pending = np.arange(leaves.size)
+        node = leaves.copy()
+        row_offset = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+
+        for _ in range(self.max_depth + 1):
+            at_leaf = self.left[node] == node
+            if at_leaf.any():
+                leaves[pending[at_leaf]] = node[at_leaf]
+                keep = ~at_leaf
+                pending, node, row_offset = pending[keep], node[keep], row_offset[keep]
+                if not pending.size:
+                    break
+            go_left = X_flat[row_offset + self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[leaves].reshape(n_rows, self.n_trees).mean(axis=1)
+
+    def attributions(self, X):
+        """
+        Tree-path (Saabas) attribution of each prediction to the input features.
+
+        Every split on the way from root to leaf moves the node value; that change
+        is credited to the split feature and averaged over trees. Returns
+        (bias, contributions): the mean root value and an (n_rows, n_features)
+        array, with bias + contributions.sum(axis=1) equal to predict(X).
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+
+        node = np.tile(self.roots, n_rows)
+        row = np.repeat(np.arange(n_rows), self.n_trees)
+        totals = np.zeros(n_rows * n_features)
+        for _ in range(self.max_depth + 1):
+            inside = self.left[node] != node
+            if not inside.any():
+                break
+            node, row = node[inside], row[inside]
+            feature = self.feature[node]
+            go_left = X_flat[row * n_features + feature] <= self.threshold[node]
+            child = np.where(go_left, self.left[node], self.right[node])
+            totals += np.bincount(row * n_features + feature, weights=self.value[child] - self.value[node],
+                                  minlength=totals.size)
+            node = child
+
+        bias = float(self.value[self.roots].mean())
+        return bias, totals.reshape(n_rows, n_features) / self.n_trees
+
+    def save(self, path: str, metadata: dict = None):
+        """
+        Save as one .npy file per array plus forest.json, so load() can memory-map them.
+
+        Every file is written aside and renamed into place, so a process that has
+        the previous export mapped keeps its arrays intact.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            with replacing(os.path.join(path, f"{name}.npy")) as tmp_path:
+                np.save(tmp_path, getattr(self, name))
+        with replacing(os.path.join(path, "forest.json")) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_trees": self.n_trees,
+                       "n_nodes": self.n_nodes, **(metadata or {})}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompiledForest":
+        with open(os.path.join(path, "forest.json")) as f:
+            meta = json.load(f)
+        # np.asarray strips the np.memmap subclass (whose indexing is slower) but keeps the mapping
+        arrays = {
+            name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None))
+            for name in ARRAYS
+        }
+        return cls(max_depth=meta["max_depth"], **arrays)
+
+def compile_forest(model) -> CompiledForest:
+    """
+    Flatten a fitted sklearn forest regressor (single-output) into a CompiledForest.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own_index = np.arange(offset, offset + n)
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int16))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, own_index, tree.children_left + offset))
+        rights.append(np.where(is_leaf, own_index, tree.children_right + offset))
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    # int32 node indices halve the child arrays unless the forest is enormous
+    index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+    return CompiledForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(index_dtype),
+        right=np.concatenate(rights).astype(index_dtype),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.asarray(roots, dtype=index_dtype),
+        max_depth=max_depth,
+    )
@@ -1,95 +1,415 @@
 import os
+import time
+import random
+import threading
 import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+import pyarrow as pa
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from chunk_store import ChunkStore
+from instrumentation import REGISTRY, serve_metrics_from_env, stage
+from storage import dataset_exists, upsert_dataset
 
 load_dotenv()
 API_KEY = os.getenv("NASA_API_KEY")
 API_URL = os.getenv("NASA_API_URL")
 DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+NEO_KEYS = ["id", "approach_date"]
 
-def fetch_neo_data(start_date: str, end_date: str, api_key: str = API_KEY) -> dict:
+# Ingestion tuning
+FETCH_WORKERS = int(os.getenv("NEO_FETCH_WORKERS", "4"))
+FETCH_RETRIES = int(os.getenv("NEO_FETCH_RETRIES", "5"))
+FETCH_TIMEOUT = float(os.getenv("NEO_FETCH_TIMEOUT", "30"))
+# The newest days are still being revised by NeoWs, so windows covering them are always fetched again
+REFETCH_DAYS = int(os.getenv("NEO_REFETCH_DAYS", "3"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+FLATTEN_BATCH_ROWS = int(os.getenv("NEO_FLATTEN_BATCH_ROWS", "100000"))
+# Keep the per-object history (src/object_history.py) in step with each ingest
+UPDATE_OBJECT_HISTORY = os.getenv("UPDATE_OBJECT_HISTORY", "1") == "1"
+
+_thread_local = threading.local()
+
+def get_session() -> requests.Session:
+    """
+    Return a keep-alive session for the calling thread, so each worker reuses its connection.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _thread_local.session = session
+    return session
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter for the given retry attempt (0-based).
+    """
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class RateLimiter:
+    """
+    Throttle shared by all fetch workers, adapted from the API's X-RateLimit-* headers.
+
+    Requests go out at full speed while plenty of quota is left. Once the remaining
+    quota drops below `low_water` of the limit, the remaining calls are spread over
+    the API's rolling one-hour window. A 429 pauses every worker for Retry-After.
+    """
+    def __init__(self, window_s: float = 3600.0, low_water: float = 0.1):
+        self.window_s = window_s
+        self.low_water = low_water
+        self.interval = 0.0
+        self.next_allowed = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_allowed)
+            self.next_allowed = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def update(self, headers):
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        if limit is None or remaining is None:
+            return
+        limit, remaining = int(limit), int(remaining)
+        with self.lock:
+            if remaining <= self.low_water * limit:
+                self.interval = self.window_s / max(remaining, 1)
+            else:
+                self.interval = 0.0
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.next_allowed = max(self.next_allowed, time.monotonic() + seconds)
+
+def _retry_after(response) -> float:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def fetch_neo_data(start_date: str, end_date: str, api_key: str = API_KEY,
+                   session: requests.Session = None, limiter: RateLimiter = None,
+                   max_retries: int = FETCH_RETRIES) -> dict:
     """
     Fetch Near-Earth Object data from NASA's NeoWs API between two dates.
+
+    Transient failures (connection errors, timeouts, 429 and 5xx) are retried with
+    jittered exponential backoff, honouring Retry-After when the API sends it.
     """
     params = {
         "start_date": start_date,
         "end_date": end_date,
         "api_key": api_key
     }
-    response = requests.get(API_URL, params=params)
-    response.raise_for_status()
-    return response.json()
+    session = session or get_session()
+
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.wait()
+        started = time.perf_counter()
+        try:
+            response = session.get(API_URL, params=params, timeout=FETCH_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            REGISTRY.increment("http_requests", status=type(e).__name__)
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        REGISTRY.observe("http_request_ms", (time.perf_counter() - started) * 1000)
+        REGISTRY.increment("http_requests", status=response.status_code)
+
+        if limiter:
+            limiter.update(response.headers)
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            delay = _retry_after(response) or backoff_delay(attempt)
+            if response.status_code == 429 and limiter:
+                limiter.pause(delay)
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response.json()
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MS_PER_DAY = 86_400_000
+
+def _optional_float(value) -> float:
+    return float("nan") if value is None else float(value)
+
+class NeoColumnBuffer:
+    """
+    Column-oriented buffer that NeoWs payloads are flattened into.
+
+    Values are appended straight into typed arrays (float32 measurements, int64
+    ids, date64 approach dates, int8 hazard codes) instead of building one dict
+    per asteroid. Malformed entries are counted in `stats` rather than printed.
+    """
+    FLOAT_COLS = ["absolute_magnitude_h", "diameter_min_km", "diameter_max_km",
+                  "velocity_km_s", "miss_distance_km"]
+    COLUMNS = ["name", "id", "absolute_magnitude_h", "is_hazardous", "diameter_min_km",
+               "diameter_max_km", "velocity_km_s", "miss_distance_km", "approach_date"]
+
+    def __init__(self):
+        self.stats = {"rows": 0, "malformed": 0, "errors": {}}
+        self._date_cache = {}
+        self.clear()
+
+    def clear(self):
+        """
+        Drop buffered rows (after a flush). Stats keep accumulating.
+        """
+        self.names = []
+        self.ids = array("q")
+        self.floats = {col: array("f") for col in self.FLOAT_COLS}
+        self.hazard = array("b")
+        self.dates = array("q")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _date_ms(self, value: str) -> int:
+        ms = self._date_cache.get(value)
+        if ms is None:
+            ms = (date.fromisoformat(value).toordinal() - _EPOCH_ORDINAL) * _MS_PER_DAY
+            self._date_cache[value] = ms
+        return ms
+
+    def append(self, asteroid: dict):
+        """
+        Append one row per close approach of an asteroid entry (the feed lists the
+        approach on that date; lookups list all of them). Returns the number of rows.
+        Raises if the entry is malformed, leaving the buffer unchanged.
+        """
+        approaches = asteroid.get("close_approach_data") or [{}]
+        diameter_data = asteroid.get("estimated_diameter", {}).get("kilometers", {})
+
+        # Parse everything before appending so a bad entry never leaves ragged columns
+        magnitude = _optional_float(asteroid.get("absolute_magnitude_h"))
+        diameter_min = _optional_float(diameter_data.get("estimated_diameter_min"))
+        diameter_max = _optional_float(diameter_data.get("estimated_diameter_max"))
+        rows = [
+            ((magnitude, diameter_min, diameter_max,
+              float(approach.get("relative_velocity", {}).get("kilometers_per_second", 0.0)),
+              float(approach.get("miss_distance", {}).get("kilometers", 0.0))),
+             self._date_ms(approach["close_approach_date"]))
+            for approach in approaches
+        ]
+        asteroid_id = int(asteroid["id"])
+        hazardous = asteroid.get("is_potentially_hazardous_asteroid")
+        name = asteroid.get("name")
+        hazard = -1 if hazardous is None else int(bool(hazardous))
+
+        for values, approach_ms in rows:
+            self.names.append(name)
+            self.ids.append(asteroid_id)
+            for col, value in zip(self.FLOAT_COLS, values):
+                self.floats[col].append(value)
+            self.hazard.append(hazard)
+            self.dates.append(approach_ms)
+        return len(rows)
+
+    def extend(self, raw_json: dict):
+        """
+        Append every asteroid in a NeoWs feed payload, counting malformed entries.
+        """
+        for asteroid_list in raw_json.get("near_earth_objects", {}).values():
+            for asteroid in asteroid_list:
+                try:
+                    self.stats["rows"] += self.append(asteroid)
+                except Exception as e:
+                    self.stats["malformed"] += 1
+                    errors = self.stats["errors"]
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    def to_table(self) -> pa.Table:
+        hazard_codes = np.frombuffer(self.hazard, dtype=np.int8)
+        columns = {
+            "name": pa.array(self.names, type=pa.string()),
+            "id": pa.array(np.frombuffer(self.ids, dtype=np.int64)),
+            "is_hazardous": pa.DictionaryArray.from_arrays(
+                pa.array(hazard_codes, mask=hazard_codes < 0), pa.array([False, True])
+            ),
+            "approach_date": pa.array(np.frombuffer(self.dates, dtype=np.int64), type=pa.date64()),
+        }
+        for col in self.FLOAT_COLS:
+            columns[col] = pa.array(np.frombuffer(self.floats[col], dtype=np.float32))
+        return pa.table({col: columns[col] for col in self.COLUMNS})
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.to_table().to_pandas(date_as_object=False)
 
 def flatten_neo_data(raw_json: dict) -> pd.DataFrame:
     """
     Flatten NEO JSON data from NASA API into a DataFrame.
+
+    Counts of flattened and malformed entries are attached as `df.attrs["flatten_stats"]`.
     """
-    asteroids = raw_json.get("near_earth_objects", {})
-    all_asteroids = []
+    buffer = NeoColumnBuffer()
+    buffer.extend(raw_json)
+    df = buffer.to_frame()
+    df.attrs["flatten_stats"] = buffer.stats
+    return df
 
-    for date, asteroid_list in asteroids.items():
-        for asteroid in asteroid_list:
-            try:
-                approach = asteroid.get("close_approach_data", [{}])[0]
-                diameter_data = asteroid.get("estimated_diameter", {}).get("kilometers", {})
-
-                asteroid_entry = {
-                    "name": asteroid.get("name"),
-                    "id": asteroid.get("id"),
-                    "absolute_magnitude_h": asteroid.get("absolute_magnitude_h"),
-                    "is_hazardous": asteroid.get("is_potentially_hazardous_asteroid"),
-                    "diameter_min_km": diameter_data.get("estimated_diameter_min"),
-                    "diameter_max_km": diameter_data.get("estimated_diameter_max"),
-                    "velocity_km_s": float(approach.get("relative_velocity", {}).get("kilometers_per_second", 0.0)),
-                    "miss_distance_km": float(approach.get("miss_distance", {}).get("kilometers", 0.0)),
-                    "approach_date": approach.get("close_approach_date")
-                }
-
-                all_asteroids.append(asteroid_entry)
+def stream_to_dataset(payloads, path: str, batch_rows: int = FLATTEN_BATCH_ROWS, history=None) -> dict:
+    """
+    Flatten an iterable of NeoWs payloads into a dataset, upserting every `batch_rows` rows.
 
-            except Exception as e:
-                print(f"⚠️ Skipping malformed entry due to error: {e}")
-                continue
+    Only one batch is held in memory at a time. Each batch's approaches up to
+    today are also added to `history` (an ObjectHistory) when given; predicted
+    future approaches are not history yet. Returns the flatten stats.
+    """
+    buffer = NeoColumnBuffer()
+    today = pd.Timestamp(date.today())
+
+    def flush():
+        df = buffer.to_frame()
+        upsert_dataset(df, path, keys=NEO_KEYS)
+        if history is not None:
+            history.add(df[pd.to_datetime(df["approach_date"]) <= today])
+        buffer.clear()
 
-    return pd.DataFrame(all_asteroids)
+    for raw in payloads:
+        buffer.extend(raw)
+        if len(buffer) >= batch_rows:
+            flush()
+    if len(buffer):
+        flush()
+    return buffer.stats
 
 def save_data_to_excel(df: pd.DataFrame, path: str):
     """
-    Save a DataFrame to CSV file.
+    Export a DataFrame to an Excel file. The pipeline itself stores data as Parquet.
     """
     os.makedirs(os.path.dirname(path), exist_ok=True)
     df.to_excel(path, index=False)
     print(f"✅ Data saved to {path}")
 
-def fetch_past_data(days_back: int = 365):
+def fetch_windows(windows: list, max_workers: int = FETCH_WORKERS):
     """
-    Fetch NEO data for a given number of past days in 7-day chunks.
+    Fetch several date windows concurrently on a bounded worker pool.
+
+    Yields (start, end, raw_json, error) in the same order as `windows`, whatever
+    order the requests complete in. At most 2 * max_workers windows are in flight
+    or waiting to be consumed. All workers share one RateLimiter.
     """
-    start = datetime.today().date() - timedelta(days=days_back)
-    end = datetime.today().date()
-    all_data = []
+    limiter = RateLimiter()
 
-    while start < end:
-        range_end = start + timedelta(days=7)
-        if range_end > end:
-            range_end = end
+    def fetch(window):
+        start, end = window
+        print(f"📡 Fetching data: {start} → {end}")
+        return fetch_neo_data(str(start), str(end), limiter=limiter)
 
-        print(f"📡 Fetching data: {start} → {range_end}")
-        try:
-            raw = fetch_neo_data(str(start), str(range_end))
-            flat = flatten_neo_data(raw)
-            all_data.append(flat)
-        except Exception as e:
-            print(f"❌ Failed for {start}: {e}")
+    max_workers = max(1, max_workers)
+    pending = deque()
+    remaining = iter(windows)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for window in remaining:
+            pending.append((window, pool.submit(fetch, window)))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            (start, end), future = pending.popleft()
+            try:
+                result = (start, end, future.result(), None)
+            except Exception as e:
+                result = (start, end, None, e)
+            next_window = next(remaining, None)
+            if next_window is not None:
+                pending.append((next_window, pool.submit(fetch, next_window)))
+            yield result
+
+def _load_history():
+    """
+    The saved object history to extend, or None if it has not been built yet.
+    """
+    from object_history import OBJECT_HISTORY_PATH, ObjectHistory
+    if not os.path.exists(os.path.join(OBJECT_HISTORY_PATH, "history.json")):
+        print(f"⚠️ No object history at {OBJECT_HISTORY_PATH}; run src/object_history.py build to start one")
+        return None
+    return ObjectHistory.load(OBJECT_HISTORY_PATH, mmap=False)
+
+def fetch_past_data(days_back: int = 365, max_workers: int = FETCH_WORKERS, store: ChunkStore = None,
+                    days_ahead: int = 0, refetch_days: int = REFETCH_DAYS):
+    """
+    Fetch NEO data for a given number of past days (and `days_ahead` upcoming
+    days of predicted approaches) in 7-day chunks.
+
+    Completed windows are kept in a ChunkStore, so a rerun only fetches windows
+    that are missing or previously failed plus the days since the last run.
+    Windows covering the last `refetch_days` days and everything after are
+    always fetched again, since NeoWs still revises recent days and predicted
+    approaches change as orbits are refined.
+    Windows are fetched concurrently (`max_workers=1` fetches them one at a time)
+    and the new rows are upserted by (id, approach_date) into the Parquet dataset
+    and added to the object history.
+    """
+    today = datetime.today().date()
+    start = today - timedelta(days=days_back)
+    end = today + timedelta(days=days_ahead)
+    store = store or ChunkStore(f"{DATA_PATH_RAW}/chunks")
+    data_path = f"{DATA_PATH_RAW}/neo_data"
+
+    windows = store.missing_windows(start, end, refresh_from=today - timedelta(days=refetch_days))
+    print(f"📦 {len(windows)} window(s) to fetch, high-water mark: {store.high_water()}")
+
+    def fetched_payloads():
+        for window_start, window_end, raw, error in fetch_windows(windows, max_workers):
+            if error is not None:
+                store.mark_failed(window_start, window_end, error)
+                print(f"❌ Failed for {window_start}: {error}")
+                continue
+            store.save(window_start, window_end, raw)
+            yield raw
+
+    history = None
+    with stage("fetch_past_data", windows=len(windows)) as record:
+        if dataset_exists(data_path):
+            # Fetching is lazy, so requests overlap with flattening and writing
+            payloads = fetched_payloads()
+            if UPDATE_OBJECT_HISTORY:
+                history = _load_history()
+        else:
+            # Fill the store first, then rebuild the dataset from every stored window
+            for _ in fetched_payloads():
+                pass
+            payloads = (store.load(s, e) for s, e in store.chunks())
+            if UPDATE_OBJECT_HISTORY:
+                from object_history import ObjectHistory
+                history = ObjectHistory.empty()
 
-        start += timedelta(days=7)
+        recorded = len(history) if history is not None else 0
+        stats = stream_to_dataset(payloads, data_path, history=history)
+        if history is not None and len(history) > recorded:
+            history.save()
+        record["rows"] = stats["rows"]
+        record["malformed"] = stats["malformed"]
+        record["http_requests"] = {dict(labels)["status"]: n for labels, n in
+                                   REGISTRY.counters_by_label("http_requests").items()}
+        record["http_request_ms"] = REGISTRY.percentiles("http_request_ms")
+    if not stats["rows"] and not stats["malformed"]:
+        print("✅ Done! NEO data is already up to date.")
+        return stats
 
-    full_df = pd.concat(all_data, ignore_index=True)
-    save_data_to_excel(full_df, f"{DATA_PATH_RAW}/neo_data.xlsx")
-    print(f"✅ Done! {days_back} days of NEO data collected and saved.")
+    print(f"✅ Done! {stats['rows']:,} rows upserted into {data_path} "
+          f"({stats['malformed']} malformed entries skipped: {stats['errors']}).")
+    return stats
 
 # Test
 if __name__ == "__main__":
+    serve_metrics_from_env()
     fetch_past_data(days_back=3650)
@@ -0,0 +1,197 @@
+import os
+import json
+import glob
+import argparse
+import numpy as np
+from functools import lru_cache
+from datetime import datetime, timezone
+from joblib import Parallel, delayed
+from dotenv import load_dotenv
+from compiled_forest import compile_forest
+from pipeline import PIPELINE_PATH, load_pipeline
+from instrumentation import stage
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+# Explanations are stored per model version and data: <EXPLAIN_CACHE_DIR>/<schema_hash>/
+EXPLAIN_CACHE_DIR = os.getenv("EXPLAIN_CACHE_DIR", "models/explanations")
+IMPORTANCE_ROWS = int(os.getenv("IMPORTANCE_ROWS", "20000"))
+IMPORTANCE_REPEATS = int(os.getenv("IMPORTANCE_REPEATS", "5"))
+EXPLAIN_MEMO_SIZE = 4096
+
+def importance_path(schema_hash: str, source: str, rows: int, cache_dir: str = EXPLAIN_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, schema_hash, f"permutation_importance_{source}_{rows}.json")
+
+def mean_absolute_error(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    return float(np.abs(y_true - y_pred).mean())
+
+def _permuted_error(pipeline, X: np.ndarray, y: np.ndarray, column: int, seed: int) -> float:
+    X_permuted = X.copy()
+    X_permuted[:, column] = np.random.default_rng(seed).permutation(X_permuted[:, column])
+    return mean_absolute_error(y, pipeline.predict_scaled(X_permuted))
+
+def permutation_importance(pipeline, X: np.ndarray, y: np.ndarray, source: str,
+                           n_repeats: int = IMPORTANCE_REPEATS, n_jobs: int = -1, random_state: int = 0) -> dict:
+    """
+    Increase in MAE (log risk) when each feature column of the scaled matrix X is shuffled.
+
+    The unshuffled baseline is predicted once and every (feature, repeat) pair runs
+    as its own task, in parallel on threads (forest prediction releases the GIL).
+    Each column is shuffled on its own while the others keep their values, so
+    correlated features (kinetic_energy with velocity and diameter) can mask each
+    other, and the shuffled rows need not look like real approaches. `source`
+    names the data X was drawn from.
+    """
+    baseline = mean_absolute_error(y, pipeline.predict_scaled(X))
+    tasks = [(column, random_state + column * n_repeats + repeat)
+             for column in range(X.shape[1]) for repeat in range(n_repeats)]
+    errors = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_permuted_error)(pipeline, X, y, column, seed) for column, seed in tasks
+    )
+    increase = (np.array(errors) - baseline).reshape(X.shape[1], n_repeats)
+    return {
+        "model": pipeline.schema_hash,
+        "source": source,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "metric": "mae",
+        "baseline": baseline,
+        "rows": len(X),
+        "n_repeats": n_repeats,
+        "random_state": random_state,
+        "features": {
+            feature: {"mean": float(increase[i].mean()), "std": float(increase[i].std()),
+                      "repeats": increase[i].tolist()}
+            for i, feature in enumerate(pipeline.features)
+        },
+    }
+
+def load_importance(schema_hash: str, source: str = None, rows: int = None, cache_dir: str = EXPLAIN_CACHE_DIR):
+    """
+    Cached importance for a model version on (source, rows), or the newest one on any data.
+    """
+    if source is None:
+        paths = glob.glob(os.path.join(cache_dir, schema_hash, "permutation_importance_*.json"))
+        path = max(paths, key=os.path.getmtime) if paths else None
+    else:
+        path = importance_path(schema_hash, source, rows, cache_dir)
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_importance(importance: dict, cache_dir: str = EXPLAIN_CACHE_DIR) -> str:
+    path = importance_path(importance["model"], importance["source"], importance["rows"], cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(importance, f, indent=2)
+    return path
+
+def cached_permutation_importance(pipeline, X: np.ndarray, y: np.ndarray, source: str,
+                                  n_repeats: int = IMPORTANCE_REPEATS, n_jobs: int = -1, random_state: int = 0,
+                                  refresh: bool = False, cache_dir: str = EXPLAIN_CACHE_DIR) -> dict:
+    """
+    permutation_importance, reused from the model's cache directory when it was
+    already computed for this model version on the same data source and row
+    count with the same settings.
+    """
+    cached = None if refresh else load_importance(pipeline.schema_hash, source, len(X), cache_dir)
+    if cached and (cached["n_repeats"], cached["random_state"]) == (n_repeats, random_state):
+        print(f"✅ Permutation importance for {pipeline.schema_hash} ({source}) loaded from cache")
+        return cached
+    with stage("permutation_importance", rows=len(X), n_repeats=n_repeats):
+        importance = permutation_importance(pipeline, X, y, source, n_repeats, n_jobs, random_state)
+    print(f"✅ Permutation importance saved to {save_importance(importance, cache_dir)}")
+    return importance
+
+def load_importance_data(path: str, n_rows: int = IMPORTANCE_ROWS, seed: int = 0):
+    """
+    Scaled feature matrix and log risk target for a random sample of raw approaches.
+    """
+    from storage import read_dataset
+    from feature_engineering import derive_risk_columns
+
+    # id and approach_date let the pipeline look up history features when it uses them
+    columns = ['id', 'approach_date', 'diameter_min_km', 'diameter_max_km', 'velocity_km_s',
+               'absolute_magnitude_h', 'miss_distance_km']
+    df = derive_risk_columns(read_dataset(path, columns=columns).dropna())
+    if len(df) > n_rows:
+        df = df.sample(n=n_rows, random_state=seed)
+    return df, df['log_risk_score'].to_numpy()
+
+class Explainer:
+    """
+    Per-prediction tree-path attributions for one model version.
+
+    The forest is flattened once (or taken from a compiled export) and answers
+    are memoized by input, so the dashboard can redraw an explanation on every
+    rerun without walking the trees again.
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.model_hash = pipeline.schema_hash
+        predictor = getattr(pipeline, "predictor", None)
+        self.forest = predictor if predictor is not None else compile_forest(pipeline.model)
+        self.explain_one = lru_cache(maxsize=EXPLAIN_MEMO_SIZE)(self._explain_one)
+
+    def explain_scaled(self, X: np.ndarray):
+        """
+        (bias, contributions) in log risk for rows of the scaled feature matrix.
+        """
+        return self.forest.attributions(X)
+
+    def _explain_one(self, velocity_km_s: float, absolute_magnitude_h: float, avg_diameter_km: float) -> dict:
+        X = self.pipeline.feature_matrix_arrays(velocity_km_s, absolute_magnitude_h, avg_diameter_km)
+        bias, contributions = self.explain_scaled(X)
+        contributions = dict(zip(self.pipeline.features, contributions[0].tolist()))
+        return {
+            "model": self.model_hash,
+            "bias": bias,
+            "contributions": contributions,
+            "log_risk": bias + sum(contributions.values()),
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Permutation importance and per-prediction attributions.")
+    parser.add_argument("--pipeline", default=PIPELINE_PATH, help="Path to the saved pipeline")
+    parser.add_argument("--show", action="store_true", help="Also open plots in a window")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    importance_parser = subparsers.add_parser("importance", help="Permutation importance on a sample of approaches")
+    importance_parser.add_argument("--input", default=f"{DATA_PATH_RAW}/neo_data", help="Raw dataset directory")
+    importance_parser.add_argument("--rows", type=int, default=IMPORTANCE_ROWS)
+    importance_parser.add_argument("--repeats", type=int, default=IMPORTANCE_REPEATS)
+    importance_parser.add_argument("--n-jobs", type=int, default=-1)
+    importance_parser.add_argument("--seed", type=int, default=0)
+    importance_parser.add_argument("--refresh", action="store_true", help="Recompute even if cached")
+    importance_parser.add_argument("--plot", default="reports/figures/permutation_importance.png",
+                                   help="Image to write (empty to skip)")
+
+    predict_parser = subparsers.add_parser("predict", help="Explain one prediction")
+    predict_parser.add_argument("--velocity", type=float, required=True, help="Velocity (km/s)")
+    predict_parser.add_argument("--magnitude", type=float, required=True, help="Absolute magnitude (H)")
+    predict_parser.add_argument("--diameter", type=float, required=True, help="Average diameter (km)")
+    predict_parser.add_argument("--plot", default="reports/figures/prediction_attribution.png",
+                                help="Image to write (empty to skip)")
+    args = parser.parse_args()
+
+    if not args.show:
+        import matplotlib
+        matplotlib.use("Agg")
+    from visualisation import plot_attribution, plot_permutation_importance
+
+    pipeline = load_pipeline(args.pipeline)
+    if args.command == "importance":
+        df, y = load_importance_data(args.input, args.rows, args.seed)
+        importance = cached_permutation_importance(pipeline, pipeline.feature_matrix(df), y, "raw_sample",
+                                                   args.repeats, args.n_jobs, args.seed, refresh=args.refresh)
+        for feature, stats in sorted(importance["features"].items(), key=lambda item: -item[1]["mean"]):
+            print(f"  {feature:<22} +{stats['mean']:.3e} ± {stats['std']:.1e} MAE")
+        if args.plot or args.show:
+            plot_permutation_importance(importance, args.plot or None, show=args.show)
+    else:
+        explanation = Explainer(pipeline).explain_one(args.velocity, args.magnitude, args.diameter)
+        print(f"🧭 Log risk {explanation['log_risk']:.6e} = base {explanation['bias']:.6e}")
+        for feature, value in explanation["contributions"].items():
+            print(f"  {feature:<22} {value:+.6e}")
+        if args.plot or args.show:
+            plot_attribution(explanation, args.plot or None, show=args.show)
@@ -1,59 +1,169 @@
 import os
-import pandas as pd
+import argparse
+import joblib
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 from dotenv import load_dotenv
+from storage import iter_batches, read_dataset, write_dataset, write_dataset_batches
+from instrumentation import serve_metrics_from_env, stage
 
 load_dotenv()
 DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
 DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+FEATURE_CHUNK_ROWS = int(os.getenv("FEATURE_CHUNK_ROWS", "1000000"))
+SCALER_PATH = os.getenv("SCALER_PATH", "models/feature_scaler.pkl")
 
-def calculate_average_diameter(row):
-    return (row['diameter_min_km'] + row['diameter_max_km']) / 2
+# Final features to use
+FEATURES = [
+    'velocity_km_s',
+    'absolute_magnitude_h',
+    'avg_diameter_km',
+    'kinetic_energy'
+]
 
-def calculate_kinetic_energy(row):
-    return (row['avg_diameter_km'] ** 3) * (row['velocity_km_s'] ** 2)
+# Optional per-object history features (see object_history.py), as of just before each approach
+HISTORY_FEATURES = [
+    'prior_approaches',
+    'days_since_previous_approach',
+    'prior_min_miss_distance_km',
+    'velocity_trend_km_s_per_year'
+]
+# Values for an object with no recorded approaches; gaps are capped at ten years
+NO_HISTORY = {
+    'prior_approaches': 0.0,
+    'days_since_previous_approach': 3653.0,
+    'prior_min_miss_distance_km': 149_597_870.7,
+    'velocity_trend_km_s_per_year': 0.0,
+}
+# Train with FEATURES + HISTORY_FEATURES (needs a built object history)
+USE_HISTORY_FEATURES = os.getenv("USE_HISTORY_FEATURES", "0") == "1"
 
-def generate_risk_features(df):
-    df = df.copy()
+def model_features() -> list:
+    return FEATURES + HISTORY_FEATURES if USE_HISTORY_FEATURES else list(FEATURES)
 
+# Rows missing any of these are dropped
+REQUIRED_COLUMNS = [
+    'velocity_km_s',
+    'absolute_magnitude_h',
+    'avg_diameter_km',
+    'kinetic_energy',
+    'miss_distance_km'
+]
+
+def calculate_average_diameter(df):
+    return (df['diameter_min_km'] + df['diameter_max_km']) / 2
+
+def calculate_kinetic_energy(df):
+    return (df['avg_diameter_km'] ** 3) * (df['velocity_km_s'] ** 2)
+
+def derive_risk_columns(df):
+    """
+    Add the derived columns and the log risk target, dropping rows with missing values.
+    All columns are computed on whole arrays at once.
+    """
     # Required derived columns
-    df['avg_diameter_km'] = df.apply(calculate_average_diameter, axis=1)
-    df['kinetic_energy'] = df.apply(calculate_kinetic_energy, axis=1)
+    df = df.assign(avg_diameter_km=calculate_average_diameter)
+    df['kinetic_energy'] = calculate_kinetic_energy(df)
 
     # Drop rows with missing values
-    df = df.dropna(subset=[
-        'velocity_km_s',
-        'absolute_magnitude_h',
-        'avg_diameter_km',
-        'kinetic_energy',
-        'miss_distance_km'
-    ])
+    df = df.dropna(subset=REQUIRED_COLUMNS)
 
     # Compute new risk score
     df['raw_risk_score'] = df['kinetic_energy'] / df['miss_distance_km']
     df['log_risk_score'] = np.log1p(df['raw_risk_score'])  # TARGET
+    return df
+
+def add_history_features(df, history=None):
+    """
+    Join HISTORY_FEATURES onto rows with id and approach_date (default: the saved object history).
+    """
+    if history is None:
+        from object_history import load_default_history
+        history = load_default_history()
+    return df.assign(**history.features(df))
 
-    # Final features to use
-    features = [
-        'velocity_km_s',
-        'absolute_magnitude_h',
-        'avg_diameter_km',
-        'kinetic_energy'
-    ]
+def generate_risk_features(df, scaler=None, return_scaler=False):
+    """
+    Derive risk features and scale them. Fits a new MinMaxScaler unless a fitted one is given.
+    With `return_scaler`, returns (features, scaler); the scaler is None when there
+    was nothing to fit it on.
+    """
+    df = derive_risk_columns(df)
+    features = model_features()
+    if USE_HISTORY_FEATURES:
+        df = add_history_features(df)
 
     # Scale input features
+    if scaler is None and len(df):
+        scaler = MinMaxScaler().fit(df[features])
+    scaled = [f + '_scaled' for f in features]
+    if len(df):
+        df[scaled] = scaler.transform(df[features])
+    else:
+        df = df.assign(**{f: np.empty(0) for f in scaled})
+
+    return (df, scaler) if return_scaler else df
+
+def fit_scaler_out_of_core(input_path, chunk_rows=FEATURE_CHUNK_ROWS):
+    """
+    Fit MinMaxScaler over a whole dataset one chunk at a time.
+
+    Per-chunk min/max merge exactly (partial_fit), so the result matches a
+    full-memory fit. Only the raw columns the features need are read.
+    """
     scaler = MinMaxScaler()
-    df[[f + '_scaled' for f in features]] = scaler.fit_transform(df[features])
+    columns = ['diameter_min_km', 'diameter_max_km', 'velocity_km_s',
+               'absolute_magnitude_h', 'miss_distance_km']
+    if USE_HISTORY_FEATURES:
+        columns += ['id', 'approach_date']
+    for chunk in iter_batches(input_path, columns=columns, batch_rows=chunk_rows):
+        derived = derive_risk_columns(chunk)
+        if USE_HISTORY_FEATURES:
+            derived = add_history_features(derived)
+        if len(derived):
+            scaler.partial_fit(derived[model_features()])
+    return scaler
 
-    return df
+def generate_risk_features_out_of_core(input_path, output_path, chunk_rows=FEATURE_CHUNK_ROWS):
+    """
+    Out-of-core generate_risk_features for datasets that do not fit in memory.
+
+    Pass 1 fits the scaler across all chunks, pass 2 streams the dataset again to
+    derive, scale and write each chunk. Returns the fitted scaler.
+    """
+    scaler = fit_scaler_out_of_core(input_path, chunk_rows)
+    chunks = (
+        generate_risk_features(chunk, scaler=scaler)
+        for chunk in iter_batches(input_path, batch_rows=chunk_rows)
+    )
+    write_dataset_batches((chunk for chunk in chunks if len(chunk)), output_path)
+    return scaler
 
 # Test
 if __name__ == "__main__":
-    input_path = f"{DATA_PATH_RAW}/neo_data.xlsx"
-    output_path = f"{DATA_PATH_PROCESSED}/neo_features_for_risk_regression.xlsx"
+    parser = argparse.ArgumentParser(description="Generate risk features from the raw NEO dataset.")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Stream the dataset in chunks instead of loading it into memory")
+    parser.add_argument("--chunk-rows", type=int, default=FEATURE_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    input_path = f"{DATA_PATH_RAW}/neo_data"
+    output_path = f"{DATA_PATH_PROCESSED}/neo_features_for_risk_regression"
+
+    serve_metrics_from_env()
+    with stage("generate_risk_features", out_of_core=args.out_of_core) as record:
+        if args.out_of_core:
+            scaler = generate_risk_features_out_of_core(input_path, output_path, args.chunk_rows)
+        else:
+            df = read_dataset(input_path)
+            df_full, scaler = generate_risk_features(df, return_scaler=True)
+            if scaler is None:
+                raise SystemExit(f"No rows with complete risk inputs in {input_path}")
+            write_dataset(df_full, output_path)
+        record["rows"] = int(scaler.n_samples_seen_)
+    print(f"✅ Processed risk features saved to: {output_path}")
 
-    df = pd.read_excel(input_path)
-    df_full = generate_risk_features(df)
-    df_full.to_excel(output_path, index=False)
-    print(f"✅ Processed risk features saved to: {output_path}")
\ No newline at end of file
+    # Saved so training can package it into the inference pipeline
+    os.makedirs(os.path.dirname(SCALER_PATH) or ".", exist_ok=True)
+    joblib.dump(scaler, SCALER_PATH)
+    print(f"✅ Fitted scaler saved to: {SCALER_PATH}")
@@ -0,0 +1,291 @@
+import json
+import time
+import random
+import bisect
+import socket
+import argparse
+import threading
+import numpy as np
+from functools import lru_cache
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from chunk_store import ChunkStore, _to_date
+
+FEED_PATH = "/neo/rest/v1/feed"
+MAX_RANGE_DAYS = 7
+AU_KM = 149_597_870.7
+# Serialized days kept for repeated requests; a few weeks covers retried and overlapping windows
+BODY_CACHE_DAYS = 32
+
+class SyntheticFeed:
+    """
+    Deterministic generator of NeoWs feed entries, `objects_per_day` per date.
+
+    Each date is generated from its own seed, so any date range can be requested
+    in any order and always returns the same objects. Asteroids are drawn from a
+    pool of ids whose physical properties (magnitude, diameter, hazard flag) are
+    fixed per id, so the same object reappears across dates like real close
+    approaches. `malformed_rate` drops required fields from a fraction of entries.
+    """
+    def __init__(self, objects_per_day: int = 100, pool_days: int = 30,
+                 malformed_rate: float = 0.0, seed: int = 0):
+        self.objects_per_day = objects_per_day
+        self.pool_size = max(1, objects_per_day * pool_days)
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+
+        # Per-object constants; diameter bounds use albedos 0.25 and 0.05 as NeoWs does
+        rng = np.random.default_rng([seed, 1])
+        self.magnitude = rng.uniform(14.0, 30.0, self.pool_size)
+        self.diameter_min = 1329.0 / np.sqrt(0.25) * 10 ** (-self.magnitude / 5)
+        self.diameter_max = 1329.0 / np.sqrt(0.05) * 10 ** (-self.magnitude / 5)
+
+    def day(self, day: date) -> list:
+        rng = np.random.default_rng([self.seed, day.toordinal()])
+        n = self.objects_per_day
+        ids = rng.choice(self.pool_size, size=n, replace=False) if n <= self.pool_size \
+            else rng.integers(0, self.pool_size, n)
+        magnitude, diameter_min, diameter_max = self.magnitude[ids], self.diameter_min[ids], self.diameter_max[ids]
+        velocity = rng.lognormal(np.log(12.0), 0.5, n)
+        miss_distance = rng.uniform(0.001, 0.5, n) * AU_KM
+        hazardous = (magnitude <= 22.0) & (miss_distance <= 0.05 * AU_KM)
+        malformed = rng.random(n) < self.malformed_rate
+
+        day_str = str(day)
+        entries = []
+        for i in range(n):
+            neo_id = str(2_000_000 + int(ids[i]))
+            entry = {
+                "id": neo_id,
+                "neo_reference_id": neo_id,
+                "name": f"({day.year} SYN{ids[i]})",
+                "absolute_magnitude_h": round(float(magnitude[i]), 2),
+                "estimated_diameter": {"kilometers": {
+                    "estimated_diameter_min": float(diameter_min[i]),
+                    "estimated_diameter_max": float(diameter_max[i]),
+                }},
+                "is_potentially_hazardous_asteroid": bool(hazardous[i]),
+                "close_approach_data": [{
+                    "close_approach_date": day_str,
+                    "relative_velocity": {"kilometers_per_second": f"{velocity[i]:.10f}"},
+                    "miss_distance": {"kilometers": f"{miss_distance[i]:.6f}"},
+                    "orbiting_body": "Earth",
+                }],
+            }
+            if malformed[i]:
+                del entry["close_approach_data"][0]["close_approach_date"]
+            entries.append(entry)
+        return entries
+
+class ReplayFeed:
+    """
+    Serves the payloads recorded in a ChunkStore (the `chunks` directory that
+    fetch_past_data fills from the live API). Dates that were never recorded
+    come back with no objects.
+    """
+    def __init__(self, store: ChunkStore):
+        self.store = store
+        self.windows = store.chunks()
+        self.starts = [start for start, _ in self.windows]
+        self._load = lru_cache(maxsize=64)(store.load)
+
+    def day(self, day: date) -> list:
+        i = bisect.bisect_right(self.starts, day) - 1
+        if i < 0 or day > self.windows[i][1]:
+            return []
+        payload = self._load(*self.windows[i])
+        return payload.get("near_earth_objects", {}).get(str(day), [])
+
+class FeedServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the NeoWs feed endpoint with configurable faults.
+
+    Serves GET {FEED_PATH}?start_date=...&end_date=... from `feed` (a
+    SyntheticFeed or ReplayFeed) and GET /stats with request counters. On each
+    feed request it sleeps for `latency_ms` (± `jitter_ms`), then may drop the
+    connection (`disconnect_rate`), answer 429 with Retry-After
+    (`rate_limit_rate`) or a 5xx (`error_rate`). `quota` requests per
+    `quota_window_s` are allowed, reported in X-RateLimit-* headers like the
+    real API, and answered with 429 once used up.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, feed, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 disconnect_rate: float = 0.0, quota: int = 1000, quota_window_s: float = 3600.0,
+                 seed: int = None):
+        super().__init__(address, FeedRequestHandler)
+        self.feed = feed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.disconnect_rate = disconnect_rate
+        self.quota = quota
+        self.quota_window_s = quota_window_s
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_started = time.monotonic()
+        self.used = 0
+        self.stats = {"requests": 0, "objects": 0, "bytes": 0, "disconnects": 0, "status": {}}
+        self.day_body = lru_cache(maxsize=BODY_CACHE_DAYS)(self._day_body)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{FEED_PATH}"
+
+    def _day_body(self, day: date):
+        entries = self.feed.day(day)
+        return json.dumps(entries).encode(), len(entries)
+
+    def take_quota(self):
+        """
+        Count one request against the quota. Returns (allowed, remaining, seconds to reset).
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_started >= self.quota_window_s:
+                self.window_started, self.used = now, 0
+            allowed = self.used < self.quota
+            self.used += allowed
+            return allowed, self.quota - self.used, self.quota_window_s - (now - self.window_started)
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+    def record(self, status: int, n_bytes: int = 0, objects: int = 0):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += n_bytes
+            self.stats["objects"] += objects
+            self.stats["status"][str(status)] = self.stats["status"].get(str(status), 0) + 1
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: dict = None, objects: int = 0):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(status, len(body), objects)
+
+    def _error(self, status: int, message: str, headers: dict = None):
+        self._send(status, json.dumps({"code": status, "error_message": message}).encode(), headers)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with server.lock:
+                body = json.dumps(server.stats).encode()
+            self._send(200, body)
+            return
+        if url.path != FEED_PATH:
+            self._error(404, f"Unknown path {url.path}")
+            return
+
+        delay_ms = server.latency_ms + (server.random.uniform(-1, 1) * server.jitter_ms if server.jitter_ms else 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+        if server.roll(server.disconnect_rate):
+            with server.lock:
+                server.stats["disconnects"] += 1
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        allowed, remaining, reset_s = server.take_quota()
+        headers = {"X-RateLimit-Limit": str(server.quota), "X-RateLimit-Remaining": str(max(remaining, 0))}
+        if not allowed:
+            self._error(429, "OVER_RATE_LIMIT", {**headers, "Retry-After": f"{reset_s:.0f}"})
+            return
+        if server.roll(server.rate_limit_rate):
+            self._error(429, "OVER_RATE_LIMIT", {**headers, "Retry-After": f"{server.retry_after:g}"})
+            return
+        if server.roll(server.error_rate):
+            self._error(server.random.choice([500, 502, 503]), "Injected server error", headers)
+            return
+
+        query = parse_qs(url.query)
+        try:
+            start = _to_date(query["start_date"][0])
+            end = _to_date(query.get("end_date", [str(start + timedelta(days=MAX_RANGE_DAYS))])[0])
+        except (KeyError, ValueError) as e:
+            self._error(400, f"Invalid date range: {e}", headers)
+            return
+        if end < start or (end - start).days > MAX_RANGE_DAYS:
+            self._error(400, f"Date Format Exception - Expected format (yyyy-mm-dd) - "
+                             f"The Feed date limit is only {MAX_RANGE_DAYS} Days", headers)
+            return
+
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        parts, count = [], 0
+        for day in days:
+            body, n = server.day_body(day)
+            parts.append(b'"%s": %s' % (str(day).encode(), body))
+            count += n
+        body = b'{"element_count": %d, "near_earth_objects": {%s}}' % (count, b", ".join(parts))
+        self._send(200, body, headers, objects=count)
+
+def serve(feed, host: str = "127.0.0.1", port: int = 0, background: bool = False, **faults) -> FeedServer:
+    """
+    Start a FeedServer. With `background=True` it runs on a daemon thread and the
+    server is returned (call shutdown() when done); `port=0` picks a free port.
+    """
+    server = FeedServer((host, port), feed, **faults)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"🛰️ Serving NeoWs stand-in on {server.url} (set NASA_API_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the NASA NeoWs feed API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--replay", metavar="CHUNKS_DIR",
+                        help="Replay windows recorded by fetch_past_data instead of generating data")
+    parser.add_argument("--objects-per-day", type=int, default=100, help="Synthetic objects per date")
+    parser.add_argument("--pool-days", type=int, default=30,
+                        help="Size of the synthetic id pool, in days' worth of objects")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with injected 429s")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Fraction of requests whose connection is dropped")
+    parser.add_argument("--quota", type=int, default=1000, help="Requests allowed per quota window")
+    parser.add_argument("--quota-window", type=float, default=3600.0, help="Quota window in seconds")
+    args = parser.parse_args()
+
+    if args.replay:
+        feed = ReplayFeed(ChunkStore(args.replay))
+    else:
+        feed = SyntheticFeed(args.objects_per_day, args.pool_days, args.malformed_rate, args.seed)
+    serve(feed, args.host, args.port,
+          latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+          rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+          disconnect_rate=args.disconnect_rate, quota=args.quota, quota_window_s=args.quota_window,
+          seed=args.seed)
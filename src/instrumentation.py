@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# JSON-lines file every stage record is appended to (unset: records are only kept in memory)
+METRICS_LOG = os.getenv("NEO_METRICS_LOG")
+# Port for the Prometheus-style /metrics endpoint started by serve_metrics_from_env()
+METRICS_PORT = os.getenv("NEO_METRICS_PORT")
+# Opt-in sampling profiler: folded stacks per stage are written to NEO_PROFILE_DIR
+PROFILE_DIR = os.getenv("NEO_PROFILE_DIR")
+PROFILE_INTERVAL_S = float(os.getenv("NEO_PROFILE_INTERVAL_MS", "5")) / 1000
+RESERVOIR_SIZE = 10_000
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process in MB (None where unsupported).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class MetricsRegistry:
+    """
+    Process-wide counters, latency samples and stage records.
+
+    Latencies keep the last RESERVOIR_SIZE samples per series for percentiles,
+    plus an exact count and sum. All methods are thread-safe.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.samples = {}
+        self.totals = {}
+        self.stages = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            self.counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=RESERVOIR_SIZE)
+                self.totals[key] = [0, 0.0]
+            self.samples[key].append(value)
+            self.totals[key][0] += 1
+            self.totals[key][1] += value
+
+    def percentiles(self, name: str, quantiles=(50, 95, 99), **labels) -> dict:
+        """
+        {"count", "p50", ...} over the recent samples of one series (empty if none).
+        """
+        key = (name, _label_key(labels))
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+            count = self.totals.get(key, [0])[0]
+        if not values:
+            return {}
+        result = {"count": count}
+        for q in quantiles:
+            result[f"p{q}"] = values[min(len(values) - 1, int(q / 100 * len(values)))]
+        return result
+
+    def counter(self, name: str, **labels) -> float:
+        with self.lock:
+            return self.counters[(name, _label_key(labels))]
+
+    def counters_by_label(self, name: str) -> dict:
+        with self.lock:
+            return {labels: value for (n, labels), value in self.counters.items() if n == name}
+
+    def record_stage(self, record: dict):
+        with self.lock:
+            self.stages[record["stage"]] = record
+
+    def prometheus_text(self) -> str:
+        """
+        Render everything in the Prometheus text exposition format.
+        """
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            series = sorted(self.samples)
+            stages = list(self.stages.values())
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE neo_{name}_total counter")
+            lines += [f"neo_{name}_total{fmt(labels)} {value:g}" for (n, labels), value in counters if n == name]
+        for name in sorted({name for name, _ in series}):
+            lines.append(f"# TYPE neo_{name} summary")
+            for n, labels in series:
+                if n != name:
+                    continue
+                stats = self.percentiles(name, (50, 95, 99), **dict(labels))
+                for q in (50, 95, 99):
+                    lines.append(f"neo_{name}{fmt(labels + (('quantile', str(q / 100)),))} {stats[f'p{q}']:g}")
+                count, total = self.totals[(n, labels)]
+                lines.append(f"neo_{name}_count{fmt(labels)} {count}")
+                lines.append(f"neo_{name}_sum{fmt(labels)} {total:g}")
+        for metric, field in [("stage_seconds", "seconds"), ("stage_rows_per_second", "rows_per_s")]:
+            values = [f'neo_{metric}{{stage="{s["stage"]}"}} {s[field]:g}' for s in stages if s.get(field) is not None]
+            if values:
+                lines += [f"# TYPE neo_{metric} gauge"] + values
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append("# TYPE neo_process_peak_rss_bytes gauge")
+            lines.append(f"neo_process_peak_rss_bytes {rss * 2 ** 20:.0f}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def emit(record: dict, path: str = METRICS_LOG):
+    """
+    Append one record to the JSON-lines metrics log, if one is configured.
+    """
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every `interval_s` from a background thread.
+
+    Stacks are aggregated in the "folded" format (frames joined by ';' and a
+    sample count) that flamegraph.pl and speedscope read. Overhead is one
+    sys._current_frames() call per interval, so it can run on full-size jobs.
+    """
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S, thread_id: int = None):
+        self.interval_s = interval_s
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def stage(name: str, rows: int = None, **fields):
+    """
+    Measure one pipeline stage: wall time, rows/s and peak RSS.
+
+    Yields the record dict, so the caller can set `rows` (or add fields) once
+    it knows them. On exit the record is kept in REGISTRY, appended to the
+    JSON-lines log and summarised in one line. With NEO_PROFILE_DIR set, the
+    stage also runs under the SamplingProfiler.
+    """
+    record = {"stage": name, "rows": rows, **fields}
+    profiler = SamplingProfiler().start() if PROFILE_DIR else None
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        record.update(
+            seconds=seconds,
+            rows_per_s=record["rows"] / seconds if record["rows"] and seconds > 0 else None,
+            peak_rss_mb=peak_rss_mb(),
+            finished_at=time.time(),
+        )
+        if profiler:
+            profiler.stop()
+            profiler.save(os.path.join(PROFILE_DIR, f"{name}.folded"))
+        REGISTRY.record_stage(record)
+        emit(record)
+        rate = f", {record['rows_per_s']:,.0f} rows/s" if record["rows_per_s"] else ""
+        rss = f", peak RSS {record['peak_rss_mb']:,.0f} MB" if record["peak_rss_mb"] else ""
+        print(f"⏱️ {name}: {seconds:.2f}s{rate}{rss}")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve REGISTRY as Prometheus text on http://host:port/metrics from a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def serve_metrics_from_env():
+    """
+    Start the /metrics endpoint when NEO_METRICS_PORT is set.
+    """
+    return serve_metrics(int(METRICS_PORT)) if METRICS_PORT else None
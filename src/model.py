@@ -1,83 +1,237 @@
 import os
+import hashlib
+import argparse
 import joblib
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
+from sklearn.model_selection import train_test_split, HalvingRandomSearchCV, KFold
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
 from scipy.stats import randint
-from visualisation import plot_feature_importance
+from storage import read_dataset
+from feature_engineering import SCALER_PATH, model_features
+from pipeline import COMPILED_PIPELINE_PATH, PIPELINE_PATH, RiskPipeline, export_compiled, save_pipeline
+from risk_surface import RISK_SURFACE_PATH, build_risk_surface
+from instrumentation import serve_metrics_from_env, stage
 
 DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+BUILD_RISK_SURFACE = os.getenv("BUILD_RISK_SURFACE", "1") == "1"
+FOLD_CACHE_DIR = os.getenv("FOLD_CACHE_DIR", "models/cv_cache")
+MODEL_PATH = "models/rf_risk_model.pkl"
 
-# Load processed dataset
-data_path = f"{DATA_PATH_PROCESSED}/neo_features_for_risk_regression.xlsx"
-df = pd.read_excel(data_path)
+# Input features (scaled); USE_HISTORY_FEATURES adds the per-object history features
+feature_cols = [f + '_scaled' for f in model_features()]
 
-# Input features (scaled)
-feature_cols = [
-    'velocity_km_s_scaled',
-    'absolute_magnitude_h_scaled',
-    'avg_diameter_km_scaled',
-    'kinetic_energy_scaled'
-]
+# Hyperparameter search space (n_estimators is added when it is not the halving resource)
+param_dist = {
+    'max_depth': [None, 10, 20, 30],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2', None, 0.5]
+}
 
-X = df[feature_cols]
-y = df['log_risk_score']  # New target: log(risk_score)
+def load_training_data(data_path: str):
+    """
+    Load the scaled features and log risk target from the processed dataset,
+    plus the latest approach_date in it (the data watermark).
+    """
+    df = read_dataset(data_path, columns=feature_cols + ['log_risk_score', 'approach_date'])
+    X = df[feature_cols]
+    y = df['log_risk_score']  # New target: log(risk_score)
+    watermark = pd.Timestamp(df['approach_date'].max()).date().isoformat()
+    return X, y, watermark
 
-# Split into training and testing
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
+def cache_training_folds(X_train: np.ndarray, y_train: np.ndarray, n_splits: int = 4,
+                         random_state: int = 42, cache_dir: str = FOLD_CACHE_DIR):
+    """
+    Write the training split and its CV fold indices to disk and memory-map them back.
 
-# Hyperparameter search space
-param_dist = {
-    'n_estimators': randint(100, 200),
-    'max_depth': [None, 10, 20],
-    'min_samples_split': [2, 5],
-    'max_features': ['sqrt', 'log2', None]
-}
+    joblib hands memory-mapped arrays to `n_jobs` workers by file reference, so
+    every worker reads the same pages instead of receiving its own copy. The cache
+    is keyed by a hash of the data and split settings and reused across runs.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X_train).tobytes())
+    digest.update(np.ascontiguousarray(y_train).tobytes())
+    digest.update(f"{n_splits}-{random_state}".encode())
+    path = os.path.join(cache_dir, digest.hexdigest()[:16])
+
+    if not os.path.exists(os.path.join(path, "folds.npz")):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "X.npy"), np.ascontiguousarray(X_train, dtype=np.float64))
+        np.save(os.path.join(path, "y.npy"), np.ascontiguousarray(y_train, dtype=np.float64))
+        folds = KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X_train)
+        np.savez(os.path.join(path, "folds.npz"),
+                 **{f"{kind}_{i}": idx for i, fold in enumerate(folds) for kind, idx in zip(("train", "test"), fold)})
+        print(f"💾 Cached training folds in {path}")
+
+    X_mm = np.load(os.path.join(path, "X.npy"), mmap_mode="r")
+    y_mm = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+    with np.load(os.path.join(path, "folds.npz")) as saved:
+        folds = [(saved[f"train_{i}"], saved[f"test_{i}"]) for i in range(n_splits)]
+    return X_mm, y_mm, folds
+
+def search_hyperparameters(X_train, y_train, folds, resource: str = "n_estimators",
+                           n_candidates=24, factor: int = 3, min_resources=None,
+                           max_resources=None, n_jobs: int = -1, random_state: int = 42):
+    """
+    Successive-halving random search over param_dist.
+
+    Every round trains all surviving candidates on a small budget (few trees when
+    `resource="n_estimators"`, a subsample when `resource="n_samples"`), keeps the
+    best 1/`factor` and multiplies the budget by `factor` for the next round.
+    """
+    distributions = dict(param_dist)
+    if resource == "n_estimators":
+        min_resources = min_resources or 20
+        max_resources = max_resources or 200
+    else:
+        distributions['n_estimators'] = randint(100, 200)
+        min_resources = min_resources or "exhaust"
+        max_resources = max_resources or "auto"
+
+    search = HalvingRandomSearchCV(
+        estimator=RandomForestRegressor(random_state=random_state),
+        param_distributions=distributions,
+        n_candidates=n_candidates,
+        resource=resource,
+        factor=factor,
+        min_resources=min_resources,
+        max_resources=max_resources,
+        scoring='neg_mean_absolute_error',
+        cv=folds,
+        n_jobs=n_jobs,
+        verbose=1,
+        random_state=random_state
+    )
+    search.fit(X_train, y_train)
+    return search
+
+def evaluate(model, X_test, y_test) -> dict:
+    # Predict
+    y_pred_log = model.predict(X_test)
+
+    # Reverse log transform
+    y_test_score = np.expm1(y_test)
+    y_pred_score = np.expm1(y_pred_log)
+
+    # Evaluate
+    return {
+        "mae": mean_absolute_error(y_test_score, y_pred_score),
+        "rmse": root_mean_squared_error(y_test_score, y_pred_score),
+        "r2": r2_score(y_test_score, y_pred_score),
+    }
+
+def publish_pipeline(pipeline: RiskPipeline, X_check: np.ndarray, path: str = PIPELINE_PATH,
+                     compiled_path: str = COMPILED_PIPELINE_PATH, surface_path: str = RISK_SURFACE_PATH):
+    """
+    Save a trained pipeline with its compiled export and (optionally) risk surface.
+    """
+    # Built before anything is written, so a failure leaves the published artifacts as they were
+    surface = build_risk_surface(pipeline) if BUILD_RISK_SURFACE else None
+    save_pipeline(pipeline, path)
+
+    # Export the array-backed forest used for low-latency inference
+    compiled = export_compiled(pipeline, compiled_path)
+    max_diff = np.abs(compiled.predict(X_check) - pipeline.model.predict(X_check)).max()
+    print(f"✅ Compiled forest matches model.predict (max abs diff {max_diff:.2e})")
+
+    # Precompute the dashboard's risk lookup surface
+    if surface is not None:
+        surface.save(surface_path)
+        print(f"✅ Risk surface interpolation error: max {surface.metadata['max_abs_error']:.2e}, "
+              f"p99 {surface.metadata['p99_abs_error']:.2e} (log risk)")
+
+def train(args):
+    # Load processed dataset (only the columns the model needs)
+    with stage("load_training_data") as record:
+        X, y, watermark = load_training_data(args.data_path)
+        record["rows"] = len(X)
+
+    # Split into training and testing
+    X_train, X_test, y_train, y_test = train_test_split(
+        X.to_numpy(), y.to_numpy(), test_size=0.2, random_state=42
+    )
+    X_train, y_train, folds = cache_training_folds(X_train, y_train, n_splits=args.cv)
+
+    print("🔍 Running successive-halving hyperparameter search...")
+    with stage("hyperparameter_search", rows=len(X_train), n_candidates=args.n_candidates):
+        search = search_hyperparameters(
+            X_train, y_train, folds,
+            resource=args.resource,
+            n_candidates=args.n_candidates,
+            factor=args.factor,
+            n_jobs=args.n_jobs,
+        )
+    model = search.best_estimator_
+
+    print("✅ Best hyperparameters found:")
+    print(search.best_params_)
+
+    with stage("evaluate", rows=len(X_test)):
+        metrics = evaluate(model, X_test, y_test)
+
+    # Print results
+    print("✅ Model Evaluation (risk_score prediction):")
+    print(f"R² Score:              {metrics['r2']:.10f}")
+    print(f"Mean Absolute Error:   {metrics['mae']:,.10f}")
+    print(f"Root Mean Squared Error: {metrics['rmse']:,.10f}")
+
+    # Save model
+    os.makedirs("models", exist_ok=True)
+    joblib.dump(model, MODEL_PATH)
+    print(f"✅ Model saved to {MODEL_PATH}")
+
+    # Save the inference pipeline (feature derivation + fitted scaler + forest)
+    pipeline = RiskPipeline(
+        scaler=joblib.load(SCALER_PATH),
+        model=model,
+        features=model_features(),
+        metadata={"best_params": search.best_params_, **metrics, "n_train_rows": len(X_train),
+                  "data_watermark": watermark, "incremental_updates": 0},
+    )
+    with stage("publish_pipeline"):
+        publish_pipeline(pipeline, X_test, args.pipeline, args.compiled, args.surface)
+
+    if args.plot:
+        from explain import IMPORTANCE_ROWS, cached_permutation_importance
+        from visualisation import plot_permutation_importance
+        # Permutation importance on held-out rows instead of impurity importance
+        rows = np.random.default_rng(42).permutation(len(X_test))[:IMPORTANCE_ROWS]
+        importance = cached_permutation_importance(pipeline, X_test[rows], y_test[rows], "holdout",
+                                                   n_jobs=args.n_jobs)
+        plot_permutation_importance(importance, "reports/figures/permutation_importance_rf_hp_tuning.png",
+                                    show=args.show)
+    return model, metrics
+
+def add_publish_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--pipeline", default=PIPELINE_PATH, help="Where to save the pipeline")
+    parser.add_argument("--compiled", default=COMPILED_PIPELINE_PATH, help="Where to save the compiled export")
+    parser.add_argument("--surface", default=RISK_SURFACE_PATH, help="Where to save the risk surface")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Train the asteroid risk model.")
+    parser.add_argument("--data-path", default=f"{DATA_PATH_PROCESSED}/neo_features_for_risk_regression",
+                        help="Processed feature dataset")
+    parser.add_argument("--resource", choices=["n_estimators", "n_samples"], default="n_estimators",
+                        help="Budget grown between halving rounds: trees per forest or training rows")
+    parser.add_argument("--n-candidates", type=int, default=24,
+                        help="Hyperparameter candidates in the first halving round")
+    parser.add_argument("--factor", type=int, default=3,
+                        help="Fraction of candidates kept (1/factor) and budget growth per round")
+    parser.add_argument("--cv", type=int, default=4, help="Number of cached CV folds")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    add_publish_arguments(parser)
+    parser.add_argument("--plot", action="store_true", help="Compute permutation importance and save its plot")
+    parser.add_argument("--show", action="store_true", help="Also open the plot in a window")
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
 
-# Randomized search
-search = RandomizedSearchCV(
-    estimator=RandomForestRegressor(random_state=42),
-    param_distributions=param_dist,
-    n_iter=5,
-    scoring='neg_mean_absolute_error',
-    cv=4,
-    n_jobs=-1,
-    verbose=1,
-    random_state=42
-)
-
-print("🔍 Running hyperparameter tuning...")
-search.fit(X_train, y_train)
-model = search.best_estimator_
-
-print("✅ Best hyperparameters found:")
-print(search.best_params_)
-
-# Predict
-y_pred_log = model.predict(X_test)
-
-# Reverse log transform
-y_test_score = np.expm1(y_test)
-y_pred_score = np.expm1(y_pred_log)
-
-# Evaluate
-mae = mean_absolute_error(y_test_score, y_pred_score)
-rmse = root_mean_squared_error(y_test_score, y_pred_score)
-r2 = r2_score(y_test_score, y_pred_score)
-
-# Print results
-print("✅ Model Evaluation (risk_score prediction):")
-print(f"R² Score:              {r2:.10f}")
-print(f"Mean Absolute Error:   {mae:,.10f}")
-print(f"Root Mean Squared Error: {rmse:,.10f}")
-
-# Save model
-os.makedirs("models", exist_ok=True)
-joblib.dump(model, "models/rf_risk_model.pkl")
-print("✅ Model saved to models/rf_risk_model.pkl")
-
-plot_feature_importance(model, X, "reports/figures/feature_importance_rf_hp_tuning.png")
\ No newline at end of file
+    if not args.show:
+        import matplotlib
+        matplotlib.use("Agg")
+    serve_metrics_from_env()
+    train(args)
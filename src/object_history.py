@@ -0,0 +1,466 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from functools import lru_cache
+from dotenv import load_dotenv
+from feature_engineering import HISTORY_FEATURES, NO_HISTORY
+from storage import dataset_exists, read_dataset, replacing
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+OBJECT_HISTORY_PATH = os.getenv("OBJECT_HISTORY_PATH", f"{DATA_PATH_PROCESSED}/object_history")
+
+INPUT_COLUMNS = ["id", "approach_date", "miss_distance_km", "velocity_km_s"]
+OBJECT_COLUMNS = {
+    "id": np.int64, "count": np.int64, "first_day": np.int64, "last_day": np.int64, "last_row": np.int64,
+    "min_miss_km": np.float64, "min_miss_day": np.int64,
+    # Running sums for the least-squares velocity trend (t in days)
+    "sum_t": np.float64, "sum_v": np.float64, "sum_tt": np.float64, "sum_tv": np.float64,
+}
+APPROACH_COLUMNS = {
+    "slot": np.int64, "day": np.int64, "miss_distance_km": np.float64, "velocity_km_s": np.float64,
+    "prev": np.int64, **{feature: np.float64 for feature in HISTORY_FEATURES},
+}
+DAYS_PER_YEAR = 365.25
+MIN_CAPACITY = 1024
+
+def _reserve(buffers: dict, used: int, needed: int) -> dict:
+    """
+    Buffers with room for `needed` rows, keeping the first `used`.
+
+    Capacity doubles when it runs out, so appending costs amortized O(new rows).
+    Read-only (memory-mapped) buffers are copied on the first write.
+    """
+    capacity = len(next(iter(buffers.values())))
+    writable = all(values.flags.writeable for values in buffers.values())
+    if needed <= capacity and writable:
+        return buffers
+    capacity = max(needed, 2 * capacity, MIN_CAPACITY) if needed > capacity else capacity
+    grown = {}
+    for c, values in buffers.items():
+        grown[c] = np.empty(capacity, values.dtype)
+        grown[c][:used] = values[:used]
+    return grown
+
+def _merge_runs(a: tuple, b: tuple) -> tuple:
+    keys = np.concatenate([a[0], b[0]])
+    order = np.argsort(keys, kind="stable")
+    return keys[order], np.concatenate([a[1], b[1]])[order]
+
+def _day(value) -> np.int64:
+    return np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64)
+
+def _approach_keys(ids: np.ndarray, days: np.ndarray) -> np.ndarray:
+    # (id, approach_date) packed into one sortable int64, as in catalog_index
+    return ids.astype(np.int64) * 2 ** 17 + (days.astype(np.int64) + 2 ** 16)
+
+def _trend(n, sum_t, sum_v, sum_tt, sum_tv) -> np.ndarray:
+    """
+    Least-squares slope of velocity over time in km/s per year (0 below two points).
+    """
+    n = np.asarray(n, dtype=np.float64)
+    denominator = n * sum_tt - sum_t * sum_t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sum_tv - sum_t * sum_v) / denominator
+    return np.where((n >= 2) & (denominator > 0), slope * DAYS_PER_YEAR, 0.0)
+
+def point_in_time_features(days: np.ndarray, miss: np.ndarray, velocity: np.ndarray) -> dict:
+    """
+    HISTORY_FEATURES for each approach of one object (sorted by day), using only
+    the approaches before it.
+    """
+    n = len(days)
+    t = days.astype(np.float64)
+    prior = np.arange(n)
+
+    def shifted_cumsum(values):
+        return np.concatenate([[0.0], np.cumsum(values)[:-1]]) if n else values
+
+    prior_min = np.concatenate([[np.inf], np.minimum.accumulate(miss)[:-1]]) if n else miss
+    gaps = np.concatenate([[np.nan], np.diff(t)]) if n else t
+    return {
+        "prior_approaches": prior.astype(np.float64),
+        "days_since_previous_approach": np.where(
+            np.isnan(gaps), NO_HISTORY["days_since_previous_approach"],
+            np.minimum(gaps, NO_HISTORY["days_since_previous_approach"])),
+        "prior_min_miss_distance_km": np.where(np.isinf(prior_min), NO_HISTORY["prior_min_miss_distance_km"],
+                                               prior_min),
+        "velocity_trend_km_s_per_year": _trend(prior, shifted_cumsum(t), shifted_cumsum(velocity),
+                                               shifted_cumsum(t * t), shifted_cumsum(t * velocity)),
+    }
+
+class ObjectHistory:
+    """
+    Every recorded close approach, keyed by object, with per-object aggregates.
+
+    Aggregates (approach count, first/last approach, minimum miss distance and
+    the sums behind a least-squares velocity trend) live in one slot per object
+    and are updated from each new batch with grouped cumulative sums. Object and
+    approach columns are growable buffers and the (id, approach_date) key table
+    is a list of sorted runs, merged only with runs of similar size, so adding
+    rows costs amortized O(new rows), up to log factors, whatever the size of the
+    history. Each approach links to the object's previous one, so
+    one object's history is a walk of its own approaches. Every approach also
+    stores HISTORY_FEATURES as of just before it (its "point in time"), which is
+    what the model trains on; an approach that arrives out of date order only
+    rebuilds its own object's chain. Re-ingested (id, approach_date) pairs are
+    skipped, like catalog_index keys. Saved as .npy files plus history.json.
+    """
+    def __init__(self, objects: dict, approaches: dict, keys: np.ndarray, key_rows: np.ndarray):
+        self._objects = objects
+        self._n_objects = len(objects["id"])
+        self._approaches = approaches
+        self._n_approaches = len(approaches["day"])
+        # Sorted (keys, rows) runs, largest first
+        self.key_runs = [(keys, key_rows)] if len(keys) else []
+        self.slots = {int(object_id): slot for slot, object_id in enumerate(objects["id"])}
+
+    @classmethod
+    def empty(cls) -> "ObjectHistory":
+        return cls({c: np.empty(0, dtype) for c, dtype in OBJECT_COLUMNS.items()},
+                   {c: np.empty(0, dtype) for c, dtype in APPROACH_COLUMNS.items()},
+                   np.empty(0, np.int64), np.empty(0, np.int64))
+
+    def __len__(self) -> int:
+        return self._n_approaches
+
+    @property
+    def n_objects(self) -> int:
+        return self._n_objects
+
+    @property
+    def objects(self) -> dict:
+        return {c: values[:self._n_objects] for c, values in self._objects.items()}
+
+    @property
+    def approaches(self) -> dict:
+        return {c: values[:self._n_approaches] for c, values in self._approaches.items()}
+
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Approach row of each (id, approach_date) key, -1 if it is not recorded.
+        """
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for run_keys, run_rows in self.key_runs:
+            pos = np.searchsorted(run_keys, keys)
+            hit = pos < len(run_keys)
+            hit[hit] = run_keys[pos[hit]] == keys[hit]
+            rows[hit] = run_rows[pos[hit]]
+        return rows
+
+    def _add_keys(self, keys: np.ndarray, rows: np.ndarray):
+        # A run is merged into its predecessor while that one is at most twice its size,
+        # so there are O(log n) runs and each key takes part in O(log n) merges
+        order = np.argsort(keys, kind="stable")
+        run = (keys[order], rows[order])
+        while self.key_runs and len(self.key_runs[-1][0]) <= 2 * len(run[0]):
+            run = _merge_runs(self.key_runs.pop(), run)
+        self.key_runs.append(run)
+
+    def _key_table(self) -> tuple:
+        # One sorted run, for saving
+        while len(self.key_runs) > 1:
+            run = self.key_runs.pop()
+            self.key_runs.append(_merge_runs(self.key_runs.pop(), run))
+        return self.key_runs[0] if self.key_runs else (np.empty(0, np.int64), np.empty(0, np.int64))
+
+    def high_water(self):
+        """
+        Latest recorded approach date, or None if the history is empty.
+        """
+        return pd.Timestamp(np.datetime64(int(self.objects["last_day"].max()), "D")).date() if len(self) else None
+
+    def _slots_for(self, ids: np.ndarray) -> np.ndarray:
+        unique, inverse = np.unique(ids, return_inverse=True)
+        new_ids = [i for i in unique.tolist() if i not in self.slots]
+        first, n = self._n_objects, len(new_ids)
+        self._objects = _reserve(self._objects, first, first + n)
+        if new_ids:
+            self.slots.update({object_id: first + i for i, object_id in enumerate(new_ids)})
+            fresh = {"id": np.asarray(new_ids, dtype=np.int64), "last_row": np.full(n, -1),
+                     "min_miss_km": np.full(n, np.inf), "first_day": np.full(n, np.iinfo(np.int64).max),
+                     "last_day": np.full(n, np.iinfo(np.int64).min), "min_miss_day": np.full(n, -1)}
+            for c, values in self._objects.items():
+                values[first:first + n] = fresh.get(c, 0)
+            self._n_objects += n
+        return np.array([self.slots[i] for i in unique.tolist()], dtype=np.int64)[inverse]
+
+    def add(self, df: pd.DataFrame) -> dict:
+        """
+        Record new approaches (rows need id, approach_date, miss_distance_km and
+        velocity_km_s) and fold them into the per-object aggregates.
+        """
+        df = df.dropna(subset=INPUT_COLUMNS)
+        ids = df["id"].to_numpy(np.int64)
+        days = pd.to_datetime(df["approach_date"]).to_numpy("datetime64[D]").astype(np.int64)
+        keys = _approach_keys(ids, days)
+
+        # Skip approaches already recorded, and repeats within the batch
+        _, first = np.unique(keys[::-1], return_index=True)
+        keep = np.zeros(len(keys), dtype=bool)
+        keep[len(keys) - 1 - first] = True
+        keep &= self._lookup(keys) < 0
+        n_duplicates = len(df) - int(keep.sum())
+        if not keep.any():
+            return {"inserted": 0, "duplicates": n_duplicates, "new_objects": 0, "reordered_objects": 0}
+
+        n_objects_before = self.n_objects
+        ids, days, keys = ids[keep], days[keep], keys[keep]
+        miss = df["miss_distance_km"].to_numpy(np.float64)[keep]
+        velocity = df["velocity_km_s"].to_numpy(np.float64)[keep]
+        slots = self._slots_for(ids)
+        order = np.lexsort((days, slots))
+        slots, days, keys, miss, velocity = slots[order], days[order], keys[order], miss[order], velocity[order]
+
+        obj = self.objects
+        count = obj["count"][slots]
+        # Objects receiving approaches older than their latest one are re-chained below
+        late = (count > 0) & (days < obj["last_day"][slots])
+
+        batch = pd.DataFrame({"slot": slots, "t": days.astype(np.float64), "miss": miss, "v": velocity})
+        batch["tt"], batch["tv"] = batch["t"] ** 2, batch["t"] * batch["v"]
+        groups = batch.groupby("slot", sort=False)
+        rank = groups.cumcount().to_numpy()
+        before = {c: (groups[c].cumsum() - batch[c]).to_numpy() for c in ["t", "v", "tt", "tv"]}
+        batch_min = groups["miss"].cummin().to_numpy()
+        prior_min = np.minimum(obj["min_miss_km"][slots],
+                               np.where(rank > 0, np.concatenate([[np.inf], batch_min[:-1]]), np.inf))
+        previous_day = np.where(rank > 0, np.concatenate([[0], days[:-1]]), obj["last_day"][slots])
+
+        first_row = len(self)
+        rows = np.arange(first_row, first_row + len(days), dtype=np.int64)
+        prior = count + rank
+        new = {
+            "slot": slots, "day": days, "miss_distance_km": miss, "velocity_km_s": velocity,
+            "prev": np.where(rank > 0, rows - 1, obj["last_row"][slots]),
+            "prior_approaches": prior.astype(np.float64),
+            "days_since_previous_approach": np.where(
+                prior > 0, np.minimum(days - previous_day, NO_HISTORY["days_since_previous_approach"]),
+                NO_HISTORY["days_since_previous_approach"]).astype(np.float64),
+            "prior_min_miss_distance_km": np.where(np.isinf(prior_min), NO_HISTORY["prior_min_miss_distance_km"],
+                                                   prior_min),
+            "velocity_trend_km_s_per_year": _trend(
+                prior, obj["sum_t"][slots] + before["t"], obj["sum_v"][slots] + before["v"],
+                obj["sum_tt"][slots] + before["tt"], obj["sum_tv"][slots] + before["tv"]),
+        }
+        self._approaches = _reserve(self._approaches, first_row, first_row + len(rows))
+        for c, values in self._approaches.items():
+            values[first_row:first_row + len(rows)] = new[c]
+        self._n_approaches += len(rows)
+        self._add_keys(keys, rows)
+
+        # Fold each object's batch rows into its aggregates
+        sums = groups[["t", "v", "tt", "tv"]].sum()
+        touched = sums.index.to_numpy(np.int64)
+        last = groups.tail(1).index.to_numpy()
+        lowest = groups["miss"].idxmin().to_numpy()
+        obj = self.objects
+        obj["count"][touched] += groups.size().to_numpy()
+        for c in ["t", "v", "tt", "tv"]:
+            obj[f"sum_{c}"][touched] += sums[c].to_numpy()
+        obj["first_day"][touched] = np.minimum(obj["first_day"][touched], groups["t"].min().to_numpy())
+        obj["last_day"][slots[last]] = days[last]
+        obj["last_row"][slots[last]] = rows[last]
+        closer = miss[lowest] < obj["min_miss_km"][slots[lowest]]
+        obj["min_miss_km"][slots[lowest[closer]]] = miss[lowest[closer]]
+        obj["min_miss_day"][slots[lowest[closer]]] = days[lowest[closer]]
+
+        reordered = np.unique(slots[late])
+        for slot in reordered:
+            self._rechain(int(slot))
+        return {"inserted": len(days), "duplicates": n_duplicates,
+                "new_objects": self.n_objects - n_objects_before, "reordered_objects": len(reordered)}
+
+    def _chain(self, slot: int) -> np.ndarray:
+        rows, row = [], int(self.objects["last_row"][slot])
+        prev = self.approaches["prev"]
+        while row >= 0:
+            rows.append(row)
+            row = int(prev[row])
+        return np.asarray(rows[::-1], dtype=np.int64)
+
+    def _rechain(self, slot: int):
+        """
+        Re-link one object's approaches in date order and recompute their point-in-time features.
+        """
+        # New rows are linked after the old chain, so the walk reaches all of them, just out of order
+        rows = self._chain(slot)
+        rows = rows[np.argsort(self.approaches["day"][rows], kind="stable")]
+        app = self.approaches
+        app["prev"][rows] = np.concatenate([[-1], rows[:-1]])
+        features = point_in_time_features(app["day"][rows], app["miss_distance_km"][rows], app["velocity_km_s"][rows])
+        for feature, values in features.items():
+            app[feature][rows] = values
+        self.objects["last_row"][slot] = rows[-1]
+        self.objects["last_day"][slot] = app["day"][rows[-1]]
+
+    def summary(self, object_id: int, as_of=None) -> dict:
+        """
+        Aggregates for one object, or None if it has no recorded approaches.
+        """
+        slot = self.slots.get(int(object_id))
+        if slot is None:
+            return None
+        obj = {c: values[slot] for c, values in self.objects.items()}
+        as_of = _day(as_of or date.today())
+
+        def to_date(day):
+            return pd.Timestamp(np.datetime64(int(day), "D")).date()
+
+        return {
+            "id": int(object_id),
+            "approaches": int(obj["count"]),
+            "first_approach": to_date(obj["first_day"]),
+            "last_approach": to_date(obj["last_day"]),
+            "days_since_last_approach": int(as_of - obj["last_day"]),
+            "min_miss_distance_km": float(obj["min_miss_km"]),
+            "min_miss_date": to_date(obj["min_miss_day"]),
+            "mean_velocity_km_s": float(obj["sum_v"] / obj["count"]),
+            "velocity_trend_km_s_per_year": float(_trend(obj["count"], obj["sum_t"], obj["sum_v"],
+                                                         obj["sum_tt"], obj["sum_tv"])),
+        }
+
+    def approaches_of(self, object_id: int) -> pd.DataFrame:
+        """
+        All recorded approaches of one object, oldest first, with their point-in-time features.
+        """
+        slot = self.slots.get(int(object_id))
+        rows = self._chain(slot) if slot is not None else np.empty(0, np.int64)
+        df = pd.DataFrame({c: self.approaches[c][rows] for c in APPROACH_COLUMNS if c not in ("slot", "prev")})
+        df.insert(0, "approach_date", df.pop("day").astype("datetime64[D]").astype("datetime64[s]"))
+        return df
+
+    def features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        HISTORY_FEATURES for rows with id and approach_date, aligned with df.index.
+
+        Recorded approaches get their stored point-in-time values. Other rows see
+        the object's recorded approaches before them (usually all of them, for
+        upcoming approaches), and unknown objects get NO_HISTORY.
+        """
+        ids = df["id"].to_numpy(np.int64)
+        days = pd.to_datetime(df["approach_date"]).to_numpy("datetime64[D]").astype(np.int64)
+        keys = _approach_keys(ids, days)
+        result = {feature: np.full(len(df), value, dtype=np.float64) for feature, value in NO_HISTORY.items()}
+
+        rows = self._lookup(keys)
+        found = rows >= 0
+        for feature in HISTORY_FEATURES:
+            result[feature][found] = self._approaches[feature][rows[found]]
+
+        slots = np.array([self.slots.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+        known = ~found & (slots >= 0)
+        if known.any():
+            obj = {c: values[slots[known]] for c, values in self.objects.items()}
+            result["prior_approaches"][known] = obj["count"]
+            result["days_since_previous_approach"][known] = np.clip(
+                days[known] - obj["last_day"], 0, NO_HISTORY["days_since_previous_approach"])
+            result["prior_min_miss_distance_km"][known] = obj["min_miss_km"]
+            result["velocity_trend_km_s_per_year"][known] = _trend(obj["count"], obj["sum_t"], obj["sum_v"],
+                                                                   obj["sum_tt"], obj["sum_tv"])
+            # Rows dated before the object's latest approach must not see the later ones
+            app = self.approaches
+            earlier = known.copy()
+            earlier[known] = days[known] < obj["last_day"]
+            for i in np.flatnonzero(earlier):
+                chain = self._chain(int(slots[i]))
+                chain = chain[app["day"][chain] < days[i]]
+                # Placeholders for the row itself, whose own values are never used
+                point = point_in_time_features(np.append(app["day"][chain], days[i]),
+                                               np.append(app["miss_distance_km"][chain], 0.0),
+                                               np.append(app["velocity_km_s"][chain], 0.0))
+                for feature, values in point.items():
+                    result[feature][i] = values[-1]
+        return pd.DataFrame(result, index=df.index)
+
+    def save(self, path: str = OBJECT_HISTORY_PATH):
+        os.makedirs(path, exist_ok=True)
+        keys, key_rows = self._key_table()
+        arrays = {**{f"object_{c}": v for c, v in self.objects.items()},
+                  **{f"approach_{c}": v for c, v in self.approaches.items()},
+                  "keys": keys, "key_rows": key_rows}
+        # Renamed into place, so processes that memory-mapped the old files keep reading them
+        for name, values in arrays.items():
+            with replacing(os.path.join(path, f"{name}.npy")) as tmp_path:
+                np.save(tmp_path, values)
+        # Written last: readers reload when history.json changes
+        with replacing(os.path.join(path, "history.json")) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"approaches": len(self), "objects": self.n_objects,
+                       "high_water": str(self.high_water())}, f, indent=2)
+        print(f"✅ Object history ({len(self):,} approaches of {self.n_objects:,} objects) saved to {path}")
+
+    @classmethod
+    def load(cls, path: str = OBJECT_HISTORY_PATH, mmap: bool = True) -> "ObjectHistory":
+        def array(name):
+            return np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None))
+
+        return cls({c: array(f"object_{c}") for c in OBJECT_COLUMNS},
+                   {c: array(f"approach_{c}") for c in APPROACH_COLUMNS},
+                   array("keys"), array("key_rows"))
+
+@lru_cache(maxsize=1)
+def load_default_history(path: str = OBJECT_HISTORY_PATH) -> ObjectHistory:
+    """
+    The saved history, loaded (memory-mapped) once per process.
+    """
+    if not os.path.exists(os.path.join(path, "history.json")):
+        raise FileNotFoundError(f"No object history at {path}; run src/object_history.py build")
+    return ObjectHistory.load(path)
+
+def build_object_history(raw_path: str) -> ObjectHistory:
+    """
+    Build the history from every approach in the raw dataset up to today.
+    """
+    history = ObjectHistory.empty()
+    history.add(read_dataset(raw_path, columns=INPUT_COLUMNS, filters=[("approach_date", "<=", date.today())]))
+    return history
+
+def update_object_history(history: ObjectHistory, raw_path: str, since) -> dict:
+    """
+    Add raw approaches from `since` up to today that are not recorded yet.
+    """
+    df = read_dataset(raw_path, columns=INPUT_COLUMNS,
+                      filters=[("approach_date", ">=", pd.Timestamp(since).date()),
+                               ("approach_date", "<=", date.today())])
+    return history.add(df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, update or query the per-object approach history.")
+    parser.add_argument("command", choices=["build", "update", "show"])
+    parser.add_argument("--raw", default=f"{DATA_PATH_RAW}/neo_data", help="Raw dataset directory")
+    parser.add_argument("--since", help="Add approaches from this date (default: a week before the high-water mark)")
+    parser.add_argument("--id", type=int, help="Object id to show")
+    parser.add_argument("--history", default=OBJECT_HISTORY_PATH)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        history = ObjectHistory.load(args.history)
+        summary = history.summary(args.id)
+        if summary is None:
+            raise SystemExit(f"No recorded approaches for object {args.id}")
+        for name, value in summary.items():
+            print(f"  {name:<30} {value}")
+        print(history.approaches_of(args.id).to_string(index=False))
+    else:
+        history = None
+        if args.command == "update" and os.path.exists(os.path.join(args.history, "history.json")):
+            history = ObjectHistory.load(args.history, mmap=False)
+            if not len(history) and not args.since:
+                # No high-water mark to update from
+                history = None
+        if history is None:
+            if not dataset_exists(args.raw):
+                raise SystemExit(f"No raw dataset at {args.raw}; run src/data_utils.py first")
+            history = build_object_history(args.raw)
+            history.save(args.history)
+        else:
+            since = args.since or (history.high_water() - timedelta(days=7))
+            stats = update_object_history(history, args.raw, since)
+            print(f"✅ {stats['inserted']:,} approaches added ({stats['new_objects']:,} new objects, "
+                  f"{stats['duplicates']:,} already recorded) since {since}")
+            if stats["inserted"]:
+                history.save(args.history)
@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from compiled_forest import CompiledForest, compile_forest
+from storage import replacing
+from feature_engineering import (FEATURES, HISTORY_FEATURES, NO_HISTORY, add_history_features,
+                                 calculate_average_diameter, calculate_kinetic_energy)
+
+PIPELINE_VERSION = 1
+PIPELINE_PATH = os.getenv("PIPELINE_PATH", "models/risk_pipeline.pkl")
+COMPILED_PIPELINE_PATH = os.getenv("COMPILED_PIPELINE_PATH", "models/risk_pipeline_compiled")
+
+# Upper bounds (exclusive) of each risk category, on the expm1 risk score scale
+RISK_THRESHOLDS = [
+    (1e-5, "🟢 Very Low"),
+    (1e-3, "🟡 Low"),
+    (1e-2, "🟠 Elevated"),
+]
+HIGHEST_RISK = "🔴 High"
+
+def interpret_risk(score):
+    for threshold, category in RISK_THRESHOLDS:
+        if score < threshold:
+            return category
+    return HIGHEST_RISK
+
+def interpret_risk_array(scores) -> np.ndarray:
+    """
+    Vectorized interpret_risk for an array of risk scores.
+    """
+    labels = np.array([category for _, category in RISK_THRESHOLDS] + [HIGHEST_RISK], dtype=object)
+    bins = np.searchsorted([t for t, _ in RISK_THRESHOLDS], np.asarray(scores), side="right")
+    return labels[bins]
+
+class RiskPipeline:
+    """
+    Feature derivation, fitted MinMaxScaler and trained forest as a single artifact.
+
+    Takes raw asteroid measurements (velocity_km_s, absolute_magnitude_h and either
+    avg_diameter_km or diameter_min_km/diameter_max_km) and returns the predicted
+    log risk score, so training and serving always share the same scaling.
+
+    When loaded from a compiled export, `model` is None and predictions go
+    through the memory-mapped CompiledForest in `predictor` instead.
+    """
+    def __init__(self, scaler, model, features: list = FEATURES, metadata: dict = None):
+        self.scaler = scaler
+        self.model = model
+        self.predictor = None
+        self.features = list(features)
+        self.scaled_features = [f + '_scaled' for f in self.features]
+        self.version = PIPELINE_VERSION
+        self.schema_hash = self._schema_hash()
+        self.metadata = {
+            "version": self.version,
+            "schema_hash": self.schema_hash,
+            "features": self.features,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **(metadata or {}),
+        }
+
+    def _schema_hash(self) -> str:
+        schema = {
+            "version": PIPELINE_VERSION,
+            "features": self.features,
+            "data_min": self.scaler.data_min_.tolist(),
+            "data_max": self.scaler.data_max_.tolist(),
+            "model": type(self.model).__name__,
+            "params": {k: repr(v) for k, v in sorted(self.model.get_params().items())},
+            "n_estimators": len(getattr(self.model, "estimators_", [])),
+        }
+        return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:16]
+
+    def feature_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Derive and scale model inputs for every row of `df`.
+
+        History features the pipeline uses but `df` lacks are looked up in the
+        saved object history by id and approach_date; rows without those (grids,
+        samples) are scored as unseen objects (NO_HISTORY).
+        """
+        if 'avg_diameter_km' not in df.columns:
+            df = df.assign(avg_diameter_km=calculate_average_diameter)
+        missing = [c for c in ['velocity_km_s', 'absolute_magnitude_h', 'avg_diameter_km'] if c not in df.columns]
+        if missing:
+            raise ValueError(f"Missing input columns for risk pipeline: {missing}")
+        df = df.assign(kinetic_energy=calculate_kinetic_energy)
+        missing_history = [f for f in self.features if f in HISTORY_FEATURES and f not in df.columns]
+        if missing_history:
+            if {'id', 'approach_date'} <= set(df.columns):
+                df = add_history_features(df)
+            else:
+                df = df.assign(**{f: NO_HISTORY[f] for f in missing_history})
+        X = df[self.features].to_numpy(dtype=np.float64)
+        return X * self.scaler.scale_ + self.scaler.min_
+
+    def predict_scaled(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict log risk from an already scaled feature matrix.
+        """
+        if getattr(self, "predictor", None) is not None:
+            return self.predictor.predict(X)
+        if hasattr(self.model, "feature_names_in_"):
+            X = pd.DataFrame(X, columns=self.scaled_features)
+        return self.model.predict(X)
+
+    def predict_log_risk(self, df: pd.DataFrame) -> np.ndarray:
+        return self.predict_scaled(self.feature_matrix(df))
+
+    def predict_one(self, velocity_km_s: float, absolute_magnitude_h: float, avg_diameter_km: float) -> float:
+        """
+        Log risk for one set of inputs; history features, if used, are those of an unseen object.
+        """
+        values = {
+            'velocity_km_s': velocity_km_s,
+            'absolute_magnitude_h': absolute_magnitude_h,
+            'avg_diameter_km': avg_diameter_km,
+            'kinetic_energy': (avg_diameter_km ** 3) * (velocity_km_s ** 2),
+            **NO_HISTORY,
+        }
+        x = np.array([[values[f] for f in self.features]]) * self.scaler.scale_ + self.scaler.min_
+        return float(self.predict_scaled(x)[0])
+
+    def feature_matrix_arrays(self, velocity_km_s, absolute_magnitude_h, avg_diameter_km) -> np.ndarray:
+        """
+        Scaled feature matrix for equal-length input arrays (or scalars), without a DataFrame.
+        History features, if used, are those of an unseen object (NO_HISTORY).
+        """
+        velocity_km_s = np.atleast_1d(np.asarray(velocity_km_s, dtype=np.float64))
+        avg_diameter_km = np.atleast_1d(np.asarray(avg_diameter_km, dtype=np.float64))
+        values = {
+            'velocity_km_s': velocity_km_s,
+            'absolute_magnitude_h': np.atleast_1d(np.asarray(absolute_magnitude_h, dtype=np.float64)),
+            'avg_diameter_km': avg_diameter_km,
+            'kinetic_energy': (avg_diameter_km ** 3) * (velocity_km_s ** 2),
+        }
+        values.update({f: np.full(len(velocity_km_s), NO_HISTORY[f]) for f in self.features if f in NO_HISTORY})
+        return np.column_stack([values[f] for f in self.features]) * self.scaler.scale_ + self.scaler.min_
+
+    def predict_arrays(self, velocity_km_s, absolute_magnitude_h, avg_diameter_km) -> np.ndarray:
+        """
+        Log risk for equal-length input arrays, without building a DataFrame.
+        """
+        return self.predict_scaled(self.feature_matrix_arrays(velocity_km_s, absolute_magnitude_h, avg_diameter_km))
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Predicted log risk, risk score and category for every row with complete inputs.
+        """
+        if 'avg_diameter_km' not in df.columns:
+            df = df.assign(avg_diameter_km=calculate_average_diameter)
+        df = df.dropna(subset=['velocity_km_s', 'absolute_magnitude_h', 'avg_diameter_km'])
+        log_risk = self.predict_log_risk(df) if len(df) else np.empty(0)
+        risk = np.expm1(log_risk)
+        return df.assign(
+            predicted_log_risk_score=log_risk,
+            predicted_risk_score=risk,
+            risk_category=interpret_risk_array(risk),
+        )
+
+def _json_default(value):
+    # numpy scalars from search results and metrics
+    return value.item() if hasattr(value, "item") else str(value)
+
+def save_pipeline(pipeline: RiskPipeline, path: str = PIPELINE_PATH):
+    """
+    Save the pipeline with joblib, plus its metadata as a JSON file next to it.
+    Both are written aside and renamed into place, the JSON last.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with replacing(path) as tmp_path:
+        joblib.dump(pipeline, tmp_path)
+    with replacing(os.path.splitext(path)[0] + ".json") as tmp_path, open(tmp_path, "w") as f:
+        json.dump(pipeline.metadata, f, indent=2, default=_json_default)
+    print(f"✅ Pipeline {pipeline.schema_hash} saved to {path}")
+
+def export_compiled(pipeline: RiskPipeline, path: str = COMPILED_PIPELINE_PATH) -> CompiledForest:
+    """
+    Export the pipeline with its forest flattened into NumPy node arrays.
+
+    The export holds the compiled forest, the fitted scaler and the metadata, but
+    not the sklearn forest, so it is much smaller than the joblib pipeline.
+    """
+    forest = compile_forest(pipeline.model)
+    forest.save(path, metadata={"schema_hash": pipeline.schema_hash})
+    with replacing(os.path.join(path, "scaler.pkl")) as tmp_path:
+        joblib.dump(pipeline.scaler, tmp_path)
+    # Written last: readers reload when pipeline.json changes
+    with replacing(os.path.join(path, "pipeline.json")) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(pipeline.metadata, f, indent=2, default=_json_default)
+    print(f"✅ Compiled pipeline {pipeline.schema_hash} ({forest.n_trees} trees, {forest.n_nodes:,} nodes) saved to {path}")
+    return forest
+
+def load_compiled(path: str = COMPILED_PIPELINE_PATH, mmap: bool = True) -> RiskPipeline:
+    with open(os.path.join(path, "pipeline.json")) as f:
+        metadata = json.load(f)
+    pipeline = RiskPipeline.__new__(RiskPipeline)
+    pipeline.scaler = joblib.load(os.path.join(path, "scaler.pkl"))
+    pipeline.model = None
+    pipeline.predictor = CompiledForest.load(path, mmap=mmap)
+    pipeline.features = metadata["features"]
+    pipeline.scaled_features = [f + '_scaled' for f in pipeline.features]
+    pipeline.version = metadata["version"]
+    pipeline.schema_hash = metadata["schema_hash"]
+    pipeline.metadata = metadata
+    return pipeline
+
+def load_pipeline(path: str = PIPELINE_PATH) -> RiskPipeline:
+    """
+    Load a saved pipeline: a joblib file, or a directory written by export_compiled.
+    """
+    pipeline = load_compiled(path) if os.path.isdir(path) else joblib.load(path)
+    if getattr(pipeline, "version", None) != PIPELINE_VERSION:
+        raise ValueError(
+            f"{path} is pipeline version {getattr(pipeline, 'version', None)}, expected {PIPELINE_VERSION}; retrain the model"
+        )
+    return pipeline
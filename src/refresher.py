@@ -0,0 +1,298 @@
+import os
+import time
+import argparse
+import threading
+import joblib
+import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple
+from dotenv import load_dotenv
+from instrumentation import REGISTRY, stage
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", f"{DATA_PATH_PROCESSED}/dashboard_snapshot.pkl")
+# How often the background thread rebuilds the snapshot, and how old a snapshot may
+# get before a reader triggers a rebuild itself (readers still get the old one meanwhile)
+REFRESH_INTERVAL_S = float(os.getenv("REFRESH_INTERVAL_S", "3600"))
+SNAPSHOT_TTL_S = float(os.getenv("SNAPSHOT_TTL_S", "900"))
+# After a failed load, callers get the failure (or the old value) until this many seconds pass
+CACHE_RETRY_S = float(os.getenv("CACHE_RETRY_S", "300"))
+# Opt in to pulling new NeoWs windows on each refresh (needs NASA_API_KEY); otherwise only rescore
+REFRESH_FETCH = os.getenv("REFRESH_FETCH", "0") == "1"
+REFRESH_DAYS_BACK = int(os.getenv("REFRESH_DAYS_BACK", "14"))
+# Upcoming days fetched too, for the closest-approach leaderboards
+REFRESH_DAYS_AHEAD = int(os.getenv("REFRESH_DAYS_AHEAD", "30"))
+LOOKAHEAD_DAYS = [7, 30, 90, 365]
+LEADERBOARD_SIZE = 10
+
+class TTLCache:
+    """
+    Thread-safe cache with per-entry TTL, single-flight loading and
+    stale-while-revalidate.
+
+    A fresh entry is returned as is. An expired entry is still returned, and one
+    background reload is started for it. Only a missing entry (or one older than
+    `max_stale_s`) blocks the caller, unless it passes `block=False` and takes
+    None instead. However many callers ask for the same key at once, its loader
+    runs once and the others wait for that result. A failed load is remembered
+    for `retry_s`: until then callers get the old value, None or the error
+    again instead of starting another load.
+    """
+    def __init__(self, ttl_s: float, max_stale_s: float = None, name: str = "cache",
+                 retry_s: float = CACHE_RETRY_S):
+        self.ttl_s = ttl_s
+        self.max_stale_s = max_stale_s
+        self.name = name
+        self.retry_s = retry_s
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.inflight = {}
+        # key -> (error, time of the failed load)
+        self.failures = {}
+
+    def _load(self, key, loader):
+        with self.lock:
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = {"done": threading.Event(), "error": None}
+        if not leader:
+            REGISTRY.increment("cache_requests", cache=self.name, result="coalesced")
+            flight["done"].wait()
+        else:
+            try:
+                value = loader()
+                with self.lock:
+                    self.entries[key] = (value, time.monotonic())
+                    self.failures.pop(key, None)
+            except Exception as e:
+                flight["error"] = e
+                with self.lock:
+                    self.failures[key] = (e, time.monotonic())
+                REGISTRY.increment("cache_load_errors", cache=self.name)
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+                flight["done"].set()
+        if flight["error"] is not None:
+            raise flight["error"]
+        with self.lock:
+            return self.entries[key][0]
+
+    def _revalidate(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            print(f"⚠️ Background reload of {self.name}[{key}] failed, still serving the old value: {e}")
+
+    def get(self, key, loader, block: bool = True):
+        with self.lock:
+            entry = self.entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < self.ttl_s:
+                REGISTRY.increment("cache_requests", cache=self.name, result="hit")
+                return entry[0]
+            serve_stale = entry is not None and (self.max_stale_s is None or age < self.max_stale_s)
+            failure = self.failures.get(key)
+            backing_off = failure is not None and time.monotonic() - failure[1] < self.retry_s
+            if (serve_stale or not block) and key not in self.inflight and not backing_off:
+                threading.Thread(target=self._revalidate, args=(key, loader), daemon=True).start()
+        if serve_stale:
+            REGISTRY.increment("cache_requests", cache=self.name, result="stale")
+            return entry[0]
+        if backing_off:
+            REGISTRY.increment("cache_requests", cache=self.name, result="failed")
+            if block:
+                raise failure[0]
+            return None
+        REGISTRY.increment("cache_requests", cache=self.name, result="miss")
+        return self._load(key, loader) if block else None
+
+    def put(self, key, value, age_s: float = 0.0):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() - age_s)
+
+    def refresh(self, key, loader):
+        """
+        Reload `key` now (joining a load already in flight) and return the new value.
+        """
+        return self._load(key, loader)
+
+class Snapshot(NamedTuple):
+    """
+    Precomputed dashboard data. Published as a whole and never modified afterwards,
+    so a page render that holds a reference always sees one consistent version.
+    """
+    created_at: str
+    high_water: object
+    model_hash: str
+    closest: dict
+    top_risk: pd.DataFrame
+    summary: dict
+    recent_scores: pd.DataFrame
+
+def build_snapshot(index, model_hash: str = None, recent_days: int = 30) -> Snapshot:
+    """
+    Leaderboards, summary stats and per-object scores from a CatalogIndex.
+    """
+    high_water = index.high_water()
+    # Upcoming approaches are in the index too; "recent" ends today at the latest
+    recent_end = min(high_water, date.today()) if high_water else None
+    recent = index.query(approach_date=(recent_end - timedelta(days=recent_days - 1), recent_end)) \
+        if high_water else index.frame([])
+    by_category = recent["risk_category"].value_counts().to_dict()
+    per_object = (recent.sort_values("predicted_log_risk_score", ascending=False)
+                  .drop_duplicates(subset=["id"]).reset_index(drop=True))
+    return Snapshot(
+        created_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        high_water=high_water,
+        model_hash=model_hash,
+        closest={days: index.closest(LEADERBOARD_SIZE, days=days) for days in LOOKAHEAD_DAYS},
+        top_risk=index.top_risk(LEADERBOARD_SIZE),
+        summary={
+            "approaches": len(index),
+            "recent_days": recent_days,
+            "recent_approaches": len(recent),
+            "recent_objects": len(per_object),
+            "recent_by_category": by_category,
+            "closest_recent_km": float(recent["miss_distance_km"].min()) if len(recent) else None,
+        },
+        recent_scores=per_object,
+    )
+
+def publish_snapshot(snapshot: Snapshot, path: str = SNAPSHOT_PATH):
+    """
+    Write the snapshot next to its final path and rename it into place, so readers
+    in other processes never see a partly written file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Stored as a plain dict so loading does not depend on the module that wrote it
+    joblib.dump(snapshot._asdict(), tmp_path)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str = SNAPSHOT_PATH):
+    return Snapshot(**joblib.load(path)) if os.path.exists(path) else None
+
+class Refresher:
+    """
+    Keeps a dashboard Snapshot up to date from a background thread.
+
+    Each refresh optionally fetches the newest NeoWs windows (the last
+    REFRESH_DAYS_BACK days and the next REFRESH_DAYS_AHEAD, so the closest-approach
+    leaderboards see upcoming passes), rescores them and the days since the catalog
+    index high-water mark with the current pipeline, saves the
+    index and publishes a new snapshot (in memory and on disk). Page renders call
+    `snapshot()`, which never waits on this work once a snapshot exists. The last
+    published snapshot is loaded from disk at start-up.
+    """
+    def __init__(self, interval_s: float = REFRESH_INTERVAL_S, ttl_s: float = SNAPSHOT_TTL_S,
+                 fetch: bool = REFRESH_FETCH, snapshot_path: str = SNAPSHOT_PATH):
+        self.interval_s = interval_s
+        self.fetch = fetch
+        self.snapshot_path = snapshot_path
+        self.cache = TTLCache(ttl_s, name="snapshot")
+        self.last_error = None
+        self.refreshes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        saved = load_snapshot(snapshot_path)
+        if saved is not None:
+            # Counted as expired, so it is served while the first refresh runs
+            self.cache.put("snapshot", saved, age_s=ttl_s)
+
+    def _refresh(self) -> Snapshot:
+        from catalog_index import CATALOG_INDEX_PATH, CatalogIndex, build_catalog_index, update_catalog_index
+        from pipeline import PIPELINE_PATH, load_pipeline
+
+        with stage("dashboard_refresh", fetch=self.fetch) as record:
+            if self.fetch:
+                from data_utils import fetch_past_data
+                try:
+                    fetch_past_data(days_back=REFRESH_DAYS_BACK, days_ahead=REFRESH_DAYS_AHEAD)
+                except Exception as e:
+                    # Keep serving from the data already on disk
+                    self.last_error = f"fetch: {e}"
+                    print(f"⚠️ NeoWs fetch failed during refresh: {e}")
+                # fetch_past_data extended the saved object history; rescoring should see it
+                from object_history import load_default_history
+                load_default_history.cache_clear()
+
+            pipeline = load_pipeline(PIPELINE_PATH)
+            if os.path.isdir(CATALOG_INDEX_PATH):
+                index = CatalogIndex.load(CATALOG_INDEX_PATH, mmap=False)
+                since = index.high_water() - timedelta(days=7) if len(index) else None
+                if since is not None and self.fetch:
+                    # Rescore everything the fetch may have revised, not only the newest week
+                    since = min(since, date.today() - timedelta(days=REFRESH_DAYS_BACK))
+            else:
+                index = None
+            if index is None or not len(index):
+                index = build_catalog_index(f"{DATA_PATH_PROCESSED}/neo_scores")
+                record["rows"] = len(index)
+            else:
+                # Rescores the whole catalog instead when the pipeline changed since the last refresh
+                stats = update_catalog_index(index, f"{DATA_PATH_RAW}/neo_data", pipeline, since)
+                record["rows"] = stats["inserted"] + stats["replaced"]
+                record["rescored_all"] = stats["rescored_all"]
+            index.save(CATALOG_INDEX_PATH)
+
+            # The model that scored the index (None right after a build from neo_scores)
+            snapshot = build_snapshot(index, model_hash=index.model_hash)
+            publish_snapshot(snapshot, self.snapshot_path)
+        self.refreshes += 1
+        return snapshot
+
+    def snapshot(self, block: bool = True):
+        """
+        The current snapshot. Only waits when none has been built yet; with
+        `block=False` that case returns None while a refresh runs in the background.
+        """
+        return self.cache.get("snapshot", self._refresh, block=block)
+
+    def refresh(self) -> Snapshot:
+        return self.cache.refresh("snapshot", self._refresh)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Dashboard refresh failed: {e}")
+            self._stop.wait(self.interval_s)
+
+    def start(self) -> "Refresher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dashboard-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the dashboard snapshot (once, or on a schedule).")
+    parser.add_argument("--loop", action="store_true", help="Keep refreshing every --interval seconds")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL_S)
+    parser.add_argument("--fetch", action="store_true", help="Pull new NeoWs windows first (default: REFRESH_FETCH)")
+    parser.add_argument("--no-fetch", action="store_true", help="Only rescore data already on disk")
+    args = parser.parse_args()
+
+    refresher = Refresher(interval_s=args.interval, fetch=(REFRESH_FETCH or args.fetch) and not args.no_fetch)
+    if args.loop:
+        refresher.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            refresher.stop()
+    else:
+        snapshot = refresher.refresh()
+        print(f"✅ Snapshot {snapshot.created_at} published to {SNAPSHOT_PATH} "
+              f"({snapshot.summary['approaches']:,} approaches, high-water {snapshot.high_water})")
@@ -0,0 +1,147 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from scipy.interpolate import RegularGridInterpolator
+from storage import replacing
+
+RISK_SURFACE_PATH = os.getenv("RISK_SURFACE_PATH", "models/risk_surface.npz")
+# Grid points along (velocity, magnitude, diameter)
+RISK_SURFACE_SHAPE = tuple(int(n) for n in os.getenv("RISK_SURFACE_SHAPE", "51,26,60").split(","))
+
+# Input ranges of the dashboard's Live Risk Prediction tab
+VELOCITY_RANGE_KMS = (0.0, 50.0)
+MAGNITUDE_RANGE = (10.0, 35.0)
+DIAMETER_RANGE_KM = (0.01, 2.0)
+
+class RiskSurface:
+    """
+    Precomputed log_risk_score over a 3-D grid of (velocity, magnitude, diameter).
+
+    Queries are answered by trilinear interpolation (diameter on a log10 axis,
+    since kinetic energy grows with its cube), so their cost does not depend on
+    the size of the forest. Repeated queries are memoized.
+    """
+    def __init__(self, velocity, magnitude, log_diameter, values, metadata: dict = None):
+        self.velocity = velocity
+        self.magnitude = magnitude
+        self.log_diameter = log_diameter
+        self.values = values
+        self.metadata = metadata or {}
+        self._interpolator = RegularGridInterpolator((velocity, magnitude, log_diameter), values)
+        self.query = lru_cache(maxsize=4096)(self._query)
+
+    def contains(self, velocity_km_s: float, absolute_magnitude_h: float, avg_diameter_km: float) -> bool:
+        return (
+            self.velocity[0] <= velocity_km_s <= self.velocity[-1]
+            and self.magnitude[0] <= absolute_magnitude_h <= self.magnitude[-1]
+            and avg_diameter_km > 0
+            and self.log_diameter[0] <= np.log10(avg_diameter_km) <= self.log_diameter[-1]
+        )
+
+    def _query(self, velocity_km_s: float, absolute_magnitude_h: float, avg_diameter_km: float):
+        """
+        Interpolated log risk and a corner-spread error estimate for one point inside the grid.
+
+        The estimate is the spread of the model's values at the corners of the grid
+        cell containing the point. It is not a bound, since the forest can vary more
+        inside a cell than between its corners; the error measured against the model
+        at build time is in `metadata`.
+        """
+        if not self.contains(velocity_km_s, absolute_magnitude_h, avg_diameter_km):
+            raise ValueError("Query point is outside the precomputed risk surface")
+        point = (velocity_km_s, absolute_magnitude_h, np.log10(avg_diameter_km))
+        log_risk = float(self._interpolator([point])[0])
+
+        axes = (self.velocity, self.magnitude, self.log_diameter)
+        upper = [min(max(int(np.searchsorted(axis, p)), 1), len(axis) - 1) for axis, p in zip(axes, point)]
+        cell = self.values[tuple(slice(i - 1, i + 1) for i in upper)]
+        return log_risk, float(cell.max() - cell.min())
+
+    def predict_many(self, velocity_km_s, absolute_magnitude_h, avg_diameter_km) -> np.ndarray:
+        """
+        Vectorized trilinear interpolation for arrays of points (not memoized).
+        Points outside the grid come back as NaN.
+        """
+        point = [np.asarray(velocity_km_s, dtype=np.float64), np.asarray(absolute_magnitude_h, dtype=np.float64),
+                 np.log10(np.asarray(avg_diameter_km, dtype=np.float64))]
+        axes = (self.velocity, self.magnitude, self.log_diameter)
+        inside = np.ones(point[0].shape, dtype=bool)
+        lower, weight = [], []
+        for axis, p in zip(axes, point):
+            inside &= (p >= axis[0]) & (p <= axis[-1])
+            i = np.clip(np.searchsorted(axis, p) - 1, 0, len(axis) - 2)
+            lower.append(i)
+            weight.append(np.clip((p - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0))
+
+        # Gather the 8 cell corners through flat offsets into the value grid
+        flat = self.values.ravel()
+        strides = np.array(self.values.strides) // self.values.itemsize
+        base = lower[0] * strides[0] + lower[1] * strides[1] + lower[2] * strides[2]
+        result = np.zeros(point[0].shape)
+        for corner in range(8):
+            bits = [(corner >> k) & 1 for k in range(3)]
+            w = weight[0] if bits[0] else 1.0 - weight[0]
+            w = w * (weight[1] if bits[1] else 1.0 - weight[1])
+            w *= weight[2] if bits[2] else 1.0 - weight[2]
+            result += w * flat[base + int(np.dot(bits, strides))]
+        result[~inside] = np.nan
+        return result
+
+    def save(self, path: str = RISK_SURFACE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with replacing(path) as tmp_path:
+            np.savez(tmp_path, velocity=self.velocity, magnitude=self.magnitude,
+                     log_diameter=self.log_diameter, values=self.values,
+                     metadata=json.dumps(self.metadata))
+        print(f"✅ Risk surface {self.values.shape} saved to {path}")
+
+    @classmethod
+    def load(cls, path: str = RISK_SURFACE_PATH) -> "RiskSurface":
+        with np.load(path) as data:
+            return cls(data["velocity"], data["magnitude"], data["log_diameter"],
+                       data["values"], json.loads(str(data["metadata"])))
+
+def build_risk_surface(pipeline, shape: tuple = RISK_SURFACE_SHAPE, n_validation: int = 2000,
+                       random_state: int = 42) -> RiskSurface:
+    """
+    Evaluate the pipeline on every grid point in one batched predict call.
+
+    The interpolation error is measured against the model on `n_validation`
+    random points inside the grid and stored in the surface metadata.
+    """
+    velocity = np.linspace(*VELOCITY_RANGE_KMS, shape[0])
+    magnitude = np.linspace(*MAGNITUDE_RANGE, shape[1])
+    log_diameter = np.linspace(*np.log10(DIAMETER_RANGE_KM), shape[2])
+
+    v, m, d = np.meshgrid(velocity, magnitude, log_diameter, indexing="ij")
+    grid = pd.DataFrame({
+        'velocity_km_s': v.ravel(),
+        'absolute_magnitude_h': m.ravel(),
+        'avg_diameter_km': 10 ** d.ravel(),
+    })
+    values = pipeline.predict_log_risk(grid).reshape(v.shape)
+
+    rng = np.random.default_rng(random_state)
+    sample = pd.DataFrame({
+        'velocity_km_s': rng.uniform(*VELOCITY_RANGE_KMS, n_validation),
+        'absolute_magnitude_h': rng.uniform(*MAGNITUDE_RANGE, n_validation),
+        'avg_diameter_km': 10 ** rng.uniform(*np.log10(DIAMETER_RANGE_KM), n_validation),
+    })
+    interpolator = RegularGridInterpolator((velocity, magnitude, log_diameter), values)
+    errors = np.abs(
+        interpolator(np.column_stack([sample['velocity_km_s'], sample['absolute_magnitude_h'],
+                                      np.log10(sample['avg_diameter_km'])]))
+        - pipeline.predict_log_risk(sample)
+    )
+
+    metadata = {
+        "schema_hash": pipeline.schema_hash,
+        "shape": list(values.shape),
+        "validation_points": n_validation,
+        "max_abs_error": float(errors.max()),
+        "p99_abs_error": float(np.percentile(errors, 99)),
+        "mean_abs_error": float(errors.mean()),
+    }
+    return RiskSurface(velocity, magnitude, log_diameter, values, metadata)
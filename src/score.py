@@ -0,0 +1,84 @@
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from pipeline import PIPELINE_PATH, load_pipeline
+from storage import iter_batches, write_dataset_batches
+from instrumentation import serve_metrics_from_env, stage
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", str(os.cpu_count() or 1)))
+SCORE_CHUNK_ROWS = int(os.getenv("SCORE_CHUNK_ROWS", "200000"))
+
+OUTPUT_COLUMNS = [
+    'id',
+    'name',
+    'approach_date',
+    'miss_distance_km',
+    'velocity_km_s',
+    'avg_diameter_km',
+    'predicted_log_risk_score',
+    'predicted_risk_score',
+    'risk_category'
+]
+
+# Loaded once per worker process by _init_worker
+_pipeline = None
+
+def _init_worker(pipeline_path: str):
+    global _pipeline
+    _pipeline = load_pipeline(pipeline_path)
+
+def _score_chunk(chunk):
+    scored = _pipeline.score(chunk)
+    return scored[[c for c in OUTPUT_COLUMNS if c in scored.columns]]
+
+def score_catalog(input_path: str, output_path: str, pipeline_path: str = PIPELINE_PATH,
+                  workers: int = SCORE_WORKERS, chunk_rows: int = SCORE_CHUNK_ROWS) -> int:
+    """
+    Score a whole NEO dataset with the saved pipeline and write the scores as a dataset.
+
+    Chunks of `chunk_rows` rows are streamed to a pool of `workers` processes, each
+    of which loads the pipeline once. At most 2 * workers chunks are in flight, and
+    results are written in input order. Returns the number of rows scored.
+    """
+    workers = max(1, workers)
+    chunks = iter_batches(input_path, batch_rows=chunk_rows)
+    rows = 0
+
+    def scored_chunks():
+        nonlocal rows
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(pipeline_path,)) as pool:
+            for chunk in chunks:
+                pending.append(pool.submit(_score_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                scored = pending.popleft().result()
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(pool.submit(_score_chunk, next_chunk))
+                rows += len(scored)
+                yield scored
+
+    with stage("score_catalog", workers=workers) as record:
+        write_dataset_batches((c for c in scored_chunks() if len(c)), output_path)
+        record["rows"] = rows
+    print(f"✅ Scored {rows:,} rows → {output_path}")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-score a NEO catalog with the saved risk pipeline.")
+    parser.add_argument("--input", default=f"{DATA_PATH_RAW}/neo_data", help="Input dataset directory")
+    parser.add_argument("--output", default=f"{DATA_PATH_PROCESSED}/neo_scores", help="Output dataset directory")
+    parser.add_argument("--pipeline", default=PIPELINE_PATH, help="Path to the saved pipeline")
+    parser.add_argument("--workers", type=int, default=SCORE_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=SCORE_CHUNK_ROWS)
+    args = parser.parse_args()
+    serve_metrics_from_env()
+    score_catalog(args.input, args.output, args.pipeline, args.workers, args.chunk_rows)
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pipeline import PIPELINE_PATH, interpret_risk_array, load_pipeline
+from instrumentation import REGISTRY
+
+load_dotenv()
+SCORING_HOST = os.getenv("SCORING_HOST", "127.0.0.1")
+SCORING_PORT = int(os.getenv("SCORING_PORT", "8600"))
+# A batch is predicted as soon as it holds SCORING_MAX_BATCH_ROWS rows, or
+# SCORING_MAX_WAIT_MS after its first request arrived, whichever comes first
+SCORING_MAX_BATCH_ROWS = int(os.getenv("SCORING_MAX_BATCH_ROWS", "4096"))
+SCORING_MAX_WAIT_MS = float(os.getenv("SCORING_MAX_WAIT_MS", "5"))
+# Rows waiting for a batch before new requests are turned away with 503 (a single
+# request with more rows than this can never be queued and gets 413)
+SCORING_MAX_QUEUE_ROWS = int(os.getenv("SCORING_MAX_QUEUE_ROWS", "100000"))
+# Larger request bodies are refused with 413
+SCORING_MAX_BODY_BYTES = int(os.getenv("SCORING_MAX_BODY_BYTES", str(16 * 2 ** 20)))
+INPUT_FIELDS = ['velocity_km_s', 'absolute_magnitude_h', 'avg_diameter_km']
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def parse_objects(objects: list) -> np.ndarray:
+    """
+    (n, 3) array of velocity, magnitude and average diameter from JSON objects.
+
+    Takes avg_diameter_km, or diameter_min_km and diameter_max_km as NeoWs gives them.
+    """
+    if not isinstance(objects, list) or not objects:
+        raise RequestError(400, "Expected a non-empty list of objects")
+    rows = np.empty((len(objects), 3))
+    for i, obj in enumerate(objects):
+        try:
+            if 'avg_diameter_km' not in obj:
+                obj = {**obj, 'avg_diameter_km': (float(obj['diameter_min_km']) + float(obj['diameter_max_km'])) / 2}
+            rows[i] = [float(obj[field]) for field in INPUT_FIELDS]
+        except (KeyError, TypeError, ValueError) as e:
+            raise RequestError(400, f"Object {i}: needs numeric {', '.join(INPUT_FIELDS)} "
+                                    f"(or diameter_min_km and diameter_max_km): {e!r}")
+    if not np.isfinite(rows).all():
+        raise RequestError(400, "Inputs must be finite numbers")
+    return rows
+
+def content_length(headers: dict) -> int:
+    value = headers.get("content-length", "0")
+    if not value.isdigit():
+        raise RequestError(400, f"Invalid Content-Length {value!r}")
+    length = int(value)
+    if length > SCORING_MAX_BODY_BYTES:
+        raise RequestError(413, f"Body larger than {SCORING_MAX_BODY_BYTES} bytes")
+    return length
+
+class MicroBatcher:
+    """
+    Coalesces concurrent scoring requests into one forest prediction.
+
+    Requests append their rows to a queue and wait on a future. A single batching
+    task takes everything queued once the batch is full or `max_wait_ms` has passed
+    since the oldest request, predicts it in one call on a worker thread (the event
+    loop keeps accepting requests meanwhile) and hands each request its slice.
+    """
+    def __init__(self, pipeline, max_batch_rows: int = SCORING_MAX_BATCH_ROWS,
+                 max_wait_ms: float = SCORING_MAX_WAIT_MS, max_queue_rows: int = SCORING_MAX_QUEUE_ROWS):
+        self.pipeline = pipeline
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_queue_rows = max_queue_rows
+        self.pending = deque()
+        self.queued_rows = 0
+        self.batches = 0
+        self._wakeup = None
+        self._task = None
+        # One thread: batches are predicted in order, never concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scoring")
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        self._executor.shutdown(wait=True)
+
+    async def score(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Log risk for each row, predicted together with whatever else is queued.
+        """
+        if len(rows) > self.max_queue_rows:
+            # Would never fit, so retrying cannot help: a client error, not backpressure
+            REGISTRY.increment("scoring_rejected", reason="too_many_rows")
+            raise RequestError(413, f"{len(rows):,} rows in one request; at most {self.max_queue_rows:,} are accepted")
+        if self.queued_rows + len(rows) > self.max_queue_rows:
+            REGISTRY.increment("scoring_rejected", reason="queue_full")
+            raise RequestError(503, f"Scoring queue is full ({self.queued_rows:,} rows waiting)")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((rows, future, time.perf_counter()))
+        self.queued_rows += len(rows)
+        self._wakeup.set()
+        return await future
+
+    def _take_batch(self) -> list:
+        batch, n = [], 0
+        while self.pending and (not batch or n + len(self.pending[0][0]) <= self.max_batch_rows):
+            item = self.pending.popleft()
+            batch.append(item)
+            n += len(item[0])
+        self.queued_rows -= n
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending:
+                # Give other requests until the oldest one has waited max_wait to join,
+                # but stop waiting as soon as the queue holds a full batch
+                while self.queued_rows < self.max_batch_rows:
+                    remaining = self.pending[0][2] + self.max_wait_s - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                REGISTRY.observe("scoring_queue_depth", self.queued_rows)
+                batch = self._take_batch()
+                rows = np.concatenate([item[0] for item in batch])
+                started = time.perf_counter()
+                try:
+                    log_risk = await loop.run_in_executor(self._executor, self.pipeline.predict_arrays,
+                                                          rows[:, 0], rows[:, 1], rows[:, 2])
+                except Exception as e:
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.batches += 1
+                REGISTRY.observe("scoring_batch_ms", (time.perf_counter() - started) * 1000)
+                REGISTRY.observe("scoring_batch_rows", len(rows))
+                offset = 0
+                for item_rows, future, queued_at in batch:
+                    REGISTRY.observe("scoring_queue_wait_ms", (started - queued_at) * 1000)
+                    if not future.done():
+                        future.set_result(log_risk[offset:offset + len(item_rows)])
+                    offset += len(item_rows)
+
+def results(log_risk: np.ndarray) -> list:
+    risk = np.expm1(log_risk)
+    return [
+        {"predicted_log_risk_score": float(lr), "predicted_risk_score": float(r), "risk_category": category}
+        for lr, r, category in zip(log_risk, risk, interpret_risk_array(risk))
+    ]
+
+class ScoringServer:
+    """
+    Local JSON scoring service: HTTP/1.1 with keep-alive on asyncio streams.
+
+    POST /score           one object -> one result
+    POST /score/batch     {"objects": [...]} (or a bare list) -> {"results": [...]}
+    GET  /stats           latency, batch size and queue depth percentiles as JSON
+    GET  /metrics         the same in Prometheus text format
+    GET  /health          model hash and uptime
+    """
+    def __init__(self, pipeline, host: str = SCORING_HOST, port: int = SCORING_PORT, **batching):
+        self.pipeline = pipeline
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(pipeline, **batching)
+        self.started_at = time.time()
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def stats(self) -> dict:
+        return {
+            "model": self.pipeline.schema_hash,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "queue_rows": self.batcher.queued_rows,
+            "queue_requests": len(self.batcher.pending),
+            "batches": self.batcher.batches,
+            "max_batch_rows": self.batcher.max_batch_rows,
+            "max_wait_ms": self.batcher.max_wait_s * 1000,
+            "request_ms": {endpoint: REGISTRY.percentiles("scoring_request_ms", endpoint=endpoint)
+                           for endpoint in ("score", "batch")},
+            "queue_wait_ms": REGISTRY.percentiles("scoring_queue_wait_ms"),
+            "batch_ms": REGISTRY.percentiles("scoring_batch_ms"),
+            "batch_rows": REGISTRY.percentiles("scoring_batch_rows"),
+            "queue_depth": REGISTRY.percentiles("scoring_queue_depth"),
+            "responses": {dict(labels)["status"]: n
+                          for labels, n in REGISTRY.counters_by_label("scoring_responses").items()},
+        }
+
+    async def _route(self, method: str, path: str, body: bytes):
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok", "model": self.pipeline.schema_hash,
+                         "uptime_s": round(time.time() - self.started_at, 1)}
+        if path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if path == "/metrics" and method == "GET":
+            return 200, REGISTRY.prometheus_text()
+        if path in ("/score", "/score/batch"):
+            if method != "POST":
+                raise RequestError(405, f"{path} only accepts POST")
+            try:
+                payload = json.loads(body)
+            except ValueError as e:
+                raise RequestError(400, f"Invalid JSON: {e}")
+            if path == "/score":
+                log_risk = await self.batcher.score(parse_objects([payload]))
+                return 200, results(log_risk)[0]
+            objects = payload.get("objects") if isinstance(payload, dict) else payload
+            log_risk = await self.batcher.score(parse_objects(objects))
+            return 200, {"results": results(log_risk)}
+        raise RequestError(404, f"Unknown path {path}")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                started = time.perf_counter()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                path = target.split("?")[0]
+                body = None
+                try:
+                    length = content_length(headers)
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._route(method, path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                    if body is None:
+                        # The body was not read, so the next request cannot be found on this connection
+                        keep_alive = False
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+
+                REGISTRY.increment("scoring_responses", status=status)
+                if path in ("/score", "/score/batch") and status == 200:
+                    REGISTRY.observe("scoring_request_ms", (time.perf_counter() - started) * 1000,
+                                     endpoint="score" if path == "/score" else "batch")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+async def serve(pipeline_path: str = PIPELINE_PATH, host: str = SCORING_HOST, port: int = SCORING_PORT, **batching):
+    pipeline = load_pipeline(pipeline_path)
+    server = await ScoringServer(pipeline, host, port, **batching).start()
+    print(f"🎯 Scoring with pipeline {pipeline.schema_hash} on {server.url} "
+          f"(batches of up to {server.batcher.max_batch_rows} rows, {server.batcher.max_wait_s * 1000:g} ms max wait)")
+    async with server.server:
+        await server.server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP scoring service with request micro-batching.")
+    parser.add_argument("--pipeline", default=PIPELINE_PATH, help="Path to the saved pipeline")
+    parser.add_argument("--host", default=SCORING_HOST)
+    parser.add_argument("--port", type=int, default=SCORING_PORT)
+    parser.add_argument("--max-batch-rows", type=int, default=SCORING_MAX_BATCH_ROWS)
+    parser.add_argument("--max-wait-ms", type=float, default=SCORING_MAX_WAIT_MS,
+                        help="How long the first request of a batch waits for others to join")
+    parser.add_argument("--max-queue-rows", type=int, default=SCORING_MAX_QUEUE_ROWS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.pipeline, args.host, args.port, max_batch_rows=args.max_batch_rows,
+                          max_wait_ms=args.max_wait_ms, max_queue_rows=args.max_queue_rows))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,170 @@
+import os
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+PARTITION_COLS = ["year", "month"]
+# Parquet has no dictionary-encoded booleans, so these are restored as categoricals on read
+CATEGORICAL_COLS = {"is_hazardous": [False, True]}
+
+@contextmanager
+def replacing(path: str):
+    """
+    Yield a temporary path next to `path` and rename it over `path` once the block
+    finishes. Readers never see a partly written file, and ones that memory-mapped
+    the old file keep reading it (it is unlinked, not truncated).
+    """
+    root, ext = os.path.splitext(path)
+    # Same extension, since np.save/np.savez append theirs otherwise
+    tmp_path = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _with_partitions(df: pd.DataFrame) -> pd.DataFrame:
+    dates = pd.to_datetime(df["approach_date"])
+    return df.assign(year=dates.dt.year.astype("int32"), month=dates.dt.month.astype("int32"))
+
+def dataset_exists(path: str) -> bool:
+    return os.path.isdir(path) and any(
+        name.endswith(".parquet") for _, _, files in os.walk(path) for name in files
+    )
+
+def _write_partitions(df: pd.DataFrame, path: str):
+    table = pa.Table.from_pandas(_with_partitions(df), preserve_index=False)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=PARTITION_COLS,
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+
+def write_dataset_batches(frames, path: str):
+    """
+    Write an iterable of DataFrame chunks as one partitioned dataset, replacing
+    anything already at `path`. Only one chunk is held in memory at a time.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+    first_table = pa.Table.from_pandas(_with_partitions(first), preserve_index=False)
+    schema = first_table.schema
+
+    def batches():
+        yield from first_table.to_batches()
+        for frame in frames:
+            table = pa.Table.from_pandas(_with_partitions(frame), schema=schema, preserve_index=False)
+            yield from table.to_batches()
+
+    ds.write_dataset(
+        batches(),
+        path,
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITION_COLS,
+        partitioning_flavor="hive",
+        existing_data_behavior="overwrite_or_ignore",
+        basename_template="part-{i}.parquet",
+    )
+    print(f"✅ Data saved to {path}")
+
+def write_dataset(df: pd.DataFrame, path: str):
+    """
+    Write a DataFrame as a Parquet dataset partitioned by approach_date year/month,
+    replacing anything already at `path`.
+    """
+    write_dataset_batches([df], path)
+
+def read_dataset(path: str, columns: list = None, filters=None) -> pd.DataFrame:
+    """
+    Read a partitioned Parquet dataset through memory-mapped Arrow.
+
+    Parameters:
+    - columns: optional list of columns to read (column projection)
+    - filters: optional predicate in pyarrow's DNF form, e.g.
+      [("year", "=", 2024), ("miss_distance_km", "<", 1e6)]. Filters on year/month
+      prune whole partitions; other columns are pushed down to row-group statistics.
+    """
+    table = pq.read_table(path, columns=columns, filters=filters,
+                          memory_map=True, partitioning="hive")
+    return _to_frame(table, drop_partitions=columns is None)
+
+def iter_batches(path: str, columns: list = None, filters=None, batch_rows: int = 1_000_000):
+    """
+    Stream a partitioned dataset as DataFrames of at most `batch_rows` rows.
+
+    Takes the same `columns` and `filters` as read_dataset, so chunks get the
+    same projection and pushdown without the whole dataset being loaded.
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive",
+                         filesystem=fs.LocalFileSystem(use_mmap=True))
+    expression = pq.filters_to_expression(filters) if filters else None
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_rows):
+        if batch.num_rows:
+            yield _to_frame(batch, drop_partitions=columns is None)
+
+def _to_frame(table, drop_partitions: bool) -> pd.DataFrame:
+    df = table.to_pandas(date_as_object=False)
+    for col, categories in CATEGORICAL_COLS.items():
+        if col in df.columns:
+            df[col] = pd.Categorical(df[col], categories=categories)
+    if drop_partitions:
+        df = df.drop(columns=[c for c in PARTITION_COLS if c in df.columns])
+    return df
+
+def upsert_dataset(df: pd.DataFrame, path: str, keys: list) -> pd.DataFrame:
+    """
+    Upsert rows into a partitioned dataset by `keys`, rewriting only touched partitions.
+
+    Rows in `df` replace existing rows with the same key. Returns the new contents
+    of the touched partitions.
+    """
+    new = _with_partitions(df)
+    touched = new[PARTITION_COLS].drop_duplicates().itertuples(index=False)
+    partition_filter = [[("year", "=", int(y)), ("month", "=", int(m))] for y, m in touched]
+
+    if dataset_exists(path) and partition_filter:
+        existing = read_dataset(path, filters=partition_filter)
+        merged = pd.concat([existing, df], ignore_index=True)
+    else:
+        merged = df
+    merged = merged.drop_duplicates(subset=keys, keep="last")
+    merged = merged.sort_values(["approach_date"] + [k for k in keys if k != "approach_date"],
+                                kind="stable").reset_index(drop=True)
+
+    os.makedirs(path, exist_ok=True)
+    _write_partitions(merged, path)
+    return merged
+
+def export_excel(path: str, excel_path: str, columns: list = None, filters=None):
+    """
+    Export a dataset (or a projection/filter of it) to a single Excel sheet.
+    """
+    df = read_dataset(path, columns=columns, filters=filters)
+    os.makedirs(os.path.dirname(excel_path) or ".", exist_ok=True)
+    df.to_excel(excel_path, index=False)
+    print(f"✅ Exported {len(df):,} rows to {excel_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a Parquet dataset to Excel.")
+    parser.add_argument("dataset", help="Path to the partitioned dataset directory")
+    parser.add_argument("excel_path", help="Output .xlsx path")
+    parser.add_argument("--columns", nargs="*", help="Columns to export")
+    args = parser.parse_args()
+    export_excel(args.dataset, args.excel_path, columns=args.columns)
@@ -0,0 +1,193 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from pipeline import HIGHEST_RISK, PIPELINE_PATH, RISK_THRESHOLDS, load_pipeline
+from instrumentation import serve_metrics_from_env, stage
+from storage import iter_batches, write_dataset_batches
+
+load_dotenv()
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+MC_SAMPLES = int(os.getenv("MC_SAMPLES", "1000"))
+# Upper bound on (objects x samples) evaluated at once; bounds memory to a few hundred MB
+MC_CHUNK_SAMPLES = int(os.getenv("MC_CHUNK_SAMPLES", "2000000"))
+PERCENTILES = (5, 50, 95)
+
+# NeoWs derives diameter_min/max from the magnitude with albedos 0.25 and 0.05,
+# so max/min is always sqrt(5); used to rebuild the range from an average diameter
+NEOWS_DIAMETER_RATIO = np.sqrt(0.25 / 0.05)
+
+def _exceedance_columns() -> dict:
+    """
+    One column per category threshold, for P(risk score >= threshold):
+    prob_low_or_higher, prob_elevated_or_higher, ..., and prob_high for the last.
+    """
+    categories = [category for _, category in RISK_THRESHOLDS] + [HIGHEST_RISK]
+    columns = {}
+    for i, (threshold, _) in enumerate(RISK_THRESHOLDS):
+        name = categories[i + 1].split(" ", 1)[1].lower().replace(" ", "_")
+        columns[threshold] = f"prob_{name}" if categories[i + 1] == HIGHEST_RISK else f"prob_{name}_or_higher"
+    return columns
+
+EXCEEDANCE_COLUMNS = _exceedance_columns()
+
+def diameter_range_from_average(avg_diameter_km):
+    """
+    (min, max) diameters whose mean is `avg_diameter_km`, with the NeoWs albedo spread.
+    """
+    diameter_min = 2 * np.asarray(avg_diameter_km, dtype=np.float64) / (1 + NEOWS_DIAMETER_RATIO)
+    return diameter_min, diameter_min * NEOWS_DIAMETER_RATIO
+
+def sample_inputs(rng, diameter_min, diameter_max, velocity, n_samples: int,
+                  diameter_dist: str = "loguniform", velocity_sigma: float = 0.0):
+    """
+    (n_objects, n_samples) arrays of sampled diameters and velocities.
+
+    Diameters are drawn between each object's min and max: log-uniform by default,
+    since the range comes from an albedo that is itself only known to a factor of 5.
+    Velocities get optional Gaussian noise with relative sigma `velocity_sigma`.
+    """
+    u = rng.random((len(diameter_min), n_samples))
+    low, high = diameter_min[:, None], diameter_max[:, None]
+    if diameter_dist == "loguniform":
+        diameters = low * (high / low) ** u
+    elif diameter_dist == "uniform":
+        diameters = low + (high - low) * u
+    else:
+        raise ValueError(f"Unknown diameter distribution: {diameter_dist}")
+    velocities = np.broadcast_to(velocity[:, None], diameters.shape)
+    if velocity_sigma:
+        velocities = np.maximum(velocities * (1 + velocity_sigma * rng.standard_normal(diameters.shape)), 0.0)
+    return diameters, velocities
+
+def predict_samples(pipeline, magnitude, diameters, velocities, surface=None) -> np.ndarray:
+    """
+    Log risk for every sample. With a risk surface, in-grid samples are interpolated
+    and only the rest go through the model.
+    """
+    magnitudes = np.broadcast_to(magnitude[:, None], diameters.shape)
+    if surface is None:
+        return pipeline.predict_arrays(velocities.ravel(), magnitudes.ravel(), diameters.ravel()).reshape(diameters.shape)
+    log_risk = surface.predict_many(velocities, magnitudes, diameters)
+    outside = np.isnan(log_risk)
+    if outside.any():
+        log_risk[outside] = pipeline.predict_arrays(velocities[outside], magnitudes[outside], diameters[outside])
+    return log_risk
+
+def score_uncertainty(df: pd.DataFrame, pipeline, surface=None, n_samples: int = MC_SAMPLES,
+                      percentiles=PERCENTILES, diameter_dist: str = "loguniform",
+                      velocity_sigma: float = 0.0, chunk_samples: int = MC_CHUNK_SAMPLES,
+                      seed: int = 0) -> pd.DataFrame:
+    """
+    Monte Carlo risk distribution for every row of `df`.
+
+    Needs velocity_km_s, absolute_magnitude_h and diameter_min_km/diameter_max_km
+    (or avg_diameter_km, spread with the NeoWs albedo range). Objects are processed
+    in blocks of at most `chunk_samples` samples in total (sample-tree pairs for a
+    compiled pipeline), all in NumPy. Adds the point predicted_risk_score,
+    risk_p{q} percentile columns (on the same scale) and the probability of
+    exceeding each risk category threshold.
+    """
+    if 'diameter_min_km' in df.columns and 'diameter_max_km' in df.columns:
+        diameter_min = df['diameter_min_km'].to_numpy(np.float64)
+        diameter_max = df['diameter_max_km'].to_numpy(np.float64)
+    else:
+        diameter_min, diameter_max = diameter_range_from_average(df['avg_diameter_km'].to_numpy(np.float64))
+    velocity = df['velocity_km_s'].to_numpy(np.float64)
+    magnitude = df['absolute_magnitude_h'].to_numpy(np.float64)
+    valid = ~(np.isnan(diameter_min) | np.isnan(diameter_max) | np.isnan(velocity) | np.isnan(magnitude)) \
+        & (diameter_min > 0)
+
+    n = len(df)
+    quantiles = np.full((n, len(percentiles)), np.nan)
+    exceedance = np.full((n, len(RISK_THRESHOLDS)), np.nan)
+    log_thresholds = np.log1p([threshold for threshold, _ in RISK_THRESHOLDS])
+    rng = np.random.default_rng(seed)
+
+    rows = np.flatnonzero(valid)
+    # A compiled forest traverses every (sample, tree) pair at once, so those are what the budget bounds
+    predictor = getattr(pipeline, "predictor", None)
+    budget = chunk_samples // predictor.n_trees if predictor is not None else chunk_samples
+    block = max(1, budget // n_samples)
+    for start in range(0, len(rows), block):
+        idx = rows[start:start + block]
+        diameters, velocities = sample_inputs(rng, diameter_min[idx], diameter_max[idx], velocity[idx],
+                                              n_samples, diameter_dist, velocity_sigma)
+        log_risk = predict_samples(pipeline, magnitude[idx], diameters, velocities, surface)
+        quantiles[idx] = np.percentile(log_risk, percentiles, axis=1).T
+        exceedance[idx] = (log_risk[:, :, None] >= log_thresholds).mean(axis=1)
+
+    point = np.full(n, np.nan)
+    if valid.any():
+        point[valid] = pipeline.predict_arrays(velocity[valid], magnitude[valid],
+                                               (diameter_min[valid] + diameter_max[valid]) / 2)
+    result = df.assign(predicted_risk_score=np.expm1(point),
+                       **{f"risk_p{q}": np.expm1(quantiles[:, i]) for i, q in enumerate(percentiles)})
+    return result.assign(**{EXCEEDANCE_COLUMNS[t]: exceedance[:, i] for i, (t, _) in enumerate(RISK_THRESHOLDS)})
+
+def load_matching_surface(pipeline, path: str):
+    """
+    The risk surface at `path` if it was built from this pipeline, else None.
+    """
+    from risk_surface import RiskSurface
+    if not path or not os.path.exists(path):
+        return None
+    surface = RiskSurface.load(path)
+    return surface if surface.metadata.get("schema_hash") == pipeline.schema_hash else None
+
+def score_uncertainty_catalog(input_path: str, output_path: str, pipeline, surface=None,
+                              n_samples: int = MC_SAMPLES, chunk_samples: int = MC_CHUNK_SAMPLES,
+                              seed: int = 0, **options) -> int:
+    """
+    Stream a raw NEO dataset through score_uncertainty and write the results as a
+    dataset. Returns the number of rows processed.
+    """
+    columns = ['id', 'name', 'approach_date', 'absolute_magnitude_h', 'diameter_min_km', 'diameter_max_km',
+               'velocity_km_s', 'miss_distance_km']
+    # Several sampling blocks per read keeps the parquet overhead per row low
+    chunks = iter_batches(input_path, columns=columns, batch_rows=max(1, chunk_samples // n_samples) * 16)
+    rows = 0
+
+    def scored_chunks():
+        nonlocal rows
+        for i, chunk in enumerate(chunks):
+            rows += len(chunk)
+            # A seed per chunk keeps chunks independent and the whole run reproducible
+            yield score_uncertainty(chunk, pipeline, surface, n_samples, chunk_samples=chunk_samples,
+                                    seed=seed + i, **options)
+
+    with stage("risk_uncertainty", samples=n_samples) as record:
+        write_dataset_batches(scored_chunks(), output_path)
+        record["rows"] = rows
+    print(f"✅ Risk distributions for {rows:,} rows → {output_path}")
+    return rows
+
+if __name__ == "__main__":
+    from risk_surface import RISK_SURFACE_PATH
+
+    parser = argparse.ArgumentParser(description="Monte Carlo risk percentiles and category probabilities for a catalog.")
+    parser.add_argument("--input", default=f"{DATA_PATH_RAW}/neo_data", help="Input dataset directory")
+    parser.add_argument("--output", default=f"{DATA_PATH_PROCESSED}/neo_risk_uncertainty", help="Output dataset directory")
+    parser.add_argument("--pipeline", default=PIPELINE_PATH, help="Path to the saved pipeline")
+    parser.add_argument("--samples", type=int, default=MC_SAMPLES, help="Samples per object")
+    parser.add_argument("--diameter-dist", choices=["loguniform", "uniform"], default="loguniform")
+    parser.add_argument("--velocity-sigma", type=float, default=0.0,
+                        help="Relative standard deviation of velocity noise (0 keeps velocity fixed)")
+    parser.add_argument("--surface", action="store_true",
+                        help="Interpolate samples from the risk surface: much faster, but too coarse "
+                             "near the category thresholds for exact probabilities")
+    parser.add_argument("--chunk-samples", type=int, default=MC_CHUNK_SAMPLES,
+                        help="Maximum objects x samples evaluated at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    serve_metrics_from_env()
+
+    pipeline = load_pipeline(args.pipeline)
+    surface = load_matching_surface(pipeline, RISK_SURFACE_PATH) if args.surface else None
+    if args.surface and surface is None:
+        print(f"⚠️ No risk surface for pipeline {pipeline.schema_hash} at {RISK_SURFACE_PATH}, using the model")
+    print(f"🎲 {args.samples:,} samples per object, scored with the {'risk surface' if surface else 'model'}")
+    score_uncertainty_catalog(args.input, args.output, pipeline, surface, args.samples, args.chunk_samples,
+                              args.seed, diameter_dist=args.diameter_dist, velocity_sigma=args.velocity_sigma)
@@ -0,0 +1,139 @@
+import os
+import copy
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from storage import read_dataset
+from feature_engineering import (SCALER_PATH, derive_risk_columns,
+                                 generate_risk_features_out_of_core)
+from pipeline import PIPELINE_PATH, RiskPipeline, load_pipeline
+from instrumentation import stage
+from model import MODEL_PATH, add_publish_arguments, build_parser, evaluate, publish_pipeline, train
+
+DATA_PATH_RAW = os.getenv("DATA_PATH_RAW")
+DATA_PATH_PROCESSED = os.getenv("DATA_PATH_PROCESSED")
+
+RAW_COLUMNS = ['id', 'approach_date', 'diameter_min_km', 'diameter_max_km', 'velocity_km_s',
+               'absolute_magnitude_h', 'miss_distance_km']
+
+def load_recent_data(path: str, since: date) -> pd.DataFrame:
+    """
+    Raw approaches after `since`, with derived columns and the log risk target.
+    """
+    df = read_dataset(path, columns=RAW_COLUMNS, filters=[("approach_date", ">", since)])
+    return derive_risk_columns(df)
+
+def drift_ratio(pipeline: RiskPipeline, X: np.ndarray, y: np.ndarray):
+    """
+    Held-out MAE of the current model on new data, relative to its training-time MAE.
+    """
+    mae = evaluate(pipeline.model, X, y)["mae"]
+    baseline = pipeline.metadata.get("mae")
+    return mae, (mae / baseline if baseline else np.inf)
+
+def add_trees(model, X: np.ndarray, y: np.ndarray, new_trees: int, retire: int = 0):
+    """
+    Grow `new_trees` trees on (X, y) next to the existing ones, then drop the
+    `retire` oldest. The other trees are kept as they are, so the cost is that
+    of fitting `new_trees` trees on the recent window only.
+    """
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + new_trees)
+    model.fit(X, y)
+    if retire:
+        retire = min(retire, len(model.estimators_) - new_trees)
+        model.estimators_ = model.estimators_[retire:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
+
+def full_retrain(args):
+    """
+    Regenerate features (refitting the scaler) and rerun the full search,
+    publishing to the same paths as the update would have.
+    """
+    scaler = generate_risk_features_out_of_core(
+        f"{DATA_PATH_RAW}/neo_data", f"{DATA_PATH_PROCESSED}/neo_features_for_risk_regression"
+    )
+    joblib.dump(scaler, SCALER_PATH)
+    train(build_parser().parse_args(
+        ["--pipeline", args.pipeline, "--compiled", args.compiled, "--surface", args.surface]))
+
+def update(args):
+    pipeline = load_pipeline(args.pipeline)
+    if pipeline.model is None:
+        raise ValueError(f"{args.pipeline} is a compiled export without the sklearn forest; "
+                         f"pass the joblib pipeline (e.g. {PIPELINE_PATH}) and --compiled for the export")
+    watermark = pipeline.metadata.get("data_watermark")
+    if watermark is None:
+        raise ValueError(f"{args.pipeline} has no data_watermark; run src/model.py once first")
+    watermark = date.fromisoformat(watermark)
+
+    recent = load_recent_data(f"{DATA_PATH_RAW}/neo_data", watermark - timedelta(days=args.recent_days))
+    is_new = (recent['approach_date'] > pd.Timestamp(watermark)).to_numpy()
+    n_new = int(is_new.sum())
+    n_holdout = max(args.min_holdout_rows, int(round(args.holdout * n_new)))
+    if n_new < args.min_new_rows or n_holdout >= n_new:
+        print(f"✅ Model is up to date ({n_new} new rows since {watermark}; "
+              f"need {max(args.min_new_rows, n_holdout + 1)})")
+        return pipeline
+
+    X = pipeline.feature_matrix(recent)
+    y = recent['log_risk_score'].to_numpy()
+
+    # Hold out part of the new rows; they are never trained on in this update
+    rng = np.random.default_rng(args.random_state)
+    holdout = np.zeros(len(recent), dtype=bool)
+    holdout[rng.choice(np.flatnonzero(is_new), n_holdout, replace=False)] = True
+    mae, ratio = drift_ratio(pipeline, X[holdout], y[holdout])
+    print(f"🔍 Held-out MAE on {n_holdout} new rows: {mae:,.10f} ({ratio:.2f}x training MAE)")
+
+    if ratio > 1 + args.drift_threshold:
+        print(f"⚠️ Error degraded past {args.drift_threshold:.0%}, running a full retrain")
+        full_retrain(args)
+        return load_pipeline(args.pipeline)
+
+    # Grown on a copy, so a rejected update leaves the loaded model untouched
+    with stage("add_trees", rows=int((~holdout).sum()), new_trees=args.new_trees):
+        model = add_trees(copy.deepcopy(pipeline.model), X[~holdout], y[~holdout], args.new_trees, args.retire)
+    metrics = evaluate(model, X[holdout], y[holdout])
+    print(f"✅ Added {args.new_trees} trees on {(~holdout).sum()} recent rows, retired {args.retire}; "
+          f"held-out MAE {metrics['mae']:,.10f} (current model {mae:,.10f})")
+    if metrics['mae'] > mae:
+        print("⚠️ The update does not improve held-out MAE, keeping the current model "
+              "(a full retrain may be due)")
+        return pipeline
+
+    joblib.dump(model, MODEL_PATH)
+    updated = RiskPipeline(
+        scaler=pipeline.scaler,
+        model=model,
+        features=pipeline.features,
+        metadata={
+            **{k: v for k, v in pipeline.metadata.items()
+               if k not in ("version", "schema_hash", "features", "created_at")},
+            "data_watermark": pd.Timestamp(recent['approach_date'].max()).date().isoformat(),
+            "incremental_updates": pipeline.metadata.get("incremental_updates", 0) + 1,
+            "last_update": {"new_rows": int(is_new.sum()), "new_trees": args.new_trees,
+                            "retired_trees": args.retire, "drift_ratio": ratio, **metrics},
+        },
+    )
+    publish_pipeline(updated, X[holdout], args.pipeline, args.compiled, args.surface)
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update the risk model with newly fetched data instead of retraining it.")
+    add_publish_arguments(parser)
+    parser.add_argument("--new-trees", type=int, default=10, help="Trees grown on the recent window")
+    parser.add_argument("--retire", type=int, default=0, help="Oldest trees to drop after the update")
+    parser.add_argument("--recent-days", type=int, default=90,
+                        help="Days before the watermark also used to fit the new trees")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of new rows held out")
+    parser.add_argument("--min-holdout-rows", type=int, default=10,
+                        help="Held-out rows needed to judge the update")
+    parser.add_argument("--drift-threshold", type=float, default=0.25,
+                        help="Relative MAE increase on held-out new rows that triggers a full retrain")
+    parser.add_argument("--min-new-rows", type=int, default=50)
+    parser.add_argument("--random-state", type=int, default=42)
+    update(parser.parse_args())
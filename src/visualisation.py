@@ -1,7 +1,17 @@
 import os
 import matplotlib.pyplot as plt
 
-def plot_feature_importance(model, X, save_path: str = None):
+def _finish(save_path: str, show: bool, label: str):
+    if save_path:
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        plt.savefig(save_path)
+        print(f"📊 Saved {label} plot to: {save_path}")
+    if show:
+        plt.show()
+    else:
+        plt.close()
+
+def plot_feature_importance(model, X, save_path: str = None, show: bool = True):
     """
     Plots and optionally saves feature importances from a trained Random Forest model.
 
@@ -9,6 +19,7 @@ def plot_feature_importance(model, X, save_path: str = None):
     - model: trained RandomForestRegressor or RandomForestClassifier
     - X: DataFrame of input features (used during model training)
     - save_path: optional path to save the plot (e.g., "reports/figures/feature_importance_rf.png")
+    - show: open the plot in a window (set False for headless runs)
     """
     importances = model.feature_importances_
     features = X.columns
@@ -18,9 +29,37 @@ def plot_feature_importance(model, X, save_path: str = None):
     plt.xlabel("Feature Importance")
     plt.title("Random Forest Feature Importances")
     plt.tight_layout()
+    _finish(save_path, show, "feature importance")
 
-    if save_path:
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        plt.savefig(save_path)
-        print(f"📊 Saved feature importance plot to: {save_path}")
-    plt.show()
\ No newline at end of file
+def plot_permutation_importance(importance: dict, save_path: str = None, show: bool = False):
+    """
+    Plots permutation importance (from explain.permutation_importance) with its
+    spread over repeats, and optionally saves it. Headless unless `show` is set.
+    """
+    features = sorted(importance["features"], key=lambda f: importance["features"][f]["mean"])
+    means = [importance["features"][f]["mean"] for f in features]
+    stds = [importance["features"][f]["std"] for f in features]
+
+    plt.figure(figsize=(8, 5))
+    plt.barh(features, means, xerr=stds, color="skyblue")
+    plt.xlabel(f"Increase in {importance['metric'].upper()} (log risk) when shuffled")
+    plt.title(f"Permutation Importance ({importance['rows']:,} rows, {importance['n_repeats']} repeats)")
+    plt.tight_layout()
+    _finish(save_path, show, "permutation importance")
+
+def plot_attribution(explanation: dict, save_path: str = None, show: bool = False):
+    """
+    Plots how each feature moved one prediction away from the model's base value
+    (from explain.Explainer.explain_one), and optionally saves it.
+    """
+    features = list(explanation["contributions"])
+    values = [explanation["contributions"][f] for f in features]
+
+    plt.figure(figsize=(8, 4))
+    plt.barh(features, values, color=["tomato" if v > 0 else "seagreen" for v in values])
+    plt.axvline(0, color="grey", linewidth=0.8)
+    plt.xlabel(f"Contribution to log risk (base {explanation['bias']:.3e}, "
+               f"prediction {explanation['log_risk']:.3e})")
+    plt.title("Why This Score")
+    plt.tight_layout()
+    _finish(save_path, show, "attribution")
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+import joblib
+import numpy as np
+
+import feature_engineering
+import model
+import object_history
+from data_utils import flatten_neo_data
+from feed_server import SyntheticFeed
+from pipeline import COMPILED_PIPELINE_PATH, PIPELINE_PATH, load_pipeline
+from risk_surface import RISK_SURFACE_PATH, RiskSurface
+from storage import write_dataset
+
+def synthetic_approaches(n_days: int = 60):
+    # A 30-day object pool, so most objects come back several times
+    feed = SyntheticFeed(objects_per_day=100, pool_days=30)
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(n_days)]
+    return flatten_neo_data({"near_earth_objects": {str(day): feed.day(day) for day in days}})
+
+def test_train_and_publish_with_history_features(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(feature_engineering, "USE_HISTORY_FEATURES", True)
+    monkeypatch.setattr(model, "BUILD_RISK_SURFACE", True)
+    features = feature_engineering.FEATURES + feature_engineering.HISTORY_FEATURES
+    monkeypatch.setattr(model, "feature_cols", [f + '_scaled' for f in features])
+
+    raw = synthetic_approaches()
+    history = object_history.ObjectHistory.empty()
+    history.add(raw)
+    monkeypatch.setattr(object_history, "load_default_history", lambda: history)
+
+    df, scaler = feature_engineering.generate_risk_features(raw, return_scaler=True)
+    assert df['prior_approaches'].max() > 0
+    (tmp_path / "models").mkdir()
+    joblib.dump(scaler, feature_engineering.SCALER_PATH)
+    write_dataset(df, "features")
+
+    args = model.build_parser().parse_args(
+        ["--data-path", "features", "--n-candidates", "2", "--cv", "2", "--n-jobs", "1"])
+    model.train(args)
+
+    # Every artifact is published, including the surface built from id-less grid rows
+    pipeline = load_pipeline(PIPELINE_PATH)
+    assert pipeline.features == features
+    compiled = load_pipeline(COMPILED_PIPELINE_PATH)
+    assert RiskSurface.load(RISK_SURFACE_PATH).metadata["schema_hash"] == pipeline.schema_hash
+
+    # Known approaches are scored with their history, the same way by both artifacts
+    sample = raw.dropna().head(50)
+    np.testing.assert_allclose(compiled.predict_log_risk(sample), pipeline.predict_log_risk(sample))
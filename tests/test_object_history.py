@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from data_utils import flatten_neo_data
+from feature_engineering import HISTORY_FEATURES, NO_HISTORY
+from feed_server import SyntheticFeed
+from object_history import INPUT_COLUMNS, ObjectHistory
+
+def approaches(first_day: int, last_day: int) -> pd.DataFrame:
+    # A 10-day object pool, so objects come back every few days
+    feed = SyntheticFeed(objects_per_day=20, pool_days=10)
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(first_day, last_day)]
+    df = flatten_neo_data({"near_earth_objects": {str(day): feed.day(day) for day in days}})
+    return df.dropna(subset=INPUT_COLUMNS).reset_index(drop=True)
+
+def expected_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    HISTORY_FEATURES of each row computed directly from the strictly earlier
+    approaches of the same object.
+    """
+    df = df.assign(day=pd.to_datetime(df["approach_date"]).to_numpy("datetime64[D]").astype(np.int64),
+                   id=df["id"].astype(np.int64))
+    rows = []
+    for _, row in df.iterrows():
+        prior = df[(df["id"] == row["id"]) & (df["day"] < row["day"])]
+        expected = dict(NO_HISTORY)
+        if len(prior):
+            expected["prior_approaches"] = float(len(prior))
+            expected["days_since_previous_approach"] = float(row["day"] - prior["day"].max())
+            expected["prior_min_miss_distance_km"] = prior["miss_distance_km"].min()
+        if len(prior) >= 2:
+            slope = np.polyfit(prior["day"].astype(float), prior["velocity_km_s"], 1)[0]
+            expected["velocity_trend_km_s_per_year"] = slope * 365.25
+        rows.append(expected)
+    return pd.DataFrame(rows, index=df.index)[HISTORY_FEATURES]
+
+def test_features_only_see_earlier_approaches():
+    df = approaches(0, 30)
+    # Later days arrive first, so the earlier ones are added out of order
+    history = ObjectHistory.empty()
+    history.add(df[df["approach_date"] >= "2024-01-16"])
+    history.add(df[df["approach_date"] < "2024-01-16"])
+
+    expected = expected_features(df)
+    pd.testing.assert_frame_equal(history.features(df)[HISTORY_FEATURES], expected, rtol=1e-6)
+
+    # An approach that is not recorded sees only the recorded ones before it
+    missing = df["approach_date"] == "2024-01-15"
+    gappy = ObjectHistory.empty()
+    gappy.add(df[~missing])
+    pd.testing.assert_frame_equal(gappy.features(df[missing])[HISTORY_FEATURES], expected[missing], rtol=1e-6)
+
+def test_refetched_windows_are_deduplicated():
+    once = ObjectHistory.empty()
+    once.add(approaches(0, 30))
+
+    # Overlapping windows, as when the newest days are refetched on every run
+    history = ObjectHistory.empty()
+    first = history.add(approaches(0, 20))
+    second = history.add(approaches(15, 30))
+    assert first["duplicates"] == 0
+    assert second["duplicates"] == len(approaches(15, 20))
+    assert history.add(approaches(25, 30))["inserted"] == 0
+
+    assert len(history) == len(once)
+    assert history.n_objects == once.n_objects
+    df = approaches(0, 30)
+    pd.testing.assert_frame_equal(history.features(df), once.features(df))
+
+def test_save_and_load_round_trip(tmp_path):
+    df = approaches(0, 20)
+    history = ObjectHistory.empty()
+    history.add(df)
+    history.save(str(tmp_path))
+
+    loaded = ObjectHistory.load(str(tmp_path))
+    assert len(loaded) == len(history) and loaded.n_objects == history.n_objects
+    assert loaded.high_water() == history.high_water()
+    for c, values in history.approaches.items():
+        np.testing.assert_array_equal(loaded.approaches[c], values)
+    pd.testing.assert_frame_equal(loaded.features(df), history.features(df))
+    object_id = int(df["id"].iloc[0])
+    assert loaded.summary(object_id) == history.summary(object_id)
+
+    # Memory-mapped buffers are copied on the first write, and saving over the
+    # files leaves a process that still maps the old ones reading the old values
+    before = loaded.features(df)
+    loaded.add(approaches(20, 30))
+    loaded.save(str(tmp_path))
+    pd.testing.assert_frame_equal(ObjectHistory.load(str(tmp_path)).features(df), before)
+    mapped = ObjectHistory.load(str(tmp_path))
+    grown = ObjectHistory.empty()
+    grown.add(approaches(10, 40))
+    grown.save(str(tmp_path))
+    pd.testing.assert_frame_equal(mapped.features(df), before)
+    assert len(ObjectHistory.load(str(tmp_path))) == len(grown)
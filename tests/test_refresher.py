@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+from refresher import TTLCache
+
+def test_failed_loads_are_not_retried_until_retry_interval():
+    calls = []
+
+    def failing():
+        calls.append(time.monotonic())
+        raise RuntimeError("feed down")
+
+    cache = TTLCache(ttl_s=60, name="test", retry_s=0.3)
+    assert cache.get("snapshot", failing, block=False) is None
+    while "snapshot" not in cache.failures:
+        time.sleep(0.01)
+
+    # Reruns inside the retry interval neither start loads nor wait
+    for _ in range(5):
+        assert cache.get("snapshot", failing, block=False) is None
+    with pytest.raises(RuntimeError, match="feed down"):
+        cache.get("snapshot", failing)
+    assert len(calls) == 1
+
+    time.sleep(0.3)
+    assert cache.get("snapshot", lambda: "fresh") == "fresh"
+    assert cache.get("snapshot", failing) == "fresh"
+    assert len(calls) == 1